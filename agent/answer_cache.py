@@ -0,0 +1,201 @@
+from __future__ import annotations
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List
+import numpy as np
+from agent.state import AgentState
+from agent.nodes import route_selector
+from rag.service import get_registry
+
+logger = logging.getLogger(__name__)
+
+# косинус между вопросами, начиная с которого считаем их одним и тем же вопросом
+ANSWER_CACHE_THRESHOLD: float = 0.95
+ANSWER_CACHE_SIZE: int = 2048
+# ответы только по базе знаний живут долго; ответы с данными API - недолго, пока данные не поменялись
+ANSWER_CACHE_TTL: float = 24 * 3600.0
+ANSWER_CACHE_DATA_TTL: float = 15 * 60.0
+
+_NUMBER_RE = re.compile(r'\d+')
+
+
+def answer_slots(state: AgentState) -> tuple:
+    # вопросы с разными ИНН/годами/ролью/статусами/маршрутом - разные вопросы, как бы ни были похожи тексты;
+    # числа из текста тоже в ключе: эмбеддинги "223-ФЗ" и "44-ФЗ" почти совпадают, а ответы разные
+    return (
+        tuple(sorted(set(_NUMBER_RE.findall(state.user_message)))),
+        state.subject_inn,
+        tuple(sorted(state.years or [])),
+        state.role,
+        tuple(sorted(state.statuses or [])),
+        state.route,
+    )
+
+
+@dataclass
+class _Entry:
+    slots: tuple
+    vector: np.ndarray
+    answer: str
+    stored_at: float
+    ttl: float
+    data_version: Hashable = None
+
+
+class SemanticAnswerCache:
+    # Кэш финальных ответов агента: поиск среди ответов с теми же слотами по косинусу эмбеддингов вопроса.
+    # Всё содержимое сбрасывается, как только меняется версия индекса базы знаний. Версия данных API известна
+    # только после запроса к API, то есть уже после lookup: её хранит каждый ответ, и новый ответ с другой
+    # версией данных сбрасывает ответы с теми же слотами, посчитанные по старым данным.
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        max_size: int = ANSWER_CACHE_SIZE,
+    ) -> None:
+        self.threshold = threshold
+        self.max_size = max(1, int(max_size))
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._by_slots: Dict[tuple, List[int]] = {}
+        self._version: Hashable = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_slots.clear()
+
+    def _check_version(self, version: Hashable) -> None:
+        if version != self._version:
+            self._entries.clear()
+            self._by_slots.clear()
+            self._version = version
+
+    def _drop(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        ids = self._by_slots[entry.slots]
+        ids.remove(entry_id)
+        if not ids:
+            del self._by_slots[entry.slots]
+
+    def lookup(self, vector: np.ndarray, slots: tuple, version: Hashable) -> str | None:
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+
+            for entry_id in [i for i in self._by_slots.get(slots, []) if now - self._entries[i].stored_at > self._entries[i].ttl]:
+                self._drop(entry_id)
+
+            ids = self._by_slots.get(slots)
+            if not ids:
+                self.misses += 1
+                return None
+
+            sims = np.stack([self._entries[i].vector for i in ids]) @ vector
+            best = int(np.argmax(sims))
+            if float(sims[best]) < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return self._entries[entry_id].answer
+
+    def store(
+        self,
+        vector: np.ndarray,
+        slots: tuple,
+        version: Hashable,
+        answer: str,
+        ttl: float,
+        data_version: Hashable = None,
+    ) -> None:
+        with self._lock:
+            self._check_version(version)
+            if data_version is not None:
+                for entry_id in [i for i in self._by_slots.get(slots, []) if self._entries[i].data_version != data_version]:
+                    self._drop(entry_id)
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(
+                slots=slots,
+                vector=np.asarray(vector, dtype=np.float32),
+                answer=answer,
+                stored_at=time.time(),
+                ttl=ttl,
+                data_version=data_version,
+            )
+            self._by_slots.setdefault(slots, []).append(entry_id)
+
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+_answer_cache = SemanticAnswerCache()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    return _answer_cache
+
+
+# Узлы графа: lookup_answer после route (слоты и маршрут уже разобраны), store_answer после generate_answer.
+# state.data_version ставит api_call_contracts; до следующего запроса к API свежесть данных ограничивает ANSWER_CACHE_DATA_TTL.
+def lookup_answer(state: AgentState) -> AgentState:
+    state.answer_cached = False
+    if state.route == 'clarify':
+        return state
+
+    registry = get_registry()
+    try:
+        vector = registry.get().embed_query(state.user_message)
+    except Exception:
+        logger.warning('Кэш ответов пропущен: не удалось получить эмбеддинг вопроса', exc_info=True)
+        return state
+
+    state.question_vector = vector
+    state.answer_cache_version = registry.version
+    cached = _answer_cache.lookup(vector, answer_slots(state), state.answer_cache_version)
+    if cached is not None:
+        state.answer = cached
+        state.answer_cached = True
+    return state
+
+
+def cached_selector(state: AgentState) -> str:
+    return 'cached' if state.answer_cached else route_selector(state)
+
+
+def store_answer(state: AgentState) -> AgentState:
+    if state.answer_cached or state.question_vector is None or not state.answer:
+        return state
+
+    ttl = ANSWER_CACHE_TTL if state.route == 'rag' else ANSWER_CACHE_DATA_TTL
+    _answer_cache.store(
+        state.question_vector,
+        answer_slots(state),
+        state.answer_cache_version,
+        state.answer,
+        ttl=ttl,
+        data_version=state.data_version,
+    )
+    return state
@@ -1,6 +1,7 @@
 from __future__ import annotations
 from typing import Any
 from langgraph.graph import END, StateGraph
+from agent.answer_cache import cached_selector, lookup_answer, store_answer
 from agent.state import AgentState
 from agent.nodes import (
     api_call_contracts,
@@ -25,12 +26,17 @@ def build_graph() -> Any:
     g.add_node('compute_metrics', compute_metrics)
     g.add_node('retrieve_kb', retrieve_kb)
     g.add_node('generate_answer', generate_answer)
+    g.add_node('lookup_answer', lookup_answer)
+    g.add_node('store_answer', store_answer)
     g.set_entry_point('parse_query')
     g.add_edge('parse_query', 'route')
+    # похожий вопрос с теми же слотами уже отвечен - отдаём ответ из кэша, не ходя в API и базу знаний
+    g.add_edge('route', 'lookup_answer')
     g.add_conditional_edges(
-        'route',
-        route_selector,
+        'lookup_answer',
+        cached_selector,
         {
+            'cached': END,
             'clarify': 'clarify',
             'api': 'api_call_contracts',
             'rag': 'retrieve_kb',
@@ -51,6 +57,7 @@ def build_graph() -> Any:
         },
     )
     g.add_edge('retrieve_kb', 'generate_answer')
-    g.add_edge('generate_answer', END)
+    g.add_edge('generate_answer', 'store_answer')
+    g.add_edge('store_answer', END)
 
     return g.compile()
@@ -1,4 +1,6 @@
 from __future__ import annotations
+import hashlib
+import json
 import re
 from agent.state import AgentState
 from rag.service import get_retriever
@@ -6,6 +8,10 @@ from rag.service import get_retriever
 
 _INN_RE = re.compile(r'\b\d{10}\b|\b\d{12}\b')
 _YEAR_RE = re.compile(r'\b(20\d{2})\b', re.IGNORECASE)
+_LAW_RE = re.compile(r'\b(44|223)\s*-?\s*фз\b', re.IGNORECASE)
+# закон из вопроса -> topic базы знаний; противоположная роль/закон исключаются из поиска
+_LAW_TOPICS = {'44fz': 'law_44fz', '223fz': 'law_223fz'}
+_OTHER_ROLE = {'customer': 'supplier', 'supplier': 'customer'}
 
 
 def _parse_inn(text: str) -> str | None:
@@ -46,6 +52,12 @@ def _parse_statuses(text: str) -> list[str]:
     return statuses
 
 
+def _parse_law(text: str) -> str | None:
+    laws = {f'{m}fz' for m in _LAW_RE.findall(text)}
+    # оба закона (сравнение) - не фильтруем
+    return laws.pop() if len(laws) == 1 else None
+
+
 def parse_query(state: AgentState) -> AgentState:
     text = state.user_message.strip()
 
@@ -53,6 +65,7 @@ def parse_query(state: AgentState) -> AgentState:
     state.years = _parse_years(text)
     state.role = _parse_role(text)
     state.statuses = _parse_statuses(text)
+    state.law = _parse_law(text)
 
     return state
 
@@ -113,9 +126,16 @@ def clarify(state: AgentState) -> AgentState:
     return state
 
 
+def api_data_version(api_raw: dict | None) -> str:
+    # версия данных для кэша ответов: хэш ответа API (поменялся ответ - поменялась и версия)
+    payload = json.dumps(api_raw, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
 def api_call_contracts(state: AgentState) -> AgentState:
     # Заглушка: тут будет DamiaClient.get_contracts(...)
     state.api_raw = {}
+    state.data_version = api_data_version(state.api_raw)
     return state
 
 
@@ -131,21 +151,38 @@ def compute_metrics(state: AgentState) -> AgentState:
     return state
 
 
+def kb_filter(state: AgentState) -> dict | None:
+    # фильтр по metadata chunks из слотов вопроса: только исключения (chunks чужой роли, другого закона),
+    # общие chunks без role/topic остаются в выдаче
+    where: dict = {}
+    if state.role in _OTHER_ROLE:
+        where['role'] = {'not': _OTHER_ROLE[state.role]}
+    if state.law in _LAW_TOPICS:
+        where['topic'] = {'not': [t for law, t in _LAW_TOPICS.items() if law != state.law]}
+    return where or None
+
+
 def retrieve_kb(state: AgentState) -> AgentState:
     retriever = get_retriever()
 
-    hits = retriever.retrieve(state.user_message, top_k=6)
+    # один поиск: те же chunks и в rag_hits, и в контексте для модели
+    where = kb_filter(state)
+    ctx = retriever.build_context(state.user_message, top_k=6, where=where)
+    if where and not ctx.hits:
+        # фильтр отсёк всё - лучше общий контекст, чем пустой
+        ctx = retriever.build_context(state.user_message, top_k=6)
     state.rag_hits = [
         {
             'chunk_id': h.chunk_id,
             'score': h.score,
+            'rrf_score': h.rrf_score,
             'text': h.text,
             'metadata': h.metadata,
         }
-        for h in hits
+        for h in ctx.hits
     ]
 
-    state.rag_context = retriever.retrieve_context(state.user_message, top_k=6)
+    state.rag_context = ctx.context
     return state
 
 
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Hashable
 
 
 @dataclass
@@ -10,6 +10,7 @@ class AgentState:
     years: list[int] = None
     statuses: list[str] = None
     role: str | None = None
+    law: str | None = None
     route: str | None = None
     clarification_question: str | None = None
     api_raw: dict[str, Any] | None = None
@@ -17,3 +18,8 @@ class AgentState:
     metrics: dict[str, Any] | None = None
     rag_context: str | None = None
     answer: str | None = None
+    # кэш ответов: версия данных API (ставит api_call_contracts), эмбеддинг вопроса, версия кэша и признак ответа из кэша
+    data_version: Hashable = None
+    question_vector: Any = None
+    answer_cache_version: Hashable = None
+    answer_cached: bool = False
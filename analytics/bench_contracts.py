@@ -0,0 +1,196 @@
+from __future__ import annotations
+import argparse
+import datetime as dt
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+from analytics.metrics_contracts import (
+    by_status,
+    by_year,
+    coerce_numeric_columns,
+    compute_contracts_metrics,
+    filter_records,
+    parse_float_column,
+    parse_int_column,
+    reg_numbers_sample,
+    summary_totals,
+    top_counterparties,
+    unique_reg_numbers,
+    year_status,
+)
+from analytics.normalize_contracts import normalize_contracts_format1
+from analytics.portfolio_contracts import compute_portfolio_metrics
+from analytics.reg_numbers import RegNumberPool
+from analytics.synthetic_contracts import SYNTHETIC_STATUSES, generate_contracts_format1
+from analytics.whatif_contracts import compute_contracts_metrics_batch
+
+DEFAULT_SCALES: List[int] = [1_000, 10_000, 100_000]
+
+
+def _git_revision() -> str | None:
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10)
+    except Exception:
+        return None
+    return out.stdout.strip() or None
+
+
+def _measure(fn: Callable[[], Any], repeat: int, memory: bool) -> Dict[str, Any]:
+    times: List[float] = []
+    for _ in range(max(1, repeat)):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+
+    peak_mb = None
+    if memory:
+        # отдельный прогон: tracemalloc сильно замедляет код и не должен влиять на время
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak_mb = round(peak / 2 ** 20, 3)
+
+    return {
+        'seconds_min': min(times),
+        'seconds_median': statistics.median(times),
+        'repeat': len(times),
+        'peak_mb': peak_mb,
+    }
+
+
+def bench_cases(raw: Dict[str, Any], records: List[Dict[str, Any]]) -> Dict[str, Callable[[], Any]]:
+    main_currency = 'RUB'
+    years = sorted({r['year'] for r in records if r.get('year') is not None})[-3:]
+    amounts = [r.get('amount') for r in records]
+    counts = [r.get('count') for r in records]
+    # amount/count разобраны заранее: метрики по такому списку колонки повторно не разбирают
+    numeric = coerce_numeric_columns(records)
+    whatif_specs = (
+        [{'years': [y]} for y in years]
+        + [{'statuses': [st]} for st in SYNTHETIC_STATUSES]
+        + [{'role': role} for role in ('customer', 'supplier')]
+        + [{'min_amount': lo, 'max_amount': hi} for lo, hi in ((0, 1e6), (1e6, 1e8), (1e8, None))]
+    )
+
+    return {
+        'normalize_contracts_format1': lambda: normalize_contracts_format1(raw),
+        'normalize_contracts_format1_interned': lambda: normalize_contracts_format1(raw, reg_pool=RegNumberPool()),
+        'parse_float_column': lambda: parse_float_column(amounts),
+        'parse_int_column': lambda: parse_int_column(counts),
+        'coerce_numeric_columns': lambda: coerce_numeric_columns(records),
+        'filter_records': lambda: filter_records(records, years=years, statuses=['Закупка завершена'], role='supplier'),
+        'filter_records_amount': lambda: filter_records(records, min_amount=1_000_000.0),
+        'summary_totals': lambda: summary_totals(records),
+        'by_year': lambda: by_year(records, main_currency),
+        'by_status': lambda: by_status(records, main_currency),
+        'year_status': lambda: year_status(records, main_currency),
+        'top_counterparties_customer': lambda: top_counterparties(records, 'customer', main_currency),
+        'top_counterparties_supplier': lambda: top_counterparties(records, 'supplier', main_currency),
+        'reg_numbers_sample': lambda: reg_numbers_sample(records),
+        'unique_reg_numbers_exact': lambda: unique_reg_numbers(records),
+        'unique_reg_numbers_approx': lambda: unique_reg_numbers(records, approximate=True),
+        'compute_contracts_metrics': lambda: compute_contracts_metrics(records),
+        'compute_contracts_metrics_coerced': lambda: compute_contracts_metrics(numeric),
+        'compute_portfolio_metrics': lambda: compute_portfolio_metrics(records),
+        'whatif_independent': lambda: [compute_contracts_metrics(records, spec) for spec in whatif_specs],
+        'whatif_batch': lambda: compute_contracts_metrics_batch(records, whatif_specs),
+    }
+
+
+def run_benchmarks(
+    scales: List[int],
+    *,
+    repeat: int = 3,
+    memory: bool = True,
+    seed: int = 0,
+    only: List[str] | None = None,
+) -> Dict[str, Any]:
+    results: List[Dict[str, Any]] = []
+
+    for scale in scales:
+        raw = generate_contracts_format1(scale, seed=seed)
+        records = normalize_contracts_format1(raw)
+
+        for name, fn in bench_cases(raw, records).items():
+            if only and name not in only:
+                continue
+            m = _measure(fn, repeat=repeat, memory=memory)
+            results.append({'case': name, 'scale': scale, 'rows': len(records), **m})
+            print(f'{name:<32} rows={len(records):>10} min={m["seconds_min"]:.4f}s peak={m["peak_mb"]}MB', file=sys.stderr)
+
+        del raw, records
+        gc.collect()
+
+    return {
+        'meta': {
+            'created_at': dt.datetime.now(dt.timezone.utc).isoformat(),
+            'git_revision': _git_revision(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare_reports(base: Dict[str, Any], new: Dict[str, Any], threshold: float = 1.1) -> List[Dict[str, Any]]:
+    base_idx = {(r['case'], r['scale']): r for r in base.get('results', [])}
+    out: List[Dict[str, Any]] = []
+
+    for r in new.get('results', []):
+        b = base_idx.get((r['case'], r['scale']))
+        if b is None or not b['seconds_min']:
+            continue
+        ratio = r['seconds_min'] / b['seconds_min']
+        out.append({
+            'case': r['case'],
+            'scale': r['scale'],
+            'base_seconds': b['seconds_min'],
+            'new_seconds': r['seconds_min'],
+            'ratio': ratio,
+            'regression': ratio > threshold,
+        })
+
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Бенчмарки нормализации и метрик по контрактам')
+    parser.add_argument('--scales', type=lambda s: [int(float(x)) for x in s.split(',')],
+                        default=DEFAULT_SCALES, help='размеры в строках, напр. 1e3,1e5,1e7')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='не замерять пиковую память')
+    parser.add_argument('--only', type=lambda s: s.split(','), default=None, help='список кейсов через запятую')
+    parser.add_argument('--out', default='bench_contracts.json')
+    parser.add_argument('--compare', default=None, help='JSON предыдущего прогона для сравнения')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.scales, repeat=args.repeat, memory=not args.no_memory, seed=args.seed, only=args.only)
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'OK: результаты сохранены в {args.out}')
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        for row in compare_reports(base, report):
+            mark = 'REGRESSION' if row['regression'] else ''
+            print(f'{row["case"]:<32} scale={row["scale"]:>10} x{row["ratio"]:.2f} {mark}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,12 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
+from analytics.reg_numbers import HyperLogLog, RegNumberPool, RegNumbers, is_reg_list
 Record = Dict[str, Any]
 
+# Пробелы (в т.ч. неразрывные) как разделители тысяч, запятая как десятичный разделитель
+_NUM_TRANS = str.maketrans({' ': None, '\xa0': None, '\u202f': None, ',': '.'})
+INVALID_SAMPLES_LIMIT: int = 20
+
+
 def to_float(x: Any) -> float:
     if x is None:
         return 0.0
@@ -12,7 +18,7 @@ def to_float(x: Any) -> float:
     if not s:
         return 0.0
 
-    s = s.replace(' ', '').replace(',', '.')
+    s = s.translate(_NUM_TRANS)
     try:
         return float(s)
     except Exception:
@@ -23,7 +29,7 @@ def to_int(x: Any) -> int:
         return 0
     if isinstance(x, int):
         return x
-    s = str(x).strip().replace(' ', '').replace(',', '.')
+    s = str(x).strip().translate(_NUM_TRANS)
     if not s:
         return 0
     try:
@@ -32,6 +38,105 @@ def to_int(x: Any) -> int:
         return 0
 
 
+def parse_float_column(values: List[Any]) -> Tuple[List[float], List[int]]:
+    out: List[float] = [0.0] * len(values)
+    invalid: List[int] = []
+    trans = _NUM_TRANS
+
+    for i, v in enumerate(values):
+        t = type(v)
+        if t is float or t is int:
+            out[i] = float(v)
+            continue
+        if v is None:
+            continue
+        if t is not str:
+            if isinstance(v, (int, float)):
+                out[i] = float(v)
+                continue
+            v = str(v)
+
+        s = v.strip()
+        if not s:
+            continue
+        try:
+            out[i] = float(s.translate(trans))
+        except ValueError:
+            invalid.append(i)
+
+    return out, invalid
+
+
+def parse_int_column(values: List[Any]) -> Tuple[List[int], List[int]]:
+    out: List[int] = [0] * len(values)
+    invalid: List[int] = []
+    trans = _NUM_TRANS
+
+    for i, v in enumerate(values):
+        t = type(v)
+        if t is int:
+            out[i] = v
+            continue
+        if v is None:
+            continue
+        if t is not str:
+            if isinstance(v, int):
+                out[i] = int(v)
+                continue
+            v = str(v)
+
+        s = v.strip()
+        if not s:
+            continue
+        try:
+            out[i] = int(s) if s.isdigit() else int(float(s.translate(trans)))
+        except (ValueError, OverflowError):
+            invalid.append(i)
+
+    return out, invalid
+
+
+class NumericRecords(list):
+    # Записи с уже разобранными amount/count и отчётом о нераспознанных значениях (invalid_numbers).
+    # Метрики, получив такой список, колонки повторно не разбирают.
+    invalid_numbers: Dict[str, Any]
+
+
+def coerce_numeric_columns(records: List[Record]) -> NumericRecords:
+    # Разбираем amount/count один раз на весь список: записи, где значение не число, копируются
+    # с подставленными числами, исходные dict не меняются. Дальше to_float/to_int во всех метриках
+    # идут по быстрому пути isinstance, а результат можно передавать в метрики повторно.
+    # Нераспознанные значения не трогаем (метрики по-прежнему считают их нулём) и возвращаем в отчёте.
+    if isinstance(records, NumericRecords):
+        return records
+
+    report: Dict[str, Any] = {}
+    columns = []
+    for field, parse, kind in (('amount', parse_float_column, float), ('count', parse_int_column, int)):
+        raw = [r.get(field) for r in records]
+        parsed, invalid = parse(raw)
+        columns.append((field, kind, raw, parsed, set(invalid)))
+        report[field] = {
+            'invalid': len(invalid),
+            'samples': [raw[i] for i in invalid[:INVALID_SAMPLES_LIMIT]],
+        }
+
+    out = NumericRecords()
+    for i, r in enumerate(records):
+        update = None
+        for field, kind, raw, parsed, bad in columns:
+            v = raw[i]
+            if v is None or type(v) is kind or i in bad:
+                continue
+            if update is None:
+                update = {}
+            update[field] = parsed[i]
+        out.append(r if update is None else {**r, **update})
+
+    out.invalid_numbers = report
+    return out
+
+
 def is_total(r: Record) -> bool:
     return r.get('record_type') == 'total'
 
@@ -179,6 +284,8 @@ def top_counterparties(
 ) -> List[Record]:
 
     agg: Dict[str, Dict[str, Any]] = {}
+    # для интернированных регномеров копим int-коды по пулам, строки достаём только для top_n
+    reg_ids: Dict[str, Dict[RegNumberPool, set[int]]] = {}
 
     for r in records:
         if r.get('record_type') != 'counterparty':
@@ -205,17 +312,25 @@ def top_counterparties(
         agg[inn]['count'] += to_int(r.get('count'))
         agg[inn]['rows_used'] += 1
 
-        for reg in (r.get('reg_numbers') or []):
+        regs = r.get('reg_numbers') or []
+        if isinstance(regs, RegNumbers):
+            reg_ids.setdefault(inn, {}).setdefault(regs.pool, set()).update(regs.ids)
+            continue
+
+        for reg in regs:
             if reg:
                 agg[inn]['reg_numbers'].add(reg)
 
-    out: List[Record] = []
-    for v in agg.values():
-        v['reg_numbers'] = sorted(v['reg_numbers'])
-        out.append(v)
+    out: List[Record] = sorted(agg.values(), key=lambda x: x['amount'], reverse=True)
+    out = out[:max(0, top_n)]
+
+    for v in out:
+        regs_set = v['reg_numbers']
+        for pool, ids in reg_ids.get(v['counterparty_inn'] or 'UNKNOWN_INN', {}).items():
+            regs_set.update(pool.decode(ids))
+        v['reg_numbers'] = sorted(regs_set)
 
-    out.sort(key=lambda x: x['amount'], reverse=True)
-    return out[:max(0, top_n)]
+    return out
 
 
 def reg_numbers_sample(
@@ -235,7 +350,7 @@ def reg_numbers_sample(
             continue
 
         reg_numbers = r.get('reg_numbers') or []
-        if not isinstance(reg_numbers, list):
+        if not is_reg_list(reg_numbers):
             reg_numbers = []
 
         for reg in reg_numbers:
@@ -253,13 +368,48 @@ def reg_numbers_sample(
     return out
 
 
+def unique_reg_numbers(
+    records: List[Record],
+    role: str | None = None,
+    approximate: bool = False,
+    precision: int = 14,
+) -> int:
+
+    hll = HyperLogLog(precision) if approximate else None
+    seen: set[str] = set()
+
+    for r in records:
+        if r.get('record_type') != 'counterparty':
+            continue
+
+        if role is not None and r.get('counterparty_role') != role:
+            continue
+
+        reg_numbers = r.get('reg_numbers') or []
+        if not is_reg_list(reg_numbers):
+            continue
+
+        if hll is not None:
+            hll.update(reg_numbers)
+        else:
+            seen.update(reg for reg in reg_numbers if reg)
+
+    return hll.count() if hll is not None else len(seen)
+
+
 def compute_contracts_metrics(
     records: List[Record],
     filters: Dict[str, Any] | None = None,
     top_n: int = 10,
     reg_limit: int = 20,
+    unique_contracts: str | None = None,
 ) -> Dict[str, Any]:
+    if unique_contracts not in (None, 'exact', 'approx'):
+        raise ValueError("unique_contracts должен быть None, 'exact' или 'approx'")
+
     filters = filters or {}
+    records = coerce_numeric_columns(records)
+    invalid_numbers = records.invalid_numbers
 
     filtered = filter_records(
         records,
@@ -295,7 +445,16 @@ def compute_contracts_metrics(
             'total_rows': sum(1 for r in filtered if r.get('record_type') == 'total'),
             'counterparty_rows': sum(1 for r in filtered if r.get('record_type') == 'counterparty'),
         },
+        'invalid_numbers': invalid_numbers,
     }
+    if unique_contracts is not None:
+        approximate = unique_contracts == 'approx'
+        result['reg_numbers']['unique'] = {
+            'method': unique_contracts,
+            'all': unique_reg_numbers(filtered, role=None, approximate=approximate),
+            'customers': unique_reg_numbers(filtered, role='customer', approximate=approximate),
+            'suppliers': unique_reg_numbers(filtered, role='supplier', approximate=approximate),
+        }
     if main_currency is None:
         return result
     result['by_year'] = by_year(filtered, main_currency)
@@ -1,8 +1,9 @@
 from __future__ import annotations
 from typing import Any, Dict, List, Optional, Tuple
+from analytics.reg_numbers import RegNumberPool
 
 
-def normalize_contracts_format1(raw: Dict[str, Any]) -> List[Dict[str, Any]]:
+def normalize_contracts_format1(raw: Dict[str, Any], reg_pool: RegNumberPool | None = None) -> List[Dict[str, Any]]:
 
     records: List[Dict[str, Any]] = []
 
@@ -59,6 +60,7 @@ def normalize_contracts_format1(raw: Dict[str, Any]) -> List[Dict[str, Any]]:
                         status=str(status),
                         role_name="customer",
                         items=payload.get("Заказчики"),
+                        reg_pool=reg_pool,
                     )
 
                 if "Поставщики" in payload:
@@ -69,6 +71,7 @@ def normalize_contracts_format1(raw: Dict[str, Any]) -> List[Dict[str, Any]]:
                         status=str(status),
                         role_name="supplier",
                         items=payload.get("Поставщики"),
+                        reg_pool=reg_pool,
                     )
 
     return records
@@ -81,6 +84,7 @@ def _extend_counterparties(
     status: str,
     role_name: str,
     items: Any,
+    reg_pool: RegNumberPool | None = None,
 ) -> None:
     if not isinstance(items, list):
         return
@@ -95,6 +99,8 @@ def _extend_counterparties(
         reg_numbers = cp.get("РегНомера", [])
         if not isinstance(reg_numbers, list):
             reg_numbers = []
+        if reg_pool is not None:
+            reg_numbers = reg_pool.encode(reg_numbers)
 
         if not currency_rows:
             currency_rows = [(None, None, None)]
@@ -0,0 +1,403 @@
+from __future__ import annotations
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+from analytics.metrics_contracts import (
+    INVALID_SAMPLES_LIMIT,
+    Record,
+    coerce_numeric_columns,
+    filter_records,
+    pick_main_currency,
+    to_float,
+    to_int,
+)
+from analytics.reg_numbers import is_reg_list
+
+Aggregate = Dict[str, Any]
+
+# Меньше этого числа строк пул процессов не поднимаем: накладные расходы на pickle дороже расчёта
+PORTFOLIO_INLINE_ROWS: int = 50_000
+
+
+def partition_by_inn(records: List[Record]) -> Dict[str, List[Record]]:
+    parts: Dict[str, List[Record]] = {}
+    for r in records:
+        inn = str(r.get('subject_inn'))
+        part = parts.get(inn)
+        if part is None:
+            part = []
+            parts[inn] = part
+        part.append(r)
+    return parts
+
+
+def empty_aggregate() -> Aggregate:
+    return {
+        'input_rows': 0,
+        'after_filter': 0,
+        'total_rows': 0,
+        'counterparty_rows': 0,
+        'invalid_numbers': {
+            'amount': {'invalid': 0, 'samples': []},
+            'count': {'invalid': 0, 'samples': []},
+        },
+        'totals': {},
+        'by_year': {},
+        'by_status': {},
+        'year_status': {},
+        'counterparties': {},
+        # регномер -> (номер записи в исходном списке портфеля, позиция в её reg_numbers) первого появления:
+        # по нему выборки регномеров сливаются в том же порядке, что и при последовательном расчёте
+        'reg_all': {},
+        'reg_customer': {},
+        'reg_supplier': {},
+    }
+
+
+def _add(bucket: Dict[Any, Dict[str, Any]], key: Any, amount: float, count: int) -> None:
+    v = bucket.get(key)
+    if v is None:
+        bucket[key] = {'amount': amount, 'count': count}
+        return
+    v['amount'] += amount
+    v['count'] += count
+
+
+def aggregate_records(
+    records: List[Record],
+    filters: Dict[str, Any] | None = None,
+    row_ids: List[int] | None = None,
+) -> Aggregate:
+    # row_ids - номера записей в исходном списке (если records - его часть), по умолчанию 0..n-1
+    filters = filters or {}
+    records = coerce_numeric_columns(records)
+    invalid_numbers = records.invalid_numbers
+
+    filtered = filter_records(
+        records,
+        subject_inn=filters.get('subject_inn'),
+        years=filters.get('years'),
+        statuses=filters.get('statuses'),
+        role=filters.get('role'),
+        min_amount=filters.get('min_amount'),
+        max_amount=filters.get('max_amount')
+    )
+
+    agg = empty_aggregate()
+    agg['input_rows'] = len(records)
+    agg['invalid_numbers'] = invalid_numbers
+    rows = None
+    if row_ids is not None:
+        # filtered - подпоследовательность records из тех же объектов: номера сопоставляем по порядку, а не по id(r),
+        # иначе повторы одного dict в списке слились бы в одну позицию
+        rows = []
+        j = 0
+        for i, r in enumerate(records):
+            if j < len(filtered) and filtered[j] is r:
+                rows.append(row_ids[i])
+                j += 1
+    accumulate_records(agg, filtered, rows)
+    return agg
+
+
+def accumulate_records(agg: Aggregate, filtered: List[Record], rows: List[int] | None = None) -> Aggregate:
+    # rows - номера записей filtered в исходном списке; без них - сквозная нумерация по вызовам
+    if rows is None:
+        rows = range(agg['after_filter'], agg['after_filter'] + len(filtered))
+    agg['after_filter'] += len(filtered)
+
+    for row, r in zip(rows, filtered):
+        record_type = r.get('record_type')
+        cur = r.get('currency') or 'UNKNOWN'
+
+        if record_type == 'total':
+            agg['total_rows'] += 1
+            amount = to_float(r.get('amount'))
+            count = to_int(r.get('count'))
+
+            _add(agg['totals'], cur, amount, count)
+
+            status = r.get('status') or 'UNKNOWN'
+            _add(agg['by_status'], (status, cur), amount, count)
+
+            year = r.get('year')
+            if year is not None:
+                _add(agg['by_year'], (year, cur), amount, count)
+                _add(agg['year_status'], (year, status, cur), amount, count)
+            continue
+
+        if record_type != 'counterparty':
+            continue
+
+        agg['counterparty_rows'] += 1
+        role = r.get('counterparty_role')
+
+        reg_numbers = r.get('reg_numbers') or []
+        if not is_reg_list(reg_numbers):
+            reg_numbers = []
+
+        reg_role = agg.get(f'reg_{role}')
+        for j, reg in enumerate(reg_numbers):
+            if not reg:
+                continue
+            agg['reg_all'].setdefault(reg, (row, j))
+            if reg_role is not None:
+                reg_role.setdefault(reg, (row, j))
+
+        inn = r.get('counterparty_inn') or 'UNKNOWN_INN'
+        key = (role, cur, inn)
+        cp = agg['counterparties'].get(key)
+        if cp is None:
+            cp = {
+                'counterparty_inn': r.get('counterparty_inn'),
+                'counterparty_name_full': r.get('counterparty_name_full'),
+                'amount': 0.0,
+                'count': 0,
+                'rows_used': 0,
+                'reg_numbers': set(),
+            }
+            agg['counterparties'][key] = cp
+
+        cp['amount'] += to_float(r.get('amount'))
+        cp['count'] += to_int(r.get('count'))
+        cp['rows_used'] += 1
+        for reg in reg_numbers:
+            if reg:
+                cp['reg_numbers'].add(reg)
+
+    return agg
+
+
+def merge_aggregates(parts: List[Aggregate]) -> Aggregate:
+    out = empty_aggregate()
+
+    for part in parts:
+        for k in ('input_rows', 'after_filter', 'total_rows', 'counterparty_rows'):
+            out[k] += part[k]
+
+        for field, v in part['invalid_numbers'].items():
+            dst = out['invalid_numbers'][field]
+            dst['invalid'] += v['invalid']
+            dst['samples'].extend(v['samples'][:INVALID_SAMPLES_LIMIT - len(dst['samples'])])
+
+        for k in ('totals', 'by_year', 'by_status', 'year_status'):
+            for key, v in part[k].items():
+                _add(out[k], key, v['amount'], v['count'])
+
+        # регномера не объединяем сразу: это нужно только для попавших в top_n
+        for key, v in part['counterparties'].items():
+            reg_sets = v['reg_sets'] if 'reg_sets' in v else [v['reg_numbers']]
+            cp = out['counterparties'].get(key)
+            if cp is None:
+                out['counterparties'][key] = {
+                    'counterparty_inn': v['counterparty_inn'],
+                    'counterparty_name_full': v['counterparty_name_full'],
+                    'amount': v['amount'],
+                    'count': v['count'],
+                    'rows_used': v['rows_used'],
+                    'reg_sets': list(reg_sets),
+                }
+                continue
+            cp['amount'] += v['amount']
+            cp['count'] += v['count']
+            cp['rows_used'] += v['rows_used']
+            cp['reg_sets'].extend(reg_sets)
+
+        for k in ('reg_all', 'reg_customer', 'reg_supplier'):
+            dst = out[k]
+            for reg, pos in part[k].items():
+                seen = dst.get(reg)
+                if seen is None or pos < seen:
+                    dst[reg] = pos
+
+    return out
+
+
+def _first_positions(first_rows: Dict[str, Tuple[int, int]], limit: int) -> Dict[str, Tuple[int, int]]:
+    # первые limit регномеров по месту первого появления (запись, позиция в записи)
+    if limit <= 0:
+        return {}
+    return dict(heapq.nsmallest(limit, first_rows.items(), key=lambda kv: kv[1]))
+
+
+def _first(first_rows: Dict[str, Tuple[int, int]], limit: int) -> List[str]:
+    return list(_first_positions(first_rows, limit))
+
+
+def _top_counterparties(agg: Aggregate, role: str, currency: str, top_n: int) -> List[Record]:
+    out: List[Record] = []
+    for (cp_role, cur, _), v in agg['counterparties'].items():
+        if cp_role != role or cur != currency:
+            continue
+        out.append({
+            'counterparty_role': role,
+            'currency': currency,
+            'counterparty_inn': v['counterparty_inn'],
+            'counterparty_name_full': v['counterparty_name_full'],
+            'amount': v['amount'],
+            'count': v['count'],
+            'rows_used': v['rows_used'],
+            'reg_numbers': v['reg_sets'] if 'reg_sets' in v else [v['reg_numbers']],
+        })
+
+    out.sort(key=lambda x: x['amount'], reverse=True)
+    out = out[:max(0, top_n)]
+    for v in out:
+        v['reg_numbers'] = sorted(reg for reg in set().union(*v['reg_numbers']) if reg)
+    return out
+
+
+def finalize_aggregate(
+    agg: Aggregate,
+    filters: Dict[str, Any] | None = None,
+    top_n: int = 10,
+    reg_limit: int = 20,
+) -> Dict[str, Any]:
+    filters = filters or {}
+
+    by_currency = {cur: dict(v) for cur, v in agg['totals'].items()}
+    currencies = sorted(by_currency.keys())
+    main_currency = pick_main_currency(currencies)
+
+    result: dict[str, Any] = {
+        'filters': filters,
+        'summary': {'by_currency': by_currency, 'currencies': currencies},
+        'main_currency': main_currency,
+        'by_year': [],
+        'by_status': [],
+        'year_status': [],
+        'top_customers': [],
+        'top_suppliers': [],
+        'reg_numbers': {
+            'all': _first(agg['reg_all'], reg_limit),
+            'customers': _first(agg['reg_customer'], reg_limit),
+            'suppliers': _first(agg['reg_supplier'], reg_limit),
+        },
+        'rows': {
+            'input': agg['input_rows'],
+            'after_filter': agg['after_filter'],
+            'total_rows': agg['total_rows'],
+            'counterparty_rows': agg['counterparty_rows'],
+        },
+        'invalid_numbers': agg['invalid_numbers'],
+    }
+    if main_currency is None:
+        return result
+
+    result['by_year'] = sorted(
+        (
+            {'year': year, 'currency': cur, **v}
+            for (year, cur), v in agg['by_year'].items()
+            if cur == main_currency
+        ),
+        key=lambda x: x['year'],
+    )
+    result['by_status'] = sorted(
+        (
+            {'status': status, 'currency': cur, **v}
+            for (status, cur), v in agg['by_status'].items()
+            if cur == main_currency
+        ),
+        key=lambda x: x['amount'],
+        reverse=True,
+    )
+    result['year_status'] = sorted(
+        (
+            {'year': year, 'status': status, 'currency': cur, **v}
+            for (year, status, cur), v in agg['year_status'].items()
+            if cur == main_currency
+        ),
+        key=lambda x: (x['year'], x['status']),
+    )
+
+    result['top_customers'] = _top_counterparties(agg, 'customer', main_currency, top_n)
+    result['top_suppliers'] = _top_counterparties(agg, 'supplier', main_currency, top_n)
+
+    return result
+
+
+def _aggregate_batch(
+    batch: List[Tuple[str, List[Record], List[int]]],
+    filters: Dict[str, Any],
+    top_n: int,
+    reg_limit: int,
+) -> List[Tuple[str, Aggregate, Dict[str, Any]]]:
+    out: List[Tuple[str, Aggregate, Dict[str, Any]]] = []
+    for inn, part, row_ids in batch:
+        agg = aggregate_records(part, filters, row_ids)
+        res = finalize_aggregate(agg, filters, top_n=top_n, reg_limit=reg_limit)
+        # в общую выборку из ИНН попадут не больше reg_limit его первых регномеров: остальные
+        # позиции не возвращаем из воркера, чтобы pickle не рос с размером партиции
+        for k in ('reg_all', 'reg_customer', 'reg_supplier'):
+            agg[k] = _first_positions(agg[k], reg_limit)
+        out.append((inn, agg, res))
+    return out
+
+
+def _make_batches(parts: Dict[str, List[Record]], n_batches: int) -> List[List[Tuple[str, List[Record]]]]:
+    # Жадная балансировка по числу строк: крупные ИНН раскладываем первыми в самый лёгкий батч
+    n_batches = max(1, min(n_batches, len(parts)))
+    batches: List[List[Tuple[str, List[Record]]]] = [[] for _ in range(n_batches)]
+    loads = [0] * n_batches
+
+    for inn, part in sorted(parts.items(), key=lambda kv: len(kv[1]), reverse=True):
+        i = loads.index(min(loads))
+        batches[i].append((inn, part))
+        loads[i] += len(part)
+
+    return [b for b in batches if b]
+
+
+def compute_portfolio_metrics(
+    records: List[Record],
+    filters: Dict[str, Any] | None = None,
+    top_n: int = 10,
+    reg_limit: int = 20,
+    max_workers: int | None = None,
+) -> Dict[str, Any]:
+    filters = filters or {}
+
+    parts = partition_by_inn(records)
+    subject_inn = filters.get('subject_inn')
+    if subject_inn is not None:
+        parts = {inn: p for inn, p in parts.items() if inn == subject_inn}
+
+    # номера записей в исходном списке: по ним сливаются выборки регномеров разных ИНН
+    row_ids: Dict[str, List[int]] = {inn: [] for inn in parts}
+    for i, r in enumerate(records):
+        ids = row_ids.get(str(r.get('subject_inn')))
+        if ids is not None:
+            ids.append(i)
+
+    workers = max_workers or os.cpu_count() or 1
+    # несколько батчей на воркер, чтобы выровнять хвост по самым крупным ИНН
+    batches = [
+        [(inn, part, row_ids[inn]) for inn, part in batch]
+        for batch in _make_batches(parts, workers * 4)
+    ]
+
+    if workers <= 1 or len(batches) <= 1 or len(records) < PORTFOLIO_INLINE_ROWS:
+        chunks = [_aggregate_batch(b, filters, top_n, reg_limit) for b in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_aggregate_batch, b, filters, top_n, reg_limit) for b in batches]
+            chunks = [f.result() for f in futures]
+
+    by_inn_agg: Dict[str, Aggregate] = {}
+    by_inn: Dict[str, Dict[str, Any]] = {}
+    for chunk in chunks:
+        for inn, agg, res in chunk:
+            by_inn_agg[inn] = agg
+            by_inn[inn] = res
+
+    # выборки регномеров сливаются по номеру записи первого появления, поэтому совпадают
+    # с последовательным расчётом и при перемешанных ИНН; порядок ИНН - для by_inn
+    order = [inn for inn in parts if inn in by_inn_agg]
+    combined_agg = merge_aggregates([by_inn_agg[inn] for inn in order])
+    combined_agg['input_rows'] = len(records)
+
+    return {
+        'combined': finalize_aggregate(combined_agg, filters, top_n=top_n, reg_limit=reg_limit),
+        'by_inn': {inn: by_inn[inn] for inn in order},
+    }
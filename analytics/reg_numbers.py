@@ -0,0 +1,134 @@
+from __future__ import annotations
+import hashlib
+import math
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List
+
+
+class RegNumberPool:
+    # Общая таблица регномеров: каждая строка хранится один раз, записи держат только int-коды
+    __slots__ = ('_ids', '_strings')
+
+    def __init__(self) -> None:
+        self._ids: Dict[str, int] = {}
+        self._strings: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+    def intern(self, reg: str) -> int:
+        rid = self._ids.get(reg)
+        if rid is None:
+            rid = len(self._strings)
+            self._ids[reg] = rid
+            self._strings.append(reg)
+        return rid
+
+    def encode(self, regs: Iterable[Any]) -> RegNumbers:
+        ids = array('I')
+        for reg in regs:
+            if not reg:
+                continue
+            ids.append(self.intern(str(reg)))
+        return RegNumbers(self, ids)
+
+    def decode(self, ids: Iterable[int]) -> List[str]:
+        strings = self._strings
+        return [strings[i] for i in ids]
+
+    def __getstate__(self) -> List[str]:
+        return self._strings
+
+    def __setstate__(self, state: List[str]) -> None:
+        self._strings = list(state)
+        self._ids = {s: i for i, s in enumerate(self._strings)}
+
+
+class RegNumbers:
+    # Компактный список регномеров записи: array('I') кодов + ссылка на общий пул.
+    # При итерации отдаёт строки, поэтому подходит везде, где раньше был list[str].
+    __slots__ = ('pool', 'ids')
+
+    def __init__(self, pool: RegNumberPool, ids: array) -> None:
+        self.pool = pool
+        self.ids = ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __bool__(self) -> bool:
+        return len(self.ids) > 0
+
+    def __iter__(self) -> Iterator[str]:
+        strings = self.pool._strings
+        for i in self.ids:
+            yield strings[i]
+
+    def __getitem__(self, i: int) -> str:
+        return self.pool._strings[self.ids[i]]
+
+    def __eq__(self, other: Any) -> bool:
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f'RegNumbers({list(self)!r})'
+
+
+def is_reg_list(value: Any) -> bool:
+    return isinstance(value, (list, RegNumbers))
+
+
+def _hash64(value: str) -> int:
+    # стабильный между процессами хеш (в отличие от hash(str)), чтобы HLL можно было мёрджить
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class HyperLogLog:
+    __slots__ = ('p', 'm', 'registers')
+
+    def __init__(self, p: int = 14) -> None:
+        if not 4 <= p <= 18:
+            raise ValueError('Точность HyperLogLog p должна быть в диапазоне 4..18')
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, value: str) -> None:
+        h = _hash64(value)
+        idx = h >> (64 - self.p)
+        w = (h << self.p) & 0xFFFFFFFFFFFFFFFF
+        rank = (64 - self.p + 1) if w == 0 else (65 - w.bit_length())
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def update(self, values: Iterable[str]) -> None:
+        for v in values:
+            if v:
+                self.add(v)
+
+    def merge(self, other: HyperLogLog) -> None:
+        if other.p != self.p:
+            raise ValueError('Нельзя объединить HyperLogLog с разной точностью')
+        regs = self.registers
+        for i, r in enumerate(other.registers):
+            if r > regs[i]:
+                regs[i] = r
+
+    def count(self) -> int:
+        m = self.m
+        if m == 16:
+            alpha = 0.673
+        elif m == 32:
+            alpha = 0.697
+        elif m == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1 + 1.079 / m)
+
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # linear counting для малых кардинальностей
+            estimate = m * math.log(m / zeros)
+
+        return int(round(estimate))
@@ -0,0 +1,130 @@
+from __future__ import annotations
+import random
+from typing import Any, Dict, List
+
+SYNTHETIC_STATUSES: List[str] = [
+    'Подача заявок',
+    'Работа комиссии',
+    'Закупка завершена',
+    'Закупка отменена',
+]
+
+SYNTHETIC_CURRENCIES: List[tuple[str, str]] = [
+    ('RUB', 'Российский рубль'),
+    ('USD', 'Доллар США'),
+    ('EUR', 'Евро'),
+    ('CNY', 'Юань'),
+]
+
+# цифр на порядковый номер в реестровом номере: до 10^9 различных номеров (~2*10^8 строк выгрузки)
+REG_SEQ_DIGITS = 9
+
+
+def _amount_value(rnd: random.Random, amount: float) -> Any:
+    # DaMIA отдаёт суммы по-разному: числом, строкой с точкой или "1 234 567,89"
+    kind = rnd.random()
+    if kind < 0.6:
+        return round(amount, 2)
+    if kind < 0.8:
+        return f'{amount:.2f}'
+    return f'{amount:,.2f}'.replace(',', ' ').replace('.', ',')
+
+
+def _count_value(rnd: random.Random, count: int) -> Any:
+    return count if rnd.random() < 0.7 else str(count)
+
+
+def _inn(rnd: random.Random) -> str:
+    return str(rnd.randint(10 ** 9, 10 ** 10 - 1))
+
+
+def _reg_number(subject_inn: str, year: int, n: int) -> str:
+    # 19-значный реестровый номер в духе 44-ФЗ: 3 + код субъекта (7 цифр ИНН) + год + порядковый номер (9 цифр).
+    # Номера различаются по n, поэтому n шире поля обрезать нельзя - совпали бы номера разных контрактов
+    if not 0 <= n < 10 ** REG_SEQ_DIGITS:
+        raise ValueError(f'Порядковый номер {n} не помещается в {REG_SEQ_DIGITS} цифр реестрового номера')
+    return f'3{subject_inn[:7]}{year % 100:02d}{n:0{REG_SEQ_DIGITS}d}'
+
+
+def generate_contracts_format1(
+    n_rows: int,
+    *,
+    seed: int = 0,
+    n_subjects: int | None = None,
+    years: List[int] | None = None,
+    counterparties_per_subject: int = 200,
+    max_reg_numbers: int = 40,
+) -> Dict[str, Any]:
+    rnd = random.Random(seed)
+    years = years or list(range(2014, 2026))
+
+    if n_subjects is None:
+        n_subjects = max(1, n_rows // 5_000)
+
+    subjects = [_inn(rnd) for _ in range(n_subjects)]
+    pools = {
+        inn: [
+            {
+                'ИНН': _inn(rnd),
+                'ОГРН': str(rnd.randint(10 ** 12, 10 ** 13 - 1)),
+                'НаимПолн': f'ГБУ "Учреждение №{i}"',
+                'НаимСокр': f'ГБУ №{i}',
+                'АдресПолн': f'г. Москва, ул. Тестовая, д. {i}',
+                'РукФИО': 'Иванов Иван Иванович',
+                'РукИННФЛ': str(rnd.randint(10 ** 11, 10 ** 12 - 1)),
+                'Телефон': '+7 (495) 000-00-00',
+                'Email': f'cp{i}@example.ru',
+            }
+            for i in range(counterparties_per_subject)
+        ]
+        for inn in subjects
+    }
+
+    raw: Dict[str, Any] = {}
+    rows = 0
+    reg_seq = 0
+
+    while rows < n_rows:
+        subject_inn = subjects[rnd.randrange(n_subjects)]
+        year = years[rnd.randrange(len(years))]
+        status = SYNTHETIC_STATUSES[rnd.randrange(len(SYNTHETIC_STATUSES))]
+
+        statuses_block = raw.setdefault(subject_inn, {}).setdefault(str(year), {})
+        payload = statuses_block.setdefault(status, {'Цена': [], 'Заказчики': [], 'Поставщики': []})
+
+        if not payload['Цена']:
+            for code, name in SYNTHETIC_CURRENCIES[:rnd.choice((1, 1, 1, 2, 4))]:
+                payload['Цена'].append({
+                    'ВалютаКод': code,
+                    'ВалютаНаим': name,
+                    'Сумма': _amount_value(rnd, rnd.lognormvariate(16, 2)),
+                    'Количество': _count_value(rnd, rnd.randint(1, 500)),
+                })
+                rows += 1
+
+        role_key = 'Заказчики' if rnd.random() < 0.5 else 'Поставщики'
+        cp = dict(pools[subject_inn][rnd.randrange(counterparties_per_subject)])
+
+        price: Dict[str, Any] = {}
+        for code, _ in SYNTHETIC_CURRENCIES[:rnd.choice((1, 1, 1, 2))]:
+            price[code] = {
+                'Сумма': _amount_value(rnd, rnd.lognormvariate(14, 2)),
+                'Количество': _count_value(rnd, rnd.randint(1, 50)),
+            }
+            rows += 1
+        cp['Цена'] = price
+
+        n_regs = min(max_reg_numbers, int(rnd.expovariate(1 / 8)))
+        regs: List[str] = []
+        for _ in range(n_regs):
+            # часть номеров повторяется между контрагентами, как в реальных ответах
+            if reg_seq and rnd.random() < 0.3:
+                regs.append(_reg_number(subject_inn, year, rnd.randrange(reg_seq)))
+            else:
+                reg_seq += 1
+                regs.append(_reg_number(subject_inn, year, reg_seq))
+        cp['РегНомера'] = regs
+
+        payload[role_key].append(cp)
+
+    return raw
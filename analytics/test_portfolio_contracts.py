@@ -0,0 +1,34 @@
+from __future__ import annotations
+import random
+import analytics.portfolio_contracts as portfolio
+from analytics.metrics_contracts import compute_contracts_metrics
+from analytics.normalize_contracts import normalize_contracts_format1
+from analytics.synthetic_contracts import generate_contracts_format1
+from analytics.test_reg_numbers_contracts import ROWS, SEED, check_same
+
+
+def test_portfolio_matches_sequential() -> None:
+    # записи разных ИНН вперемешку и повторы одних и тех же dict: combined совпадает с последовательным расчётом
+    records = normalize_contracts_format1(generate_contracts_format1(ROWS, seed=SEED, n_subjects=4))
+    rnd = random.Random(SEED)
+    records += records[:ROWS // 5]
+    rnd.shuffle(records)
+    expected = compute_contracts_metrics(records, reg_limit=25)
+
+    inline_rows = portfolio.PORTFOLIO_INLINE_ROWS
+    # порог 0: даже на маленьком наборе считаем в пуле процессов, как на больших портфелях
+    portfolio.PORTFOLIO_INLINE_ROWS = 0
+    try:
+        for workers in (1, 4):
+            result = portfolio.compute_portfolio_metrics(records, reg_limit=25, max_workers=workers)
+            check_same(f'портфель, процессов={workers}', expected, result['combined'])
+
+            for inn, res in result['by_inn'].items():
+                part = [r for r in records if str(r.get('subject_inn')) == inn]
+                check_same(f'портфель, ИНН {inn}, процессов={workers}', compute_contracts_metrics(part, reg_limit=25), res)
+    finally:
+        portfolio.PORTFOLIO_INLINE_ROWS = inline_rows
+
+
+if __name__ == '__main__':
+    test_portfolio_matches_sequential()
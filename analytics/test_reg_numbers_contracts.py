@@ -0,0 +1,73 @@
+from __future__ import annotations
+import math
+from typing import Any, List
+from analytics.metrics_contracts import compute_contracts_metrics, unique_reg_numbers
+from analytics.normalize_contracts import normalize_contracts_format1
+from analytics.reg_numbers import HyperLogLog, RegNumberPool
+from analytics.synthetic_contracts import generate_contracts_format1
+
+# Контракты ускоренных путей: на одних и тех же синтетических данных они должны давать то же,
+# что и прямой compute_contracts_metrics. Суммы сравниваются с допуском: порядок сложения разный.
+ROWS = 3_000
+SEED = 7
+
+
+def metrics_diff(a: Any, b: Any, path: str = '') -> List[str]:
+    if isinstance(a, float) or isinstance(b, float):
+        if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+            if (math.isnan(a) and math.isnan(b)) or math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6):
+                return []
+        return [f'{path}: {a!r} != {b!r}']
+    if isinstance(a, dict) and isinstance(b, dict):
+        if set(a) != set(b):
+            return [f'{path}: ключи {sorted(set(a) ^ set(b), key=str)}']
+        return [d for k in a for d in metrics_diff(a[k], b[k], f'{path}.{k}')]
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        if len(a) != len(b):
+            return [f'{path}: длина {len(a)} != {len(b)}']
+        return [d for i, (x, y) in enumerate(zip(a, b)) for d in metrics_diff(x, y, f'{path}[{i}]')]
+    return [] if a == b else [f'{path}: {a!r} != {b!r}']
+
+
+def check_same(name: str, expected: Any, got: Any) -> None:
+    diffs = metrics_diff(expected, got)
+    assert not diffs, f'{name}: ' + '; '.join(diffs[:5])
+    print('OK:', name)
+
+
+def test_interned_matches_plain() -> None:
+    raw = generate_contracts_format1(ROWS, seed=SEED)
+    plain = normalize_contracts_format1(raw)
+    interned = normalize_contracts_format1(raw, reg_pool=RegNumberPool())
+
+    for method in (None, 'exact', 'approx'):
+        check_same(
+            f'регномеры через пул, unique_contracts={method}',
+            compute_contracts_metrics(plain, unique_contracts=method),
+            compute_contracts_metrics(interned, unique_contracts=method),
+        )
+
+
+def test_hyperloglog_estimate() -> None:
+    records = normalize_contracts_format1(generate_contracts_format1(ROWS, seed=SEED), reg_pool=RegNumberPool())
+    for role in (None, 'customer', 'supplier'):
+        exact = unique_reg_numbers(records, role=role)
+        approx = unique_reg_numbers(records, role=role, approximate=True)
+        # p=14: стандартная ошибка ~0.8%, 4% - это 5 сигм
+        assert abs(approx - exact) <= 0.04 * exact, (role, exact, approx)
+        print(f'OK: HyperLogLog role={role}: {approx} ~ {exact}')
+
+    # объединение HLL частей = HLL объединения
+    left, right, whole = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    values = [f'reg{i}' for i in range(20_000)]
+    left.update(values[:12_000])
+    right.update(values[8_000:])
+    whole.update(values)
+    left.merge(right)
+    assert left.registers == whole.registers and left.count() == whole.count()
+    print('OK: объединение HyperLogLog')
+
+
+if __name__ == '__main__':
+    test_interned_matches_plain()
+    test_hyperloglog_estimate()
@@ -0,0 +1,27 @@
+from __future__ import annotations
+from analytics.metrics_contracts import compute_contracts_metrics
+from analytics.normalize_contracts import normalize_contracts_format1
+from analytics.synthetic_contracts import SYNTHETIC_STATUSES, generate_contracts_format1
+from analytics.test_reg_numbers_contracts import ROWS, SEED, check_same
+from analytics.whatif_contracts import compute_contracts_metrics_batch
+
+
+def test_batch_matches_per_scenario() -> None:
+    records = normalize_contracts_format1(generate_contracts_format1(ROWS, seed=SEED))
+    years = sorted({r['year'] for r in records if r.get('year') is not None})[-3:]
+    specs = (
+        [None, {}]
+        + [{'years': [y]} for y in years]
+        + [{'statuses': [st]} for st in SYNTHETIC_STATUSES]
+        + [{'role': role} for role in ('customer', 'supplier')]
+        + [{'min_amount': lo, 'max_amount': hi} for lo, hi in ((0, 1e6), (1e6, 1e8), (1e8, None))]
+        + [{'years': years[-1:], 'role': 'supplier', 'min_amount': 1e5}]
+    )
+
+    batch = compute_contracts_metrics_batch(records, specs, reg_limit=25)
+    for spec, res in zip(specs, batch):
+        check_same(f'what-if пакетом, {spec}', compute_contracts_metrics(records, spec, reg_limit=25), res)
+
+
+if __name__ == '__main__':
+    test_batch_matches_per_scenario()
@@ -0,0 +1,270 @@
+from __future__ import annotations
+import heapq
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Tuple
+from analytics.metrics_contracts import (
+    Record,
+    coerce_numeric_columns,
+    pick_main_currency,
+    to_float,
+    to_int,
+)
+from analytics.portfolio_contracts import (
+    Aggregate,
+    accumulate_records,
+    empty_aggregate,
+    finalize_aggregate,
+    merge_aggregates,
+)
+from analytics.reg_numbers import is_reg_list
+
+# Ячейка = (subject_inn, year, status, record_type, counterparty_role).
+# Все фильтры, кроме суммы, принимают или отбрасывают ячейку целиком, а диапазоны сумм
+# режут ячейку на общие для всех вариантов отрезки, поэтому построчные фильтры
+# для каждого варианта не нужны.
+# Суммы складываются по группам, а не в порядке записей, поэтому amount может отличаться
+# от compute_contracts_metrics в последних знаках (порядок сложения float); count и состав строк совпадают.
+CellKey = Tuple[Any, Any, Any, Any, Any]
+
+
+def _cell_key(r: Record, dims: Tuple[bool, bool, bool, bool]) -> CellKey:
+    # измерения, по которым не фильтрует ни один вариант, в ключ не включаем - ячейки крупнее
+    by_inn, by_year, by_status, by_role = dims
+    record_type = r.get('record_type')
+    role = r.get('counterparty_role') if by_role and record_type == 'counterparty' else None
+    return (
+        r.get('subject_inn') if by_inn else None,
+        r.get('year') if by_year else None,
+        r.get('status') if by_status else None,
+        record_type,
+        role,
+    )
+
+
+def _cell_matches(
+    key: CellKey,
+    subject_inn: str | None,
+    years: set[Any] | None,
+    statuses: set[Any] | None,
+    role: str | None,
+) -> bool:
+    cell_inn, year, status, record_type, cell_role = key
+    if subject_inn is not None and cell_inn != subject_inn:
+        return False
+    if years is not None and year not in years:
+        return False
+    if statuses is not None and status not in statuses:
+        return False
+    if role is not None and record_type == 'counterparty' and cell_role != role:
+        return False
+    return True
+
+
+def _reg_samples(rows: Iterable[Record], limit: int) -> Tuple[List[str], List[str], List[str]]:
+    samples: Dict[Any, List[str]] = {None: [], 'customer': [], 'supplier': []}
+    seen: Dict[Any, set[str]] = {None: set(), 'customer': set(), 'supplier': set()}
+    if limit <= 0:
+        return [], [], []
+
+    for r in rows:
+        if r.get('record_type') != 'counterparty':
+            continue
+
+        reg_numbers = r.get('reg_numbers') or []
+        if not is_reg_list(reg_numbers):
+            continue
+
+        role = r.get('counterparty_role')
+        for bucket in (None, role):
+            if bucket not in samples or len(samples[bucket]) >= limit:
+                continue
+            for reg in reg_numbers:
+                if not reg or reg in seen[bucket]:
+                    continue
+                seen[bucket].add(reg)
+                samples[bucket].append(reg)
+                if len(samples[bucket]) >= limit:
+                    break
+
+        if all(len(v) >= limit for v in samples.values()):
+            break
+
+    return samples[None], samples['customer'], samples['supplier']
+
+
+# Отрезок для NaN: сравнения с NaN ложны, и filter_records оставляет такие записи при любом диапазоне сумм
+NAN_SEGMENT: int = -1
+
+
+def _segment(breakpoints: List[float], amount: float) -> int:
+    # отрезки между границами всех диапазонов сумм: чётные - открытые интервалы, нечётные - сами границы
+    if amount != amount:
+        return NAN_SEGMENT
+    i = bisect_left(breakpoints, amount)
+    if i < len(breakpoints) and breakpoints[i] == amount:
+        return 2 * i + 1
+    return 2 * i
+
+
+def compute_contracts_metrics_batch(
+    records: List[Record],
+    filter_specs: List[Dict[str, Any] | None],
+    top_n: int = 10,
+    reg_limit: int = 20,
+) -> List[Dict[str, Any]]:
+    records = coerce_numeric_columns(records)
+    invalid_numbers = records.invalid_numbers
+    specs = [spec or {} for spec in filter_specs]
+    dims = (
+        any(spec.get('subject_inn') is not None for spec in specs),
+        any(spec.get('years') is not None for spec in specs),
+        any(spec.get('statuses') is not None for spec in specs),
+        any(spec.get('role') is not None for spec in specs),
+    )
+
+    breakpoints = sorted({
+        float(spec[k])
+        for spec in specs
+        for k in ('min_amount', 'max_amount')
+        if spec.get(k) is not None
+    })
+    bp_index = {bp: i for i, bp in enumerate(breakpoints)}
+
+    # Один проход по записям: раскладываем по (ячейка, отрезок суммы) в порядке первого появления.
+    # total-строки свёртываются в агрегат группы один раз, а строки контрагентов
+    # превращаются в плоские кортежи с общим int-кодом контрагента (role, currency, inn).
+    groups: Dict[CellKey, Dict[int, List[Any]]] = {}
+    cell_rows: Dict[CellKey, List[Tuple[int, int, Record]]] = {}
+    cp_ids: Dict[Tuple[Any, str, str], int] = {}
+    cp_keys: List[Tuple[Any, str, str]] = []
+
+    for i, r in enumerate(records):
+        key = _cell_key(r, dims)
+        amount = to_float(r.get('amount'))
+        seg = _segment(breakpoints, amount) if breakpoints else 0
+        cell = groups.get(key)
+        if cell is None:
+            cell = {}
+            groups[key] = cell
+            cell_rows[key] = []
+        group = cell.get(seg)
+        if group is None:
+            group = []
+            cell[seg] = group
+        cell_rows[key].append((i, seg, r))
+
+        if key[3] != 'counterparty':
+            group.append(r)
+            continue
+
+        cp_key = (r.get('counterparty_role'), r.get('currency') or 'UNKNOWN', r.get('counterparty_inn') or 'UNKNOWN_INN')
+        ci = cp_ids.get(cp_key)
+        if ci is None:
+            ci = len(cp_keys)
+            cp_ids[cp_key] = ci
+            cp_keys.append(cp_key)
+        group.append((i, ci, amount, to_int(r.get('count'))))
+
+    group_aggs: Dict[Tuple[CellKey, int], Aggregate] = {}
+    n_cp = len(cp_keys)
+
+    results: List[Dict[str, Any]] = []
+    for filters in specs:
+        subject_inn = filters.get('subject_inn')
+        years = set(filters['years']) if filters.get('years') is not None else None
+        statuses = set(filters['statuses']) if filters.get('statuses') is not None else None
+        role = filters.get('role')
+        min_amount = filters.get('min_amount')
+        max_amount = filters.get('max_amount')
+
+        seg_lo = 0 if min_amount is None else 2 * bp_index[float(min_amount)] + 1
+        seg_hi = 2 * len(breakpoints) if max_amount is None else 2 * bp_index[float(max_amount)] + 1
+
+        parts: List[Aggregate] = []
+        cp_groups: List[List[Tuple[int, int, float, int]]] = []
+        matched: List[CellKey] = []
+        for key, cell in groups.items():
+            if not _cell_matches(key, subject_inn, years, statuses, role):
+                continue
+
+            matched.append(key)
+            for seg, group in cell.items():
+                if seg != NAN_SEGMENT and (seg < seg_lo or seg > seg_hi):
+                    continue
+
+                if key[3] == 'counterparty':
+                    cp_groups.append(group)
+                    continue
+
+                agg = group_aggs.get((key, seg))
+                if agg is None:
+                    agg = accumulate_records(empty_aggregate(), group)
+                    group_aggs[(key, seg)] = agg
+                parts.append(agg)
+
+        merged = merge_aggregates(parts)
+        main_currency = pick_main_currency(sorted(merged['totals'].keys()))
+
+        amounts = [0.0] * n_cp
+        counts = [0] * n_cp
+        used = [0] * n_cp
+        first = [len(records)] * n_cp
+        cp_rows = 0
+        for group in cp_groups:
+            cp_rows += len(group)
+            for i, ci, amount, count in group:
+                amounts[ci] += amount
+                counts[ci] += count
+                used[ci] += 1
+                if i < first[ci]:
+                    first[ci] = i
+
+        merged['after_filter'] += cp_rows
+        merged['counterparty_rows'] = cp_rows
+
+        if main_currency is not None:
+            top: List[int] = []
+            for cp_role in ('customer', 'supplier'):
+                candidates = [
+                    ci for ci, (k_role, k_cur, _) in enumerate(cp_keys)
+                    if used[ci] and k_role == cp_role and k_cur == main_currency
+                ]
+                # при равных суммах порядок как у top_counterparties: по первому появлению в отфильтрованных записях
+                candidates.sort(key=lambda ci: (-amounts[ci], first[ci]))
+                top.extend(candidates[:max(0, top_n)])
+
+            reg_sets: Dict[int, List[Any]] = {ci: [] for ci in top}
+            for group in cp_groups:
+                for i, ci, _, _ in group:
+                    regs = reg_sets.get(ci)
+                    if regs is None:
+                        continue
+                    reg_numbers = records[i].get('reg_numbers') or []
+                    if is_reg_list(reg_numbers):
+                        regs.append(reg_numbers)
+
+            for ci in top:
+                first_row = records[first[ci]]
+                merged['counterparties'][cp_keys[ci]] = {
+                    'counterparty_inn': first_row.get('counterparty_inn'),
+                    'counterparty_name_full': first_row.get('counterparty_name_full'),
+                    'amount': amounts[ci],
+                    'count': counts[ci],
+                    'rows_used': used[ci],
+                    'reg_sets': reg_sets[ci],
+                }
+
+        # выборки регномеров короткие: идём по подходящим записям в исходном порядке до первых reg_limit
+        rows = (
+            r
+            for _, seg, r in heapq.merge(*(cell_rows[key] for key in matched), key=lambda x: x[0])
+            if seg == NAN_SEGMENT or seg_lo <= seg <= seg_hi
+        )
+        for agg_key, sample in zip(('reg_all', 'reg_customer', 'reg_supplier'), _reg_samples(rows, reg_limit)):
+            merged[agg_key] = {reg: (i, 0) for i, reg in enumerate(sample)}
+
+        merged['input_rows'] = len(records)
+        merged['invalid_numbers'] = invalid_numbers
+        results.append(finalize_aggregate(merged, filters, top_n=top_n, reg_limit=reg_limit))
+
+    return results
@@ -0,0 +1,123 @@
+from __future__ import annotations
+import os
+from dataclasses import dataclass
+import numpy as np
+
+IVF_FILES: tuple[str, ...] = ('ivf.centroids.npy', 'ivf.offsets.npy', 'ivf.ids.npy')
+
+# по скольку строк за раз назначаем векторы центроидам (ограничивает временную матрицу n x nlist)
+ASSIGN_BLOCK_ROWS: int = 16384
+
+
+@dataclass
+class IVFIndex:
+    # Inverted file: сферический k-means делит векторы на nlist списков,
+    # запрос сравнивается с центроидами и точно досчитывается только в nprobe ближайших списках.
+    centroids: np.ndarray
+    offsets: np.ndarray
+    ids: np.ndarray
+    nprobe: int = 8
+
+    @property
+    def nlist(self) -> int:
+        return int(self.centroids.shape[0])
+
+    def candidates(self, q_vec: np.ndarray, nprobe: int | None = None) -> np.ndarray:
+        p = min(max(1, nprobe or self.nprobe), self.nlist)
+        c_scores = self.centroids @ q_vec
+        probe = np.argpartition(-c_scores, kth=p - 1)[:p]
+        return np.concatenate([self.ids[self.offsets[c]: self.offsets[c + 1]] for c in probe])
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        q_vec: np.ndarray,
+        k: int,
+        nprobe: int | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        cand = self.candidates(q_vec, nprobe)
+        if cand.shape[0] == 0:
+            return cand, np.empty(0, dtype=np.float32)
+        cand.sort()
+
+        scores = np.asarray(vectors[cand], dtype=np.float32) @ q_vec
+        k_eff = min(k, int(cand.shape[0]))
+        top = np.argpartition(-scores, kth=k_eff - 1)[:k_eff]
+        top = top[np.argsort(-scores[top])]
+        return cand[top], scores[top]
+
+    def save(self, dir_path: str) -> None:
+        for name, arr in zip(IVF_FILES, (self.centroids, self.offsets, self.ids)):
+            tmp = os.path.join(dir_path, f'.{name}.tmp')
+            with open(tmp, 'wb') as f:
+                np.save(f, arr)
+            os.replace(tmp, os.path.join(dir_path, name))
+
+    @classmethod
+    def load(cls, dir_path: str, nprobe: int = 8) -> IVFIndex | None:
+        paths = [os.path.join(dir_path, name) for name in IVF_FILES]
+        if not all(os.path.exists(p) for p in paths):
+            return None
+        centroids, offsets, ids = (np.load(p) for p in paths)
+        return cls(centroids=centroids, offsets=offsets, ids=ids, nprobe=nprobe)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    n = int(vectors.shape[0])
+    labels = np.empty(n, dtype=np.int64)
+    for start in range(0, n, ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start: start + ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        labels[start: start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    return mat / np.where(norms == 0.0, 1.0, norms)
+
+
+def train_ivf(
+    vectors: np.ndarray,
+    nlist: int | None = None,
+    nprobe: int = 8,
+    iters: int = 20,
+    sample_per_list: int = 256,
+    seed: int = 0,
+) -> IVFIndex:
+    n = int(vectors.shape[0])
+    if n == 0:
+        raise ValueError('Нельзя построить IVF по пустой матрице')
+
+    if nlist is None:
+        nlist = int(4 * np.sqrt(n))
+    nlist = max(1, min(nlist, n))
+
+    rng = np.random.default_rng(seed)
+    train_n = min(n, nlist * sample_per_list)
+    train_idx = np.sort(rng.choice(n, size=train_n, replace=False))
+    train = np.asarray(vectors[train_idx], dtype=np.float32)
+
+    centroids = train[rng.choice(train_n, size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        labels = _assign(train, centroids)
+        counts = np.bincount(labels, minlength=nlist)
+
+        # суммы по кластерам через сортировку и reduceat (np.add.at на порядки медленнее)
+        order = np.argsort(labels, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        nonempty = counts > 0
+        sums[nonempty] = np.add.reduceat(train[order], starts[nonempty], axis=0)
+
+        empty = counts == 0
+        if empty.any():
+            # пустые списки пересеваем случайными точками, чтобы не терять nlist
+            sums[empty] = train[rng.choice(train_n, size=int(empty.sum()), replace=False)]
+        centroids = _normalize(sums).astype(np.float32)
+
+    labels = _assign(vectors, centroids)
+    order = np.argsort(labels, kind='stable')
+    counts = np.bincount(labels, minlength=nlist)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    return IVFIndex(centroids=centroids, offsets=offsets, ids=order.astype(np.int64), nprobe=nprobe)
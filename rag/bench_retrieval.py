@@ -0,0 +1,228 @@
+from __future__ import annotations
+import argparse
+import datetime as dt
+import json
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, List
+import numpy as np
+from rag.ann import train_ivf
+from rag.config import RAG_QUANTIZED_MIN_ROWS
+from rag.projection import PROJECTION_KINDS, fit_projection
+from rag.quantize import QUANTIZATION_KINDS, quantize, rescore_shortlist
+from rag.shards import shard_matrix
+
+DEFAULT_SIZES: List[int] = [1_000, 10_000, 100_000]
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0, n_clusters: int = 64) -> np.ndarray:
+    # кластеризованные единичные векторы: ближе к реальным эмбеддингам, чем равномерный шум
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    mat = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    mat /= np.linalg.norm(mat, axis=1, keepdims=True)
+    return mat.astype(np.float32)
+
+
+def synthetic_queries(vectors: np.ndarray, n_queries: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    base = vectors[rng.integers(0, vectors.shape[0], size=n_queries)]
+    q = base + 0.3 * rng.standard_normal(base.shape).astype(np.float32)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    return q.astype(np.float32)
+
+
+def exact_top_k(vectors: np.ndarray, q_vec: np.ndarray, k: int) -> np.ndarray:
+    scores = vectors @ q_vec
+    idx = np.argpartition(-scores, kth=k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+def recall_at_k(truth: List[np.ndarray], found: List[np.ndarray]) -> float:
+    hits = sum(len(set(t.tolist()) & set(f.tolist())) for t, f in zip(truth, found))
+    total = sum(len(t) for t in truth)
+    return hits / total if total else 1.0
+
+
+def _run(queries: np.ndarray, search: Callable[[np.ndarray], np.ndarray]) -> tuple[List[np.ndarray], float]:
+    found: List[np.ndarray] = []
+    t0 = time.perf_counter()
+    for q in queries:
+        found.append(search(q))
+    return found, (time.perf_counter() - t0) / max(1, len(queries))
+
+
+def bench_size(
+    n: int,
+    dim: int,
+    k: int,
+    n_queries: int,
+    rescore_factor: int,
+    seed: int,
+    nprobes: List[int] | None = None,
+    shard_counts: List[int] | None = None,
+    proj_dims: List[int] | None = None,
+    max_scan_ratio: float = 1.0,
+) -> List[Dict[str, Any]]:
+    vectors = synthetic_vectors(n, dim, seed=seed)
+    queries = synthetic_queries(vectors, n_queries, seed=seed + 1)
+
+    truth, exact_latency = _run(queries, lambda q: exact_top_k(vectors, q, k))
+    # scan_ms - только проход по матрице (очки всех строк), без top-k и пересчёта
+    _, exact_scan = _run(queries, lambda q: vectors @ q)
+    rows: List[Dict[str, Any]] = [{
+        'case': 'exact',
+        'size': n,
+        'dim': dim,
+        'k': k,
+        'recall_at_k': 1.0,
+        'latency_ms': exact_latency * 1000,
+        'scan_ms': exact_scan * 1000,
+        'index_bytes': int(vectors.nbytes),
+    }]
+
+    for kind in QUANTIZATION_KINDS:
+        qm = quantize(vectors, kind)
+
+        def search(q: np.ndarray, qm=qm) -> np.ndarray:
+            idx, _ = rescore_shortlist(vectors, qm.score(q), q, k, shortlist=k * rescore_factor)
+            return idx
+
+        found, latency = _run(queries, search)
+        _, scan = _run(queries, qm.score)
+        rows.append({
+            'case': f'{kind}+rescore',
+            'size': n,
+            'dim': dim,
+            'k': k,
+            'recall_at_k': recall_at_k(truth, found),
+            'latency_ms': latency * 1000,
+            'scan_ms': scan * 1000,
+            'scan_ratio': scan / exact_scan if exact_scan else None,
+            # Retriever сканирует квантованную матрицу только начиная с RAG_QUANTIZED_MIN_ROWS строк:
+            # там её скан не должен быть медленнее точного
+            'scan_slower': n >= RAG_QUANTIZED_MIN_ROWS and scan > exact_scan * max_scan_ratio,
+            'index_bytes': qm.nbytes,
+        })
+
+    for n_shards in shard_counts or []:
+        sharded = shard_matrix(vectors, n_shards)
+        found, latency = _run(queries, lambda q: sharded.topk(q[None, :], k)[0][0])
+        rows.append({
+            'case': f'sharded({len(sharded.shards)},workers={sharded.max_workers})',
+            'size': n,
+            'dim': dim,
+            'k': k,
+            'recall_at_k': recall_at_k(truth, found),
+            'latency_ms': latency * 1000,
+            'index_bytes': sharded.nbytes,
+        })
+
+    for proj_dim in proj_dims or []:
+        for kind in PROJECTION_KINDS:
+            t0 = time.perf_counter()
+            projection = fit_projection(vectors, kind, proj_dim, seed=seed)
+            reduced = projection.apply(vectors)
+            train_seconds = time.perf_counter() - t0
+            q_reduced = projection.apply(queries)
+
+            def search_reduced(i: int, rescore: bool) -> np.ndarray:
+                q = q_reduced[i]
+                if not rescore:
+                    return exact_top_k(reduced, q, k)
+                # shortlist по проекциям, затем точный пересчёт по исходным векторам
+                idx, _ = rescore_shortlist(vectors, reduced @ q, queries[i], k, shortlist=k * rescore_factor)
+                return idx
+
+            for rescore in (False, True):
+                found, latency = _run(np.arange(len(queries)), lambda i: search_reduced(int(i), rescore))
+                rows.append({
+                    'case': f'{kind}({projection.dim}){"+rescore" if rescore else ""}',
+                    'size': n,
+                    'dim': dim,
+                    'k': k,
+                    'recall_at_k': recall_at_k(truth, found),
+                    'latency_ms': latency * 1000,
+                    # исходная матрица при пересчёте лежит в mmap и читается только по строкам shortlist
+                    'index_bytes': int(reduced.nbytes),
+                    'train_seconds': train_seconds,
+                })
+
+    if nprobes:
+        t0 = time.perf_counter()
+        ivf = train_ivf(vectors, seed=seed)
+        train_seconds = time.perf_counter() - t0
+        ivf_bytes = int(ivf.centroids.nbytes + ivf.offsets.nbytes + ivf.ids.nbytes)
+
+        for nprobe in nprobes:
+            found, latency = _run(queries, lambda q: ivf.search(vectors, q, k, nprobe=nprobe)[0])
+            rows.append({
+                'case': f'ivf(nlist={ivf.nlist},nprobe={nprobe})',
+                'size': n,
+                'dim': dim,
+                'k': k,
+                'recall_at_k': recall_at_k(truth, found),
+                'latency_ms': latency * 1000,
+                'index_bytes': int(vectors.nbytes) + ivf_bytes,
+                'train_seconds': train_seconds,
+            })
+
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Бенчмарк поиска по векторному индексу: recall@k, задержка, размер')
+    parser.add_argument('--sizes', type=lambda s: [int(float(x)) for x in s.split(',')], default=DEFAULT_SIZES)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--k', type=int, default=6)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--rescore-factor', type=int, default=8)
+    parser.add_argument('--nprobe', type=lambda s: [int(x) for x in s.split(',') if x], default=[4, 16, 64],
+                        help='значения nprobe для IVF через запятую (пусто - не строить IVF)')
+    parser.add_argument('--shards', type=lambda s: [int(x) for x in s.split(',') if x], default=[4],
+                        help='число шардов для точного поиска по шардам через запятую (пусто - не мерить)')
+    parser.add_argument('--proj-dims', type=lambda s: [int(x) for x in s.split(',') if x], default=[256],
+                        help='размерности после проекции (truncate и pca) через запятую (пусто - не мерить); '
+                             'у синтетических векторов нет ни Matryoshka-, ни низкоранговой структуры реальных эмбеддингов, '
+                             'поэтому recall здесь - нижняя граница')
+    parser.add_argument('--max-scan-ratio', type=float, default=1.0,
+                        help='во сколько раз скан квантованной матрицы может быть медленнее точного, иначе ошибка')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='bench_retrieval.json')
+    args = parser.parse_args()
+
+    results: List[Dict[str, Any]] = []
+    for n in args.sizes:
+        for row in bench_size(n, args.dim, args.k, args.queries, args.rescore_factor, args.seed,
+                              args.nprobe, args.shards, args.proj_dims, args.max_scan_ratio):
+            results.append(row)
+            scan = f' scan={row["scan_ms"]:.2f}ms' if 'scan_ms' in row else ''
+            print(f'{row["case"]:<20} n={n:>8} recall@{args.k}={row["recall_at_k"]:.3f} '
+                  f'{row["latency_ms"]:.2f}ms{scan} {row["index_bytes"] / 2 ** 20:.1f}MB', file=sys.stderr)
+
+    report = {
+        'meta': {
+            'created_at': dt.datetime.now(dt.timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'OK: результаты сохранены в {args.out}')
+
+    slower = [row for row in results if row.get('scan_slower')]
+    for row in slower:
+        print(f'REGRESSION: {row["case"]} n={row["size"]} скан {row["scan_ms"]:.2f}ms, '
+              f'в {row["scan_ratio"]:.2f} раза медленнее точного', file=sys.stderr)
+    if slower:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
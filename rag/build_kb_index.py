@@ -1,28 +1,76 @@
 from __future__ import annotations
+import argparse
 import os
-from rag.embeddings import EmbeddingsClient
-from rag.index import build_vector_index
-from rag.knowledge_base import KNOWLEDGE_BASE
+import sys
+from rag.config import RAG_EMBED_CACHE_DIR
+from rag.embedding_cache import EmbeddingCache
+from rag.embeddings import EmbeddingsClient, create_embedder
+from rag.ingest import ingest_documents, ingest_pending, load_ingested, resolve_ingest_dir
+from rag.kb_index_store import (
+    current_version,
+    gc_versions,
+    list_versions,
+    pinned_version,
+    read_manifest,
+    rebuild_kb_index,
+    rollback_kb_index,
+)
+from rag.knowledge_base import load_knowledge_base
 
 
 def main() -> None:
-    out_dir = os.environ.get('RAG_INDEX_DIR') or 'rag/data/contracts_kb'
+    parser = argparse.ArgumentParser(description='Сборка и управление версиями индекса базы знаний')
+    parser.add_argument('--versions', action='store_true', help='показать версии индекса и выйти')
+    parser.add_argument('--rollback', nargs='?', const='', metavar='VERSION',
+                        help='переключиться на указанную (по умолчанию - предыдущую) версию')
+    parser.add_argument('--gc', action='store_true', help='удалить старые версии и выйти')
+    parser.add_argument('--ingest', metavar='SRC_DIR',
+                        help='нарезать и посчитать документы (.txt/.md) из папки и добавить их к базе знаний; '
+                             'прерванная загрузка продолжается с последнего батча')
+    args = parser.parse_args()
 
-    embedder = EmbeddingsClient()
+    out_dir = os.environ.get('RAG_INDEX_DIR') or 'rag/data/contracts_kb'
+    cache_dir = os.environ.get('RAG_EMBED_CACHE_DIR') or RAG_EMBED_CACHE_DIR
+    ingest_dir = resolve_ingest_dir()
 
-    items = KNOWLEDGE_BASE
-    texts = [item['text'].strip() for item in items]
+    if args.versions:
+        current = current_version(out_dir)
+        pinned = pinned_version(out_dir)
+        for v in list_versions(out_dir):
+            print(f'{"*" if v == current else " "} {v}{" (закреплена откатом)" if v == pinned else ""}')
+        return
+    if args.rollback is not None:
+        version = rollback_kb_index(out_dir, args.rollback or None)
+        print(f'OK: текущая версия индекса {version} (закреплена до следующей сборки)')
+        return
+    if args.gc:
+        removed = gc_versions(out_dir)
+        print(f'OK: удалено версий: {len(removed)}')
+        return
 
-    for i, t in enumerate(texts):
-        if not t:
-            raise ValueError(f'Empty chunk text at index={i}')
+    # локальная модель переобучается на текущей базе знаний при каждой сборке и публикуется вместе с версией индекса
+    embedder = create_embedder(refit=True, micro_batch=False)
+    if isinstance(embedder, EmbeddingsClient):
+        embedder.progress = lambda done, total: print(f'\rэмбеддинги: {done}/{total}', end='\n' if done == total else '', file=sys.stderr)
+    cache = EmbeddingCache(cache_dir, model=embedder.model)
 
-    vectors = embedder.embed_texts(texts)
+    if args.ingest:
+        stats = ingest_documents(args.ingest, ingest_dir, embedder)
+        print(f'документы: chunks={stats["rows"]} дубликатов={stats["duplicates"]} файлов={stats["files"]}', file=sys.stderr)
 
-    index = build_vector_index(items=items, vectors=vectors, model=embedder.model)
-    index.save(out_dir)
+    items = load_knowledge_base()
+    ingested = load_ingested(ingest_dir, model=embedder.model)
+    if ingested is None and ingest_pending(ingest_dir, model=embedder.model):
+        print(f'внимание: загрузка документов в {ingest_dir} не завершена, индекс собирается без них '
+              f'(продолжите её через --ingest)', file=sys.stderr)
+    index = rebuild_kb_index(out_dir, embedder, items=items, cache=cache, ingested=ingested)
 
-    print(f'OK: сохранили индексы в {out_dir} (chunks={len(items)} model={embedder.model})')
+    dedup = (read_manifest(out_dir) or {}).get('dedup')
+    if dedup and dedup['dropped']:
+        print(f'почти-дубликаты: кластеров={dedup["groups"]} убрано chunks={dedup["dropped"]} '
+              f'символов={dedup["dropped_chars"]}', file=sys.stderr)
+    print(f'OK: сохранили индексы в {out_dir} (версия={current_version(out_dir)} chunks={len(index.items)} model={embedder.model} '
+          f'из кэша={cache.hits} заново={cache.misses})')
 
 
 if __name__ == '__main__':
@@ -1,5 +1,76 @@
 from __future__ import annotations
+import os
 
 
 RAG_INDEX_DIR: str = 'rag/data/contracts_kb'
+# исходники базы знаний (JSONL); путь от пакета, чтобы не зависеть от текущей папки
+RAG_KB_DIR: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kb_data')
+# проверенная копия базы знаний (см. rag.knowledge_base) - рядом с индексом, а не в папке пакета
+RAG_KB_COMPILED_DIR: str = 'rag/data/kb_compiled'
 RAG_TOP_K: int = 6
+RAG_EMBED_CACHE_DIR: str = 'rag/data/embedding_cache'
+# потоковая загрузка документов (законы, письма, FAQ): рабочая папка с нарезанными chunks и векторами,
+# размер chunk и перекрытие соседних chunks в символах, сколько chunks эмбеддить и дописывать за раз
+RAG_INGEST_DIR: str = 'rag/data/ingest'
+RAG_CHUNK_CHARS: int = 1200
+RAG_CHUNK_OVERLAP: int = 200
+RAG_INGEST_BATCH: int = 256
+# почти-дубликаты при сборке индекса (MinHash + LSH): порог оценки Жаккара по шинглам из 3 стемов,
+# выше которого chunks схлопываются в один (None - выключено)
+RAG_DEDUP_THRESHOLD: float | None = 0.8
+# бэкенд эмбеддингов: 'openai' (API) или 'local' (n-граммы + TF-IDF + SVD, обучается на базе знаний)
+RAG_EMBED_BACKEND: str = 'openai'
+RAG_LOCAL_EMBED_PATH: str = 'rag/data/local_embedder.npz'
+RAG_LOCAL_EMBED_DIM: int = 256
+# микро-батчинг эмбеддингов запросов: окно ожидания соседних запросов (0 - выключено) и размер батча
+RAG_QUERY_BATCH_WINDOW_MS: float = 5.0
+RAG_QUERY_BATCH_MAX: int = 64
+# сколько секунд embed_query ждёт результат батча; дольше - ошибка, и retriever уходит в BM25
+RAG_QUERY_BATCH_TIMEOUT_S: float = 30.0
+# кэш эмбеддингов запросов: размер LRU (0 - выключен), TTL в секундах (None - без срока), файл (None - только память)
+RAG_QUERY_CACHE_SIZE: int = 1024
+RAG_QUERY_CACHE_TTL: float | None = 3600.0
+RAG_QUERY_CACHE_PATH: str | None = None
+# как часто сервис проверяет папку индекса на новую версию (0 - не следить)
+RAG_INDEX_POLL_SECONDS: float = 5.0
+# формат сохранения индекса: 'mmap' (быстрый старт, общий page cache), 'sharded' (mmap, разрезанный на шарды,
+# поиск по шардам параллельно) или 'npz'
+RAG_INDEX_FORMAT: str = 'mmap'
+# число шардов для формата 'sharded' и потоков поиска по ним (None - по числу CPU, но не больше шардов)
+RAG_INDEX_SHARDS: int = 4
+RAG_SHARD_WORKERS: int | None = None
+# сколько последних версий индекса хранить для отката (текущая хранится всегда)
+RAG_INDEX_KEEP_VERSIONS: int = 3
+# недостроенная папка версии (.tmp-*) удаляется, только если в ней ничего не менялось столько секунд:
+# более свежая может принадлежать сборке, которая идёт прямо сейчас в другом процессе
+RAG_INDEX_TMP_TTL: float = 6 * 3600.0
+# квантованная копия матрицы для первичного отбора: None или 'int8'
+RAG_INDEX_QUANTIZATION: str | None = None
+# меньше этого числа chunks квантованную копию не строим и не сканируем: пока матрица float32
+# помещается в кэш процессора, скан float32 быстрее расширения int8 блоками
+RAG_QUANTIZED_MIN_ROWS: int = 50_000
+# сколько кандидатов на каждый из top_k пересчитывать точно по float32 после квантованного отбора
+RAG_RESCORE_FACTOR: int = 8
+# понижение размерности индекса: None, 'truncate' (Matryoshka, для text-embedding-3-*) или 'pca' (обучается на базе знаний);
+# размерность после проекции и хранить ли исходные векторы (mmap) для точного пересчёта shortlist
+RAG_PROJECTION: str | None = None
+RAG_PROJECTION_DIM: int = 256
+RAG_PROJECTION_RESCORE: bool = True
+# приближённый поиск (ANN): None - только точный перебор, 'ivf' - IVF с k-means центроидами
+RAG_ANN: str | None = None
+# меньше этого числа chunks ANN не строим и не используем: точный перебор и так быстрый
+RAG_ANN_MIN_ROWS: int = 10_000
+# число списков IVF (None - 4 * sqrt(N)) и сколько ближайших списков просматривать на запрос
+RAG_IVF_NLIST: int | None = None
+RAG_IVF_NPROBE: int = 16
+# гибридный поиск: BM25 по chunks + dense, объединённые через reciprocal rank fusion
+RAG_HYBRID: bool = True
+# константа RRF и сколько кандидатов (в долях top_k) брать из каждого пути перед слиянием
+RAG_RRF_K: int = 60
+RAG_HYBRID_DEPTH: int = 4
+# сборка контекста для LLM: бюджет токенов, баланс релевантность/разнообразие MMR (1 - только релевантность),
+# сколько кандидатов (в долях top_k) отдавать в MMR и оценка символов на токен
+RAG_CONTEXT_TOKEN_BUDGET: int = 2000
+RAG_MMR_LAMBDA: float = 0.7
+RAG_MMR_CANDIDATES: int = 4
+RAG_CHARS_PER_TOKEN: float = 3.0
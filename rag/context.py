@@ -0,0 +1,33 @@
+from __future__ import annotations
+import math
+from typing import List
+import numpy as np
+
+CONTEXT_SEPARATOR = '\n\n---\n\n'
+
+
+def estimate_tokens(text: str, chars_per_token: float = 3.0) -> int:
+    # грубая оценка без токенизатора: для русского текста в cl100k выходит ~2.5-3.5 символа на токен
+    return max(1, math.ceil(len(text) / chars_per_token)) if text else 0
+
+
+def mmr_order(candidates: np.ndarray, relevance: np.ndarray, lam: float = 0.7) -> List[int]:
+    # Maximal Marginal Relevance: на каждом шаге берём кандидата с max lam * rel - (1 - lam) * max_sim(выбранные).
+    # Все попарные сходства считаются одним матричным умножением.
+    m = int(candidates.shape[0])
+    if m == 0:
+        return []
+
+    sim = candidates @ candidates.T
+    max_sim = np.full(m, -np.inf, dtype=np.float32)
+    taken = np.zeros(m, dtype=bool)
+    order: List[int] = []
+    for _ in range(m):
+        penalty = np.where(np.isfinite(max_sim), max_sim, 0.0)
+        mmr = lam * relevance - (1.0 - lam) * penalty
+        mmr[taken] = -np.inf
+        j = int(np.argmax(mmr))
+        order.append(j)
+        taken[j] = True
+        max_sim = np.maximum(max_sim, sim[j])
+    return order
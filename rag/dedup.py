@@ -0,0 +1,159 @@
+from __future__ import annotations
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence, Tuple
+import numpy as np
+from rag.lexical import analyze
+
+# MinHash: для каждой из num_perm хэш-функций h(x) = (a * x + b) mod p берём минимум по шинглам chunk.
+# Доля совпавших позиций двух сигнатур - оценка коэффициента Жаккара их множеств шинглов.
+# LSH: сигнатура режется на bands полос; chunks с совпавшей хотя бы одной полосой - кандидаты,
+# кандидаты проверяются по оценке Жаккара с представителем кластера.
+_PRIME = np.uint64((1 << 32) + 15)
+_SEED = 20240611
+
+
+def shingles(text: str, size: int = 3) -> np.ndarray:
+    # шинглы из стемов: "ставка НДС 20%" и "ставки НДС 20%" дают одинаковые шинглы
+    terms = analyze(text)
+    if len(terms) <= size:
+        grams = [' '.join(terms)] if terms else []
+    else:
+        grams = [' '.join(terms[i: i + size]) for i in range(len(terms) - size + 1)]
+    return np.unique(np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint64, count=len(grams)))
+
+
+def minhash_signatures(texts: Sequence[str], num_perm: int = 128, shingle_size: int = 3) -> np.ndarray:
+    return _signatures_and_lengths(texts, num_perm, shingle_size)[0]
+
+
+def _signatures_and_lengths(texts: Sequence[str], num_perm: int, shingle_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    # один проход по texts: у ленивых последовательностей (LazyItems) каждое обращение - чтение и разбор строки
+    rng = np.random.default_rng(_SEED)
+    a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    out = np.full((len(texts), num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+    lengths = np.zeros(len(texts), dtype=np.int64)
+    for i, text in enumerate(texts):
+        lengths[i] = len(text)
+        sh = shingles(text, shingle_size)
+        if sh.shape[0]:
+            # a, x < 2^32 => a * x + b < 2^64, переполнения uint64 нет
+            out[i] = ((np.outer(sh, a) + b) % _PRIME).min(axis=0).astype(np.uint32)
+    return out, lengths
+
+
+def near_duplicate_groups(
+    texts: Sequence[str],
+    threshold: float = 0.85,
+    num_perm: int = 128,
+    bands: int = 32,
+) -> List[List[int]]:
+    if num_perm % bands:
+        raise ValueError('num_perm должно делиться на bands')
+
+    sig, lengths = _signatures_and_lengths(texts, num_perm, 3)
+    rows = num_perm // bands
+    # rep[i] - представитель кластера i (-1 - пока ни в одном). Кластер не транзитивен: каждый новый член
+    # сравнивается с представителем, а не с тем, через кого нашёлся (A~B и B~C не склеивают A с C).
+    # Chunks идут от длинных к коротким, поэтому представитель - самый длинный в кластере, его и оставит collapse.
+    rep = [-1] * len(texts)
+    order = np.lexsort((np.arange(len(texts)), -lengths)).tolist()
+
+    for band in range(bands):
+        buckets: Dict[bytes, int] = {}
+        chunk = np.ascontiguousarray(sig[:, band * rows: (band + 1) * rows])
+        for i in order:
+            key = chunk[i].tobytes()
+            first = buckets.setdefault(key, i)
+            # сравниваем с представителем первого в корзине, а не попарно: большие корзины (шаблонный текст) не дают O(n^2)
+            if first == i or rep[i] != -1:
+                continue
+            r = first if rep[first] == -1 else rep[first]
+            if float(np.mean(sig[r] == sig[i])) >= threshold:
+                rep[r] = r
+                rep[i] = r
+
+    groups: Dict[int, List[int]] = {}
+    for i, r in enumerate(rep):
+        if r != -1:
+            groups.setdefault(r, []).append(i)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def _merge_metadata(items: Sequence[dict[str, Any]]) -> Dict[str, Any]:
+    # значения, которые у дубликатов различаются, становятся списками - фильтр по любому из них найдёт chunk
+    merged: Dict[str, List[Any]] = {}
+    for item in items:
+        metadata = item.get('metadata')
+        if not isinstance(metadata, dict):
+            continue
+        for key, value in metadata.items():
+            values = merged.setdefault(key, [])
+            for v in value if isinstance(value, list) else [value]:
+                if v not in values:
+                    values.append(v)
+    return {k: v[0] if len(v) == 1 else v for k, v in merged.items()}
+
+
+class KeptItems(Sequence):
+    # оставшиеся chunks без копирования: items[keep[i]] или объединённый представитель кластера
+    def __init__(self, items: Sequence[dict[str, Any]], keep: np.ndarray, replaced: Dict[int, dict[str, Any]]) -> None:
+        self._items = items
+        self._keep = keep
+        self._replaced = replaced
+
+    def __len__(self) -> int:
+        return int(self._keep.shape[0])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        row = int(self._keep[i])
+        item = self._replaced.get(row)
+        return item if item is not None else self._items[row]
+
+
+@dataclass
+class DedupReport:
+    keep: np.ndarray
+    items: Sequence[dict[str, Any]]
+    groups: List[List[int]] = field(default_factory=list)
+    dropped: int = 0
+    dropped_chars: int = 0
+
+    def summary(self) -> Dict[str, Any]:
+        return {'groups': len(self.groups), 'dropped': self.dropped, 'dropped_chars': self.dropped_chars}
+
+
+def collapse_near_duplicates(
+    items: Sequence[dict[str, Any]],
+    texts: Sequence[str],
+    threshold: float = 0.85,
+) -> DedupReport:
+    # из кластера остаётся представитель - самый длинный chunk (при равенстве - первый), metadata объединяется,
+    # chunk_id выброшенных сохраняются в поле duplicates представителя
+    groups = near_duplicate_groups(texts, threshold=threshold)
+
+    replaced: Dict[int, dict[str, Any]] = {}
+    drop: set[int] = set()
+    dropped_chars = 0
+    for group in groups:
+        rep = max(group, key=lambda i: (len(texts[i]), -i))
+        others = [i for i in group if i != rep]
+        item = dict(items[rep])
+        item['metadata'] = _merge_metadata([items[i] for i in group])
+        item['duplicates'] = [*item.get('duplicates', []), *(items[i]['chunk_id'] for i in others)]
+        replaced[rep] = item
+        drop.update(others)
+        dropped_chars += sum(len(texts[i]) for i in others)
+
+    keep = np.setdiff1d(np.arange(len(items), dtype=np.int64), np.fromiter(drop, dtype=np.int64, count=len(drop)))
+    return DedupReport(
+        keep=keep,
+        items=KeptItems(items, keep, replaced),
+        groups=groups,
+        dropped=len(drop),
+        dropped_chars=dropped_chars,
+    )
@@ -0,0 +1,120 @@
+from __future__ import annotations
+import hashlib
+import logging
+import os
+import re
+import zipfile
+from typing import Dict, Iterable, List
+import numpy as np
+from rag.embeddings import EmbeddingBackend
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = 'cache.npz'
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.strip().encode('utf-8')).hexdigest()
+
+
+def _model_dir(model: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', model)
+
+
+class EmbeddingCache:
+    # Кэш эмбеддингов на диске: ключ = (модель, sha256 текста chunk).
+    # Для каждой модели своя папка с одним cache.npz: ключи, векторы и модель в одном файле,
+    # поэтому подмена через os.replace не может оставить ключи от одной записи, а векторы от другой.
+    def __init__(self, dir_path: str, model: str) -> None:
+        self.model = model
+        self.dir_path = os.path.join(dir_path, _model_dir(model))
+        self._vectors: Dict[str, np.ndarray] = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._vectors
+
+    def _load(self) -> None:
+        path = os.path.join(self.dir_path, CACHE_FILE)
+        if not os.path.exists(path):
+            return
+        try:
+            with np.load(path) as data:
+                model = str(data['model'])
+                keys = [k.decode('ascii') for k in data['keys'].tolist()]
+                mat = data['vectors']
+            if mat.ndim != 2 or mat.shape[0] != len(keys):
+                raise ValueError(f'ключей {len(keys)}, векторов {mat.shape[0] if mat.ndim else 0}')
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            # кэш - только ускорение: битый файл не должен ломать сборку индекса
+            logger.warning('Кэш эмбеддингов повреждён, начинаем с пустого (%s): %s', self.dir_path, e)
+            return
+
+        if model != self.model:
+            return
+        self._vectors = {k: mat[i] for i, k in enumerate(keys)}
+
+    def get(self, text: str) -> np.ndarray | None:
+        vec = self._vectors.get(text_key(text))
+        if vec is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return vec
+
+    def put(self, text: str, vector: Iterable[float]) -> None:
+        self._vectors[text_key(text)] = np.asarray(vector, dtype=np.float32)
+        self._dirty = True
+
+    def prune(self, keep_keys: Iterable[str]) -> int:
+        keep = set(keep_keys)
+        stale = [k for k in self._vectors if k not in keep]
+        for k in stale:
+            del self._vectors[k]
+        if stale:
+            self._dirty = True
+        return len(stale)
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+
+        os.makedirs(self.dir_path, exist_ok=True)
+        keys = list(self._vectors.keys())
+        mat = np.stack([self._vectors[k] for k in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+
+        # один временный файл и один os.replace: кэш на диске либо старый, либо новый целиком
+        tmp = os.path.join(self.dir_path, '.cache.tmp.npz')
+        np.savez(
+            tmp,
+            model=np.array(self.model),
+            keys=np.array([k.encode('ascii') for k in keys], dtype='S64'),
+            vectors=mat.astype(np.float32),
+        )
+        os.replace(tmp, os.path.join(self.dir_path, CACHE_FILE))
+        self._dirty = False
+
+
+def embed_with_cache(texts: List[str], embedder: EmbeddingBackend, cache: EmbeddingCache | None) -> List[np.ndarray | List[float]]:
+    if cache is None:
+        return embedder.embed_texts(texts)
+
+    out: List[np.ndarray | List[float] | None] = [cache.get(t) for t in texts]
+    missing = [i for i, v in enumerate(out) if v is None]
+
+    if missing:
+        # одинаковые тексты отправляем в API один раз
+        unique = list(dict.fromkeys(texts[i].strip() for i in missing))
+        fresh = dict(zip(unique, embedder.embed_texts(unique)))
+        for i in missing:
+            vec = fresh[texts[i].strip()]
+            cache.put(texts[i], vec)
+            out[i] = vec
+
+    return out
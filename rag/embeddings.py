@@ -1,52 +1,289 @@
 from __future__ import annotations
-from typing import List
+from typing import Callable, List, Protocol
+import logging
 import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from openai import OpenAI
+from rag.config import (
+    RAG_EMBED_BACKEND,
+    RAG_LOCAL_EMBED_DIM,
+    RAG_LOCAL_EMBED_PATH,
+    RAG_QUERY_BATCH_MAX,
+    RAG_QUERY_BATCH_TIMEOUT_S,
+    RAG_QUERY_BATCH_WINDOW_MS,
+)
+from rag.knowledge_base import load_knowledge_base
+from rag.local_embeddings import load_or_fit_local_embedder
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBackend(Protocol):
+    # общий интерфейс: OpenAI API или локальная модель; model попадает в meta.json индекса
+    @property
+    def model(self) -> str: ...
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]: ...
+
+    # запросы пользователя: короткий бюджет повторов, чтобы retriever быстро ушёл в BM25
+    def embed_queries(self, queries: List[str]) -> List[List[float]]: ...
+
+    def embed_query(self, query: str) -> List[float]: ...
 
 @dataclass(frozen=True)
 class EmbeddingConfig:
     model: str = 'text-embedding-3-small'
     batch_size: int = 128
+    # сколько батчей отправляется в API одновременно
+    max_workers: int = 4
+    # повторы батча при сетевых ошибках, 429 и 5xx: экспоненциальная задержка с джиттером
+    max_retries: int = 5
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+    # для запросов пользователя (embed_query/embed_queries): пользователь ждёт, а у retriever есть BM25
+    query_max_retries: int = 1
+    query_backoff_max: float = 1.0
 
 
 class EmbeddingsClient:
-    def __init__(self, api_key: str | None = None, config: EmbeddingConfig | None = None) -> None:
+    def __init__(
+        self,
+        api_key: str | None = None,
+        config: EmbeddingConfig | None = None,
+        progress: Callable[[int, int], None] | None = None,
+    ) -> None:
         api_key_f = api_key or os.environ.get('OPENAI_API_KEY')
         if not api_key_f:
             raise RuntimeError('Не установлен OPENAI_API_KEY')
 
-        self._client = OpenAI(api_key=api_key_f)
+        # openai нужен только этому бэкенду: локальный работает без пакета и без сети
+        from openai import OpenAI
+
+        # повторы делаем сами (по батчу), встроенные в клиент отключаем, чтобы задержки не перемножались
+        self._client = OpenAI(api_key=api_key_f, max_retries=0)
         self._config = config or EmbeddingConfig()
+        # progress(готово_текстов, всего_текстов) вызывается после каждого батча
+        self.progress = progress
 
     @property
     def model(self) -> str:
         return self._config.model
 
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+    def _embed_batch(self, batch: List[str], query: bool = False) -> List[List[float]]:
+        from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+        cfg = self._config
+        max_retries = cfg.query_max_retries if query else cfg.max_retries
+        backoff_max = cfg.query_backoff_max if query else cfg.backoff_max
+        attempt = 0
+        while True:
+            try:
+                result = self._client.embeddings.create(
+                    model=cfg.model,
+                    input=batch
+                )
+                return [row.embedding for row in result.data]
+            except (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError) as e:
+                if attempt >= max_retries:
+                    raise
+                delay = min(backoff_max, cfg.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning('Ошибка API эмбеддингов (%s), повтор %d/%d через %.1f с',
+                               type(e).__name__, attempt + 1, max_retries, delay)
+                time.sleep(delay)
+                attempt += 1
+
+    def embed_texts(self, texts: List[str], query: bool = False) -> List[List[float]]:
         if not texts:
             return []
 
-        vectors: List[List[float]] = []
         bs = max(1, self._config.batch_size)
+        batches: List[List[str]] = []
         for i in range(0, len(texts), bs):
             batch = texts[i: i+bs]
             batch = [t.strip() for t in batch]
             for t in batch:
                 if not t:
                     raise ValueError('Нельзя получить embedding для пустой строки')
+            batches.append(batch)
 
-            result = self._client.embeddings.create(
-                model=self._config.model,
-                input=batch
-            )
-            vectors.extend([row.embedding for row in result.data])
+        if len(batches) == 1:
+            return self._embed_batch(batches[0], query=query)
+
+        total = len(texts)
+        done = 0
+        t0 = time.perf_counter()
+
+        def report(n: int) -> None:
+            nonlocal done
+            done += n
+            if self.progress is not None:
+                self.progress(done, total)
 
+        # батчи уходят параллельно, результаты собираются в исходном порядке
+        results: List[List[List[float]] | None] = [None] * len(batches)
+        workers = max(1, min(self._config.max_workers, len(batches)))
+        pool = ThreadPoolExecutor(max_workers=workers)
+        futures = {pool.submit(self._embed_batch, b, query): i for i, b in enumerate(batches)}
+        try:
+            for fut in as_completed(futures):
+                i = futures[fut]
+                results[i] = fut.result()
+                report(len(batches[i]))
+        except BaseException:
+            # первый упавший батч (после своих повторов) - ошибка всего вызова: не ждём и не отправляем остальные
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
+
+        elapsed = time.perf_counter() - t0
+        logger.info('Эмбеддинги: %d текстов, %d батчей, %.1f с (%.0f текстов/с)',
+                    total, len(batches), elapsed, total / elapsed if elapsed else float('inf'))
+
+        vectors: List[List[float]] = []
+        for part in results:
+            vectors.extend(part)
         return vectors
 
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        return self.embed_texts(queries, query=True)
+
+    def embed_query(self, query: str) -> List[float]:
+        q = (query or '').strip()
+        if not q:
+            raise ValueError('Пустой запрос')
+        return self.embed_queries([q])[0]
+
+
+class QueryMicroBatcher:
+    # Собирает одновременные embed_query из разных потоков в один вызов embed_texts.
+    # Рабочий поток берёт первый запрос и ждёт остальных не дольше window_ms или до max_batch;
+    # если все активные вызывающие уже в батче, отправляет сразу, чтобы одиночный запрос не ждал окно.
+    def __init__(
+        self,
+        backend: EmbeddingBackend,
+        window_ms: float = 5.0,
+        max_batch: int = 64,
+        timeout_s: float | None = 30.0,
+    ) -> None:
+        self._backend = backend
+        self._window = max(0.0, window_ms) / 1000.0
+        self._max_batch = max(1, max_batch)
+        self._timeout = timeout_s
+        self._queue: queue.Queue[tuple[str, Future]] = queue.Queue()
+        self._active = 0
+        self._lock = threading.Lock()
+        self._worker: threading.Thread | None = None
+        self.requests = 0
+        self.batches = 0
+
+    @property
+    def model(self) -> str:
+        return self._backend.model
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        return self._backend.embed_texts(texts)
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        return self._backend.embed_queries(queries)
 
     def embed_query(self, query: str) -> List[float]:
         q = (query or '').strip()
         if not q:
             raise ValueError('Пустой запрос')
-        return self.embed_texts([q])[0]
\ No newline at end of file
+
+        fut: Future = Future()
+        with self._lock:
+            self._active += 1
+            # поток перезапускается, если упал: иначе все следующие запросы ждали бы вечно
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='rag-query-batcher', daemon=True)
+                self._worker.start()
+        try:
+            self._queue.put((q, fut))
+            return fut.result(timeout=self._timeout)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _run(self) -> None:
+        while True:
+            pending = [self._queue.get()]
+            try:
+                deadline = time.monotonic() + self._window
+                while len(pending) < self._max_batch:
+                    with self._lock:
+                        everyone_here = self._active <= len(pending)
+                    if everyone_here and self._queue.empty():
+                        break
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        pending.append(self._queue.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                self._flush(pending)
+            except BaseException as e:
+                # ошибка одного батча не должна останавливать поток: отдаём её ожидающим и работаем дальше
+                logger.exception('Ошибка микро-батча эмбеддингов запросов')
+                self._fail(pending, e)
+
+    @staticmethod
+    def _fail(pending: List[tuple[str, Future]], error: BaseException) -> None:
+        for _, fut in pending:
+            if not fut.done():
+                fut.set_exception(error)
+
+    def _flush(self, pending: List[tuple[str, Future]]) -> None:
+        unique = list(dict.fromkeys(q for q, _ in pending))
+        try:
+            vectors = self._backend.embed_queries(unique)
+            if len(vectors) != len(unique):
+                raise RuntimeError(f'Бэкенд вернул {len(vectors)} векторов на {len(unique)} запросов')
+            by_query = dict(zip(unique, vectors))
+
+            self.requests += len(pending)
+            self.batches += 1
+            for q, fut in pending:
+                # вызывающий мог уже уйти по таймауту
+                if not fut.done():
+                    fut.set_result(by_query[q])
+        except BaseException as e:
+            self._fail(pending, e)
+
+
+def create_embedder(
+    backend: str | None = None,
+    refit: bool = False,
+    micro_batch: bool = True,
+    index_dir: str | None = None,
+) -> EmbeddingBackend:
+    backend = backend or os.environ.get('RAG_EMBED_BACKEND') or RAG_EMBED_BACKEND
+    if backend == 'openai':
+        client = EmbeddingsClient()
+        # локальному бэкенду батчинг не нужен: там нет сетевого round trip
+        if micro_batch and RAG_QUERY_BATCH_WINDOW_MS > 0:
+            return QueryMicroBatcher(
+                client,
+                window_ms=RAG_QUERY_BATCH_WINDOW_MS,
+                max_batch=RAG_QUERY_BATCH_MAX,
+                timeout_s=RAG_QUERY_BATCH_TIMEOUT_S,
+            )
+        return client
+    if backend == 'local':
+        # kb_index_store сам импортирует этот модуль, поэтому импорт здесь
+        from rag.kb_index_store import resolve_index_dir
+
+        path = os.environ.get('RAG_LOCAL_EMBED_PATH') or RAG_LOCAL_EMBED_PATH
+        return load_or_fit_local_embedder(
+            path,
+            lambda: [item['text'] for item in load_knowledge_base()],
+            dim=RAG_LOCAL_EMBED_DIM,
+            refit=refit,
+            model_dir=resolve_index_dir(index_dir) if index_dir is not None else None,
+        )
+    raise ValueError(f'Неизвестный бэкенд эмбеддингов: {backend}')
@@ -1,20 +1,135 @@
 from __future__ import annotations
 import json
+import mmap
 import os
+import shutil
 from dataclasses import dataclass
-from typing import Any, List
+from typing import Any, Iterator, List, Sequence
 import numpy as np
+from rag.ann import IVF_FILES, IVFIndex
+from rag.config import RAG_SHARD_WORKERS
+from rag.lexical import LEXICAL_FILES, BM25Index
+from rag.metadata_filter import METADATA_FILES, MetadataBitmaps
+from rag.projection import PROJECTION_FILES, Projection
+from rag.quantize import QuantizedMatrix, quantization_files
+from rag.shards import SHARDS_DIR, SHARDS_META, ShardedMatrix, shard_matrix
+
+# npz: сжатая матрица + meta.json со всеми текстами (исходный формат).
+# mmap: сырая матрица vectors.npy (открывается через np.load(mmap_mode='r')),
+#       items.jsonl + items.idx.npy со смещениями строк для ленивого чтения chunks.
+# sharded: как mmap, но матрица разрезана на шарды shards/vectors-NNN.npy (см. rag.shards).
+INDEX_FILES: dict[str, tuple[str, ...]] = {
+    'npz': ('vectors.npz', 'meta.json'),
+    'mmap': ('vectors.npy', 'items.jsonl', 'items.idx.npy', 'meta.json'),
+    'sharded': (SHARDS_META, 'items.jsonl', 'items.idx.npy', 'meta.json'),
+}
+
+
+def detect_index_format(dir_path: str) -> str | None:
+    for fmt in ('sharded', 'mmap', 'npz'):
+        if all(os.path.exists(os.path.join(dir_path, name)) for name in INDEX_FILES[fmt]):
+            return fmt
+    return None
+
+
+class LazyItems(Sequence):
+    # chunks читаются из items.jsonl по смещениям только при обращении и не кэшируются:
+    # проход по всем chunks (сборка индекса, дедупликация) не держит их в памяти
+    def __init__(self, path: str, offsets: np.ndarray) -> None:
+        self._path = path
+        self._offsets = offsets
+        self._mm: mmap.mmap | None = None
+
+    def __len__(self) -> int:
+        return int(self._offsets.shape[0]) - 1
+
+    def _buffer(self) -> mmap.mmap:
+        if self._mm is None:
+            with open(self._path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(i)
+
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return json.loads(self._buffer()[start:end].decode('utf-8'))
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+def _stored_in(mat: Any, path: str) -> bool:
+    # матрица уже лежит в этом файле (собрана через np.lib.format.open_memmap) - переписывать её не нужно
+    return isinstance(mat, np.memmap) and mat.filename is not None and os.path.abspath(mat.filename) == os.path.abspath(path)
 
 
 @dataclass
 class VectorIndex:
-    vectors: np.ndarray
-    items: List[dict[str, Any]]
+    vectors: np.ndarray | ShardedMatrix
+    items: Sequence[dict[str, Any]]
     model: str
+    quantized: QuantizedMatrix | None = None
+    ann: IVFIndex | None = None
+    lexical: BM25Index | None = None
+    bitmaps: MetadataBitmaps | None = None
+    # при понижении размерности vectors - проекции, full_vectors - исходные векторы для пересчёта shortlist
+    projection: Projection | None = None
+    full_vectors: np.ndarray | None = None
+
+    def metadata_bitmaps(self) -> MetadataBitmaps:
+        # старые индексы без metadata_bitmaps.npz: строим маски при первом фильтре
+        if self.bitmaps is None:
+            self.bitmaps = MetadataBitmaps.build(self.items)
+        return self.bitmaps
+
+    def save(self, dir_path: str, fmt: str = 'npz', n_shards: int = 1) -> None:
+        if fmt not in INDEX_FILES:
+            raise ValueError(f'Неизвестный формат индекса: {fmt}')
 
-    def save(self, dir_path: str) -> None:
         os.makedirs(dir_path, exist_ok=True)
 
+        # файлы другого формата удаляем, чтобы detect_index_format не подхватил устаревшие
+        keep = set(INDEX_FILES[fmt])
+        for other in INDEX_FILES.values():
+            for name in other:
+                path = os.path.join(dir_path, name)
+                if name not in keep and os.path.exists(path):
+                    os.remove(path)
+        for name in [*quantization_files(), *IVF_FILES, *LEXICAL_FILES, *METADATA_FILES, *PROJECTION_FILES]:
+            path = os.path.join(dir_path, name)
+            if os.path.exists(path) and not _stored_in(self.full_vectors, path):
+                os.remove(path)
+        if fmt != 'sharded':
+            shutil.rmtree(os.path.join(dir_path, SHARDS_DIR), ignore_errors=True)
+
+        if self.quantized is not None:
+            self.quantized.save(dir_path)
+        if self.ann is not None:
+            self.ann.save(dir_path)
+        if self.lexical is not None:
+            self.lexical.save(dir_path)
+        self.metadata_bitmaps().save(dir_path)
+        if self.projection is not None:
+            self.projection.save(dir_path)
+        if self.full_vectors is not None and not _stored_in(self.full_vectors, os.path.join(dir_path, 'vectors.full.npy')):
+            tmp_full = os.path.join(dir_path, '.vectors.full.npy.tmp')
+            with open(tmp_full, 'wb') as f:
+                np.save(f, np.ascontiguousarray(self.full_vectors, dtype=np.float32))
+            os.replace(tmp_full, os.path.join(dir_path, 'vectors.full.npy'))
+
+        if fmt in ('mmap', 'sharded'):
+            self._save_mmap(dir_path, n_shards=n_shards if fmt == 'sharded' else None)
+            return
+
         np.savez_compressed(
             os.path.join(dir_path, 'vectors.npz'),
             vectors=self.vectors.astype(np.float32),
@@ -24,31 +139,130 @@ class VectorIndex:
             'model': self.model,
             'size': int(self.vectors.shape[0]),
             'dim': int(self.vectors.shape[1]),
-            'items': self.items,
+            **self._projection_meta(),
+            'items': list(self.items),
         }
         with open(os.path.join(dir_path, 'meta.json'), 'w', encoding='utf-8') as f:
             json.dump(meta, f, ensure_ascii=False, indent=2)
 
+    def _projection_meta(self) -> dict[str, Any]:
+        # dim - размерность, по которой идёт поиск; full_dim - размерность модели эмбеддингов
+        if self.projection is None:
+            return {}
+        return {
+            'full_dim': self.projection.full_dim,
+            'projection': self.projection.kind,
+            'full_vectors': self.full_vectors is not None,
+        }
+
+    def _save_mmap(self, dir_path: str, n_shards: int | None = None) -> None:
+        # Каждый файл пишем во временный и подменяем через os.replace: процессы, у которых
+        # старый vectors.npy открыт через mmap, продолжают читать прежний inode.
+        def tmp(name: str) -> str:
+            return os.path.join(dir_path, f'.{name}.tmp')
+
+        written: set[str] = set()
+        if n_shards is not None:
+            vectors = self.vectors
+            if not isinstance(vectors, ShardedMatrix) or len(vectors.shards) != n_shards:
+                vectors = shard_matrix(np.asarray(vectors, dtype=np.float32), n_shards)
+            vectors.save(dir_path)
+        elif _stored_in(self.vectors, os.path.join(dir_path, 'vectors.npy')):
+            written.add('vectors.npy')
+        else:
+            with open(tmp('vectors.npy'), 'wb') as f:
+                np.save(f, np.ascontiguousarray(self.vectors, dtype=np.float32))
+
+        offsets = [0]
+        with open(tmp('items.jsonl'), 'wb') as f:
+            for item in self.items:
+                line = (json.dumps(item, ensure_ascii=False) + '\n').encode('utf-8')
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+        with open(tmp('items.idx.npy'), 'wb') as f:
+            np.save(f, np.array(offsets, dtype=np.int64))
+
+        meta = {
+            'format': 'mmap' if n_shards is None else 'sharded',
+            'model': self.model,
+            'size': int(self.vectors.shape[0]),
+            'dim': int(self.vectors.shape[1]),
+            **self._projection_meta(),
+        }
+        with open(tmp('meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        for name in INDEX_FILES['mmap' if n_shards is None else 'sharded']:
+            if name != SHARDS_META and name not in written:
+                os.replace(tmp(name), os.path.join(dir_path, name))
+
     @classmethod
     def load(cls, dir_path: str) -> VectorIndex:
-        vec_path = os.path.join(dir_path, 'vectors.npz')
-        meta_path = os.path.join(dir_path, 'meta.json')
-
-        if not os.path.exists(vec_path) or not os.path.exists(meta_path):
+        fmt = detect_index_format(dir_path)
+        if fmt is None:
             raise FileNotFoundError(f'Файлы не найдены по этому пути: {dir_path}')
 
-        data = np.load(vec_path)
-        vectors = data['vectors'].astype(np.float32)
-
-        with open(meta_path, 'r', encoding='utf-8') as f:
+        with open(os.path.join(dir_path, 'meta.json'), 'r', encoding='utf-8') as f:
             meta = json.load(f)
 
         model = meta.get('model')
-        items = meta.get('items')
-        if not isinstance(model, str) or not isinstance(items, list):
+        if fmt in ('mmap', 'sharded'):
+            if fmt == 'sharded':
+                vectors = ShardedMatrix.load(dir_path, max_workers=RAG_SHARD_WORKERS)
+            else:
+                vectors = np.load(os.path.join(dir_path, 'vectors.npy'), mmap_mode='r')
+            offsets = np.load(os.path.join(dir_path, 'items.idx.npy'))
+            items: Sequence[dict[str, Any]] = LazyItems(os.path.join(dir_path, 'items.jsonl'), offsets)
+        else:
+            with np.load(os.path.join(dir_path, 'vectors.npz')) as data:
+                vectors = data['vectors'].astype(np.float32)
+            items = meta.get('items')
+
+        if not isinstance(model, str) or not isinstance(items, (list, LazyItems)):
             raise ValueError('Неправильный meta.json')
+        if vectors.ndim != 2 or vectors.shape[0] != len(items):
+            raise ValueError(f'Матрица векторов и chunks не согласованы: {dir_path}')
+        if vectors.dtype != np.float32:
+            raise ValueError(f'Ожидалась матрица float32: {dir_path}')
+
+        quantized = QuantizedMatrix.load(dir_path, mmap=fmt != 'npz')
+        if quantized is not None and quantized.data.shape != vectors.shape:
+            raise ValueError(f'Квантованная матрица не согласована с основной: {dir_path}')
+
+        ann = IVFIndex.load(dir_path)
+        if ann is not None and int(ann.ids.shape[0]) != int(vectors.shape[0]):
+            raise ValueError(f'IVF-индекс не согласован с основной матрицей: {dir_path}')
 
-        return cls(vectors=vectors, items=items, model=model)
+        lexical = BM25Index.load(dir_path)
+        if lexical is not None and lexical.size != int(vectors.shape[0]):
+            raise ValueError(f'BM25-индекс не согласован с chunks: {dir_path}')
+
+        bitmaps = MetadataBitmaps.load(dir_path)
+        if bitmaps is not None and bitmaps.size != int(vectors.shape[0]):
+            raise ValueError(f'Маски metadata не согласованы с chunks: {dir_path}')
+
+        projection = Projection.load(dir_path)
+        if projection is not None and projection.dim != int(vectors.shape[1]):
+            raise ValueError(f'Проекция не согласована с матрицей векторов: {dir_path}')
+
+        full_vectors = None
+        full_path = os.path.join(dir_path, 'vectors.full.npy')
+        if projection is not None and os.path.exists(full_path):
+            full_vectors = np.load(full_path, mmap_mode='r' if fmt != 'npz' else None)
+            if full_vectors.shape != (int(vectors.shape[0]), projection.full_dim):
+                raise ValueError(f'Полноразмерные векторы не согласованы с индексом: {dir_path}')
+
+        return cls(
+            vectors=vectors,
+            items=items,
+            model=model,
+            quantized=quantized,
+            ann=ann,
+            lexical=lexical,
+            bitmaps=bitmaps,
+            projection=projection,
+            full_vectors=full_vectors,
+        )
 
 
 def build_vector_index(items: List[dict[str, Any]], vectors: List[list[float]], model: str) -> VectorIndex:
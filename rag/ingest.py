@@ -0,0 +1,374 @@
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Sequence
+import numpy as np
+from rag.config import RAG_CHUNK_CHARS, RAG_CHUNK_OVERLAP, RAG_INGEST_BATCH, RAG_INGEST_DIR
+from rag.embeddings import EmbeddingBackend
+from rag.index import LazyItems
+
+logger = logging.getLogger(__name__)
+
+# Потоковая загрузка документов в рабочую папку (только дозапись, память не зависит от объёма корпуса):
+#   items.jsonl   - chunks в формате базы знаний (chunk_id, text, metadata)
+#   offsets.i64   - конец каждой строки items.jsonl в байтах
+#   vectors.f32   - нормированные векторы chunks подряд, float32
+#   keys.bin      - 16 байт sha256 нормализованного текста на chunk (для дедупликации)
+#   state.json    - контрольная точка: сколько строк записано и докуда прочитан каждый файл;
+#                   по завершении загрузки - ещё и fingerprint (sha256 keys.bin) для проверки актуальности индекса
+# state.json пишется после каждого батча; при перезапуске файлы обрезаются до контрольной точки,
+# прочитанные файлы пропускаются, а в недочитанном пропускаются уже учтённые chunks.
+INGEST_EXTENSIONS: tuple[str, ...] = ('.txt', '.md')
+STATE_FILE = 'state.json'
+KEY_BYTES = 16
+
+_SPACE_RE = re.compile(r'\s+')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+_SLUG_RE = re.compile(r'[^\w]+')
+# границы, по которым режем chunk, в порядке предпочтения
+_CUT_BOUNDARIES: tuple[str, ...] = ('\n\n', '.\n', '. ', '!\n', '! ', '?\n', '? ', ';\n', '\n', ' ')
+_SENTENCE_END_RE = re.compile(r'[.!?;]\s')
+
+
+def resolve_ingest_dir() -> str:
+    # одна точка для сборки индекса и сервиса: переменная окружения важнее config
+    return os.environ.get('RAG_INGEST_DIR') or RAG_INGEST_DIR
+
+
+def iter_source_files(src_dir: str) -> List[str]:
+    if not os.path.isdir(src_dir):
+        raise FileNotFoundError(f'Папка документов не найдена: {src_dir}')
+
+    out: List[str] = []
+    for root, dirs, files in os.walk(src_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.endswith(INGEST_EXTENSIONS):
+                out.append(os.path.relpath(os.path.join(root, name), src_dir))
+    return out
+
+
+def doc_slug(rel_path: str) -> str:
+    stem = os.path.splitext(rel_path)[0]
+    return _SLUG_RE.sub('_', stem.lower()).strip('_') or 'doc'
+
+
+def dedup_key(text: str) -> bytes:
+    # регистр и пробелы не делают chunk новым
+    return hashlib.sha256(_SPACE_RE.sub(' ', text).strip().casefold().encode('utf-8')).digest()[:KEY_BYTES]
+
+
+def _cut_point(buf: str, size: int) -> int:
+    # последняя "хорошая" граница во второй половине окна, иначе жёсткий разрез по size
+    for sep in _CUT_BOUNDARIES:
+        pos = buf.rfind(sep, size // 2, size)
+        if pos != -1:
+            return pos + len(sep)
+    return size
+
+
+def _overlap_start(buf: str, cut: int, overlap: int) -> int:
+    # перекрытие начинаем с начала предложения (или хотя бы слова), чтобы chunk не начинался с обрывка
+    start = max(cut - overlap, 1)
+    m = _SENTENCE_END_RE.search(buf, start, cut)
+    if m:
+        return m.end()
+    space = buf.find(' ', start, cut)
+    return space + 1 if space != -1 else start
+
+
+def _clean(text: str) -> str:
+    return _BLANK_LINES_RE.sub('\n\n', text).strip()
+
+
+def split_chunks(f, size: int = RAG_CHUNK_CHARS, overlap: int = RAG_CHUNK_OVERLAP) -> Iterator[str]:
+    # читаем блоками по size символов: в памяти не больше двух окон независимо от размера файла
+    if size <= 0 or not 0 <= overlap < size // 2:
+        raise ValueError('Нужно 0 < size и 0 <= overlap < size / 2')
+
+    buf = ''
+    while True:
+        block = f.read(size)
+        buf += block
+        while len(buf) > size:
+            cut = _cut_point(buf, size)
+            chunk = _clean(buf[:cut])
+            if chunk:
+                yield chunk
+            buf = buf[_overlap_start(buf, cut, overlap) if overlap else cut:]
+        if not block:
+            break
+
+    chunk = _clean(buf)
+    if chunk:
+        yield chunk
+
+
+@dataclass
+class IngestedChunks:
+    items: Sequence[dict[str, Any]]
+    vectors: np.ndarray
+    model: str
+    fingerprint: str
+
+
+class _Staging:
+    def __init__(self, work_dir: str) -> None:
+        self.work_dir = work_dir
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.work_dir, name)
+
+    def read_state(self) -> Dict[str, Any] | None:
+        try:
+            with open(self.path(STATE_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_state(self, state: Dict[str, Any]) -> None:
+        tmp = self.path(f'.{STATE_FILE}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path(STATE_FILE))
+
+    def reset(self) -> None:
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def truncate(self, state: Dict[str, Any]) -> None:
+        # всё, что дописано после последней контрольной точки, отбрасываем
+        rows, dim = int(state['rows']), int(state['dim'] or 0)
+        sizes = {
+            'items.jsonl': int(state['items_bytes']),
+            'offsets.i64': rows * 8,
+            'vectors.f32': rows * dim * 4,
+            'keys.bin': rows * KEY_BYTES,
+        }
+        for name, size in sizes.items():
+            with open(self.path(name), 'ab') as f:
+                f.truncate(size)
+
+    def keys_fingerprint(self, rows: int) -> str:
+        digest = hashlib.sha256()
+        left = rows * KEY_BYTES
+        with open(self.path('keys.bin'), 'rb') as f:
+            while left > 0:
+                block = f.read(min(left, KEY_BYTES * 4096))
+                if not block:
+                    break
+                digest.update(block)
+                left -= len(block)
+        return digest.hexdigest()
+
+    def seen_keys(self) -> set[bytes]:
+        seen: set[bytes] = set()
+        with open(self.path('keys.bin'), 'rb') as f:
+            while True:
+                block = f.read(KEY_BYTES * 4096)
+                if not block:
+                    break
+                seen.update(block[i: i + KEY_BYTES] for i in range(0, len(block), KEY_BYTES))
+        return seen
+
+
+def _fresh_state(model: str, size: int, overlap: int) -> Dict[str, Any]:
+    return {
+        'model': model,
+        'dim': None,
+        'chunk_chars': size,
+        'chunk_overlap': overlap,
+        'rows': 0,
+        'items_bytes': 0,
+        'duplicates': 0,
+        'files': {},
+    }
+
+
+def _changed_files(src_dir: str, files: Dict[str, Dict[str, Any]]) -> List[str]:
+    changed = []
+    for rel, info in files.items():
+        path = os.path.join(src_dir, rel)
+        if not os.path.exists(path):
+            changed.append(rel)
+            continue
+        st = os.stat(path)
+        if [st.st_size, st.st_mtime_ns] != [info['size'], info['mtime_ns']]:
+            changed.append(rel)
+    return changed
+
+
+def ingest_documents(
+    src_dir: str,
+    work_dir: str,
+    embedder: EmbeddingBackend,
+    batch_size: int = RAG_INGEST_BATCH,
+    size: int = RAG_CHUNK_CHARS,
+    overlap: int = RAG_CHUNK_OVERLAP,
+) -> Dict[str, Any]:
+    staging = _Staging(work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+
+    state = staging.read_state()
+    if state is not None and [state['model'], state['chunk_chars'], state['chunk_overlap']] != [embedder.model, size, overlap]:
+        logger.info('Загрузка документов начата заново: изменилась модель или параметры нарезки')
+        state = None
+    if state is not None:
+        # из дозаписываемых файлов chunks изменённого документа не убрать - начинаем заново
+        changed = _changed_files(src_dir, state['files'])
+        if changed:
+            logger.info('Загрузка документов начата заново: изменились файлы %s', ', '.join(changed[:5]))
+            state = None
+    if state is None:
+        staging.reset()
+        state = _fresh_state(embedder.model, size, overlap)
+        staging.write_state(state)
+    staging.truncate(state)
+
+    # единственное, что растёт с корпусом: множество 16-байтовых ключей для дедупликации
+    seen = staging.seen_keys()
+    pending: List[tuple[dict[str, Any], bytes]] = []
+
+    def flush() -> None:
+        if pending:
+            vectors = np.asarray(embedder.embed_texts([item['text'] for item, _ in pending]), dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0.0, 1.0, norms)
+            if state['dim'] is None:
+                state['dim'] = int(vectors.shape[1])
+            elif int(vectors.shape[1]) != state['dim']:
+                raise ValueError(f'Размерность эмбеддингов изменилась: {state["dim"]} -> {vectors.shape[1]}')
+
+            offsets = []
+            end = state['items_bytes']
+            with open(staging.path('items.jsonl'), 'ab') as f:
+                for item, _ in pending:
+                    line = (json.dumps(item, ensure_ascii=False) + '\n').encode('utf-8')
+                    f.write(line)
+                    end += len(line)
+                    offsets.append(end)
+            with open(staging.path('offsets.i64'), 'ab') as f:
+                f.write(np.array(offsets, dtype=np.int64).tobytes())
+            with open(staging.path('vectors.f32'), 'ab') as f:
+                f.write(np.ascontiguousarray(vectors).tobytes())
+            with open(staging.path('keys.bin'), 'ab') as f:
+                f.write(b''.join(key for _, key in pending))
+
+            state['rows'] += len(pending)
+            state['items_bytes'] = end
+            pending.clear()
+
+        # контрольная точка только после того, как данные батча на диске
+        state['files'] = dict(progress)
+        state.pop('fingerprint', None)
+        staging.write_state(state)
+
+    progress: Dict[str, Dict[str, Any]] = {rel: dict(info) for rel, info in state['files'].items()}
+    for rel in iter_source_files(src_dir):
+        info = progress.get(rel)
+        if info is not None and info['done']:
+            continue
+
+        path = os.path.join(src_dir, rel)
+        st = os.stat(path)
+        skip = info['chunks'] if info is not None else 0
+        info = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'chunks': skip, 'done': False}
+        progress[rel] = info
+
+        slug = doc_slug(rel)
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for ordinal, text in enumerate(split_chunks(f, size, overlap)):
+                if ordinal < skip:
+                    continue
+                info['chunks'] = ordinal + 1
+
+                key = dedup_key(text)
+                if key in seen:
+                    state['duplicates'] += 1
+                    continue
+                seen.add(key)
+
+                # id из содержимого: не меняется при перезапуске и при правках в других местах документа
+                item = {
+                    'chunk_id': f'doc_{slug}_{key[:6].hex()}',
+                    'text': text,
+                    'metadata': {'topic': 'documents', 'source': rel.replace(os.sep, '/'), 'part': ordinal},
+                }
+                pending.append((item, key))
+                if len(pending) >= batch_size:
+                    flush()
+        info['done'] = True
+
+    flush()
+    state['fingerprint'] = staging.keys_fingerprint(state['rows'])
+    staging.write_state(state)
+    logger.info('Загрузка документов: chunks=%d дубликатов=%d файлов=%d',
+                state['rows'], state['duplicates'], len(progress))
+    return {'rows': state['rows'], 'duplicates': state['duplicates'], 'files': len(progress)}
+
+
+def ingest_pending(work_dir: str, model: str | None = None) -> bool:
+    # документы в рабочей папке есть, но load_ingested их не отдаст: загрузка идёт, прервана
+    # (в т.ч. сразу после reset) или посчитана другой моделью. Отличаем от "документов нет".
+    if not os.path.isdir(work_dir):
+        return False
+    state = _Staging(work_dir).read_state()
+    if state is None:
+        return bool(os.listdir(work_dir))
+    if model is not None and state['model'] != model:
+        return True
+    return not state['files'] or any(not info['done'] for info in state['files'].values())
+
+
+def _ready_state(staging: _Staging, model: str | None) -> Dict[str, Any] | None:
+    state = staging.read_state()
+    if state is None or not state['rows']:
+        return None
+    if model is not None and state['model'] != model:
+        logger.warning('Загруженные документы посчитаны другой моделью (%s), пропускаем', state['model'])
+        return None
+    if any(not info['done'] for info in state['files'].values()):
+        logger.warning('Загрузка документов не завершена, пропускаем: %s', staging.work_dir)
+        return None
+    return state
+
+
+def _fingerprint(staging: _Staging, state: Dict[str, Any]) -> str:
+    # записан в конце загрузки; у рабочих папок без него считаем по keys.bin
+    return state.get('fingerprint') or staging.keys_fingerprint(int(state['rows']))
+
+
+def ingested_fingerprint(work_dir: str, model: str | None = None) -> str | None:
+    # fingerprint того, что отдаст load_ingested, по одному state.json - без чтения chunks и векторов
+    staging = _Staging(work_dir)
+    state = _ready_state(staging, model)
+    return _fingerprint(staging, state) if state is not None else None
+
+
+def load_ingested(work_dir: str, model: str | None = None) -> IngestedChunks | None:
+    # векторы открываются через memmap, chunks читаются лениво - в память ничего не копируется
+    staging = _Staging(work_dir)
+    state = _ready_state(staging, model)
+    if state is None:
+        return None
+
+    rows, dim = int(state['rows']), int(state['dim'])
+    offsets = np.concatenate([
+        np.zeros(1, dtype=np.int64),
+        np.fromfile(staging.path('offsets.i64'), dtype=np.int64, count=rows),
+    ])
+    vectors = np.memmap(staging.path('vectors.f32'), dtype=np.float32, mode='r', shape=(rows, dim))
+
+    return IngestedChunks(
+        items=LazyItems(staging.path('items.jsonl'), offsets),
+        vectors=vectors,
+        model=state['model'],
+        fingerprint=_fingerprint(staging, state),
+    )
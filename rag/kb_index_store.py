@@ -1,29 +1,426 @@
 from __future__ import annotations
+import datetime as dt
+import json
+import logging
 import os
-from rag.embeddings import EmbeddingsClient
-from rag.index import VectorIndex, build_vector_index
-from rag.knowledge_base import KNOWLEDGE_BASE
+import shutil
+import time
+from typing import Any, Dict, List, Sequence
+import numpy as np
+from rag.ann import train_ivf
+from rag.config import (
+    RAG_ANN,
+    RAG_ANN_MIN_ROWS,
+    RAG_DEDUP_THRESHOLD,
+    RAG_EMBED_CACHE_DIR,
+    RAG_INDEX_FORMAT,
+    RAG_INDEX_KEEP_VERSIONS,
+    RAG_INDEX_QUANTIZATION,
+    RAG_INDEX_SHARDS,
+    RAG_INDEX_TMP_TTL,
+    RAG_IVF_NLIST,
+    RAG_IVF_NPROBE,
+    RAG_PROJECTION,
+    RAG_PROJECTION_DIM,
+    RAG_PROJECTION_RESCORE,
+    RAG_QUANTIZED_MIN_ROWS,
+)
+from rag.dedup import collapse_near_duplicates
+from rag.embedding_cache import EmbeddingCache, embed_with_cache, text_key
+from rag.embeddings import EmbeddingBackend
+from rag.ingest import IngestedChunks, ingest_pending, ingested_fingerprint, load_ingested, resolve_ingest_dir
+from rag.index import INDEX_FILES, VectorIndex, build_vector_index, detect_index_format
+from rag.knowledge_base import kb_fingerprint, knowledge_base_fingerprint, load_knowledge_base
+from rag.lexical import build_bm25
+from rag.local_embeddings import LOCAL_EMBEDDER_FILE, LocalEmbedder
+from rag.projection import fit_projection
+from rag.quantize import quantize
+
+logger = logging.getLogger(__name__)
+
+
+# Версионированная раскладка:
+#   <dir>/versions/<id>/  - неизменяемая папка индекса + manifest.json
+#   <dir>/CURRENT         - id опубликованной версии, подменяется через os.replace
+# Сборка пишет новую версию рядом, читатели видят её только после подмены CURRENT.
+# Старая плоская раскладка (файлы индекса прямо в <dir>) читается, пока нет CURRENT.
+#   <dir>/PINNED          - id версии, на которую откатились вручную: пока она текущая, индекс не считается
+#                           устаревшим; следующая сборка публикует новую версию и снимает закрепление
+VERSIONS_DIR = 'versions'
+CURRENT_FILE = 'CURRENT'
+PINNED_FILE = 'PINNED'
+MANIFEST_FILE = 'manifest.json'
+# векторы документов переносятся в файл версии пачками по столько строк
+VECTOR_COPY_ROWS = 16_384
+BUILD_MATRIX_FILE = '.vectors.build.npy'
+
+
+def current_version(dir_path: str) -> str | None:
+    try:
+        with open(os.path.join(dir_path, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+
+def pinned_version(dir_path: str) -> str | None:
+    try:
+        with open(os.path.join(dir_path, PINNED_FILE), 'r', encoding='utf-8') as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+
+def list_versions(dir_path: str) -> List[str]:
+    root = os.path.join(dir_path, VERSIONS_DIR)
+    if not os.path.isdir(root):
+        return []
+    # id начинается с UTC-времени, поэтому сортировка по имени = по времени сборки
+    return sorted(name for name in os.listdir(root) if not name.startswith('.'))
+
+
+def resolve_index_dir(dir_path: str) -> str | None:
+    version = current_version(dir_path)
+    if version is not None:
+        path = os.path.join(dir_path, VERSIONS_DIR, version)
+        return path if detect_index_format(path) is not None else None
+    return dir_path if detect_index_format(dir_path) is not None else None
+
+
+def read_manifest(dir_path: str) -> Dict[str, Any] | None:
+    path = resolve_index_dir(dir_path)
+    if path is None:
+        return None
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
 
 
 def kb_index_exists(dir_path: str) -> bool:
-    vec_path = os.path.join(dir_path, 'vectors.npz')
-    meta_path = os.path.join(dir_path, 'meta.json')
-    return os.path.exists(vec_path) and os.path.exists(meta_path)
+    return resolve_index_dir(dir_path) is not None
 
 
-def get_or_build_kb_index(dir_path: str, embedder: EmbeddingsClient) -> VectorIndex:
-    if kb_index_exists(dir_path):
-        return VectorIndex.load(dir_path)
+def kb_index_is_stale(
+    dir_path: str,
+    fingerprint: str,
+    model: str,
+    ingested_fingerprint: str | None = None,
+    check_ingested: bool = True,
+) -> bool:
+    # закреплённую откатом версию не перестраиваем: откат - осознанное решение, а не устаревший индекс
+    version = current_version(dir_path)
+    if version is not None and version == pinned_version(dir_path):
+        return False
+    # индекс без манифеста (старая раскладка) проверить не можем - считаем актуальным
+    manifest = read_manifest(dir_path)
+    if manifest is None:
+        return False
+    return (
+        manifest.get('model') != model
+        or manifest.get('kb_fingerprint') != fingerprint
+        or (check_ingested and manifest.get('ingested_fingerprint') != ingested_fingerprint)
+        # настройки проекции меняют матрицу индекса (манифест без projection_dim тоже считается устаревшим)
+        or manifest.get('projection') != (RAG_PROJECTION or None)
+        or (bool(RAG_PROJECTION) and manifest.get('projection_dim') != RAG_PROJECTION_DIM)
+        # порог схлопывания почти-дубликатов меняет состав chunks (манифест без dedup - сборка без схлопывания)
+        or (manifest.get('dedup') or {}).get('threshold') != RAG_DEDUP_THRESHOLD
+    )
+
+
+def kb_index_signature(dir_path: str) -> tuple | None:
+    # меняется при каждой пересборке индекса; по ней сервис замечает новую версию
+    version = current_version(dir_path)
+    if version is not None:
+        return ('version', version)
+
+    fmt = detect_index_format(dir_path)
+    if fmt is None:
+        return None
+
+    sig = []
+    for name in INDEX_FILES[fmt]:
+        try:
+            st = os.stat(os.path.join(dir_path, name))
+        except FileNotFoundError:
+            return None
+        sig.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+def load_kb_index(dir_path: str) -> VectorIndex:
+    path = resolve_index_dir(dir_path)
+    if path is None:
+        raise FileNotFoundError(f'Файлы не найдены по этому пути: {dir_path}')
+    return VectorIndex.load(path)
+
+
+def _write_atomic(dir_path: str, name: str, text: str) -> None:
+    tmp = os.path.join(dir_path, f'.{name}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(dir_path, name))
+
+
+def publish_version(dir_path: str, version: str, pinned: bool = False) -> None:
+    if detect_index_format(os.path.join(dir_path, VERSIONS_DIR, version)) is None:
+        raise FileNotFoundError(f'Версия индекса не найдена: {version}')
+
+    # PINNED пишется до CURRENT: читатель не увидит откатанную версию без закрепления
+    if pinned:
+        _write_atomic(dir_path, PINNED_FILE, version)
+    _write_atomic(dir_path, CURRENT_FILE, version)
+    if not pinned:
+        try:
+            os.remove(os.path.join(dir_path, PINNED_FILE))
+        except FileNotFoundError:
+            pass
+
+
+def rollback_kb_index(dir_path: str, version: str | None = None) -> str:
+    # без явной версии - на предыдущую по времени перед текущей
+    if version is None:
+        versions = list_versions(dir_path)
+        current = current_version(dir_path)
+        older = [v for v in versions if current is None or v < current]
+        if not older:
+            raise ValueError(f'Нет версии для отката: {dir_path}')
+        version = older[-1]
+
+    publish_version(dir_path, version, pinned=True)
+    return version
+
+
+def gc_versions(dir_path: str, keep: int = RAG_INDEX_KEEP_VERSIONS, tmp_ttl: float = RAG_INDEX_TMP_TTL) -> List[str]:
+    # текущая версия не удаляется никогда; кроме неё оставляем keep самых свежих (для отката и
+    # для процессов, которые ещё не перезагрузились и читают старую версию через mmap)
+    current = current_version(dir_path)
+    versions = list_versions(dir_path)
+    keep_set = set(versions[-max(1, keep):])
+    if current is not None:
+        keep_set.add(current)
+
+    removed = []
+    for v in versions:
+        if v not in keep_set:
+            shutil.rmtree(os.path.join(dir_path, VERSIONS_DIR, v), ignore_errors=True)
+            removed.append(v)
 
-    items = KNOWLEDGE_BASE
+    # недостроенные папки упавших сборок; сборка, которая ещё пишет файлы, моложе cutoff
+    root = os.path.join(dir_path, VERSIONS_DIR)
+    cutoff = time.time() - tmp_ttl
+    for name in os.listdir(root) if os.path.isdir(root) else []:
+        path = os.path.join(root, name)
+        if name.startswith('.tmp-') and _last_modified(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+    return removed
+
+
+def _last_modified(dir_path: str) -> float:
+    # mtime самой папки меняется только при создании файлов, а запись в файл (матрица, шарды) - их mtime
+    latest = 0.0
+    for root, _, files in os.walk(dir_path):
+        for path in [root, *(os.path.join(root, name) for name in files)]:
+            try:
+                latest = max(latest, os.stat(path).st_mtime)
+            except FileNotFoundError:
+                pass
+    return latest
+
+
+def _seed_cache_from_index(cache: EmbeddingCache, dir_path: str) -> None:
+    # старый индекс той же модели - бесплатный источник векторов, даже если кэш ещё пуст
+    if not kb_index_exists(dir_path):
+        return
+    try:
+        old = load_kb_index(dir_path)
+    except (OSError, ValueError):
+        return
+    if old.model != cache.model:
+        return
+    # спроецированные векторы - не эмбеддинги модели; без сохранённых исходных кэш не наполняем
+    vectors = old.vectors if old.projection is None else old.full_vectors
+    if vectors is None:
+        return
+
+    for item, vec in zip(old.items, vectors):
+        text = str(item.get('text') or '').strip()
+        if text and text_key(text) not in cache:
+            cache.put(text, vec)
+
+
+class _Chain(Sequence):
+    # две последовательности подряд без копирования
+    def __init__(self, head: Sequence[Any], tail: Sequence[Any]) -> None:
+        self._head = head
+        self._tail = tail
+
+    def __len__(self) -> int:
+        return len(self._head) + len(self._tail)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        n_head = len(self._head)
+        return self._head[i] if i < n_head else self._tail[i - n_head]
+
+
+class _Texts(Sequence):
+    # тексты chunks, читаются из items по мере обращения
+    def __init__(self, items: Sequence[dict[str, Any]]) -> None:
+        self._items = items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._items[int(i)]['text']
+
+
+def _matrix_file() -> str:
+    # в готовой версии матрица сборки остаётся как есть: vectors.npy (mmap) или vectors.full.npy (проекция
+    # с пересчётом), и index.save её не переписывает; в остальных случаях это временный файл
+    if RAG_PROJECTION:
+        return 'vectors.full.npy' if RAG_PROJECTION_RESCORE else BUILD_MATRIX_FILE
+    return 'vectors.npy' if RAG_INDEX_FORMAT == 'mmap' else BUILD_MATRIX_FILE
+
+
+def rebuild_kb_index(
+    dir_path: str,
+    embedder: EmbeddingBackend,
+    items: List[dict[str, Any]] | None = None,
+    cache: EmbeddingCache | None = None,
+    ingested: IngestedChunks | None = None,
+) -> VectorIndex:
+    items = load_knowledge_base() if items is None else items
     texts = [item['text'].strip() for item in items]
 
     for i, t in enumerate(texts):
         if not t:
             raise ValueError(f'Пустой chunk по индексу={i}')
+    if ingested is not None and ingested.model != embedder.model:
+        raise ValueError(f'Документы посчитаны моделью {ingested.model}, а индекс строится моделью {embedder.model}')
+
+    if cache is not None:
+        _seed_cache_from_index(cache, dir_path)
+
+    fingerprint = kb_fingerprint(items)
+    now = dt.datetime.now(dt.timezone.utc)
+    version = f'{now.strftime("%Y%m%dT%H%M%S%fZ")}-{fingerprint[:8]}'
+    root = os.path.join(dir_path, VERSIONS_DIR)
+    tmp_dir = os.path.join(root, f'.tmp-{version}')
+    os.makedirs(tmp_dir)
+
+    # документы не копируются в память: chunks и тексты читаются из items.jsonl по мере обращения
+    all_items: Sequence[dict[str, Any]] = _Chain(items, ingested.items) if ingested is not None else items
+    all_texts: Sequence[str] = _Chain(texts, _Texts(ingested.items)) if ingested is not None else texts
+
+    dedup = None
+    keep = np.arange(len(all_items), dtype=np.int64)
+    if RAG_DEDUP_THRESHOLD is not None:
+        # почти одинаковые chunks схлопываем до эмбеддингов: меньше вызовов API, меньше индекс, меньше повторов в выдаче
+        dedup = collapse_near_duplicates(all_items, all_texts, threshold=RAG_DEDUP_THRESHOLD)
+        keep, all_items = dedup.keep, dedup.items
+        if dedup.dropped:
+            logger.info('Почти-дубликаты: %d кластеров, убрано chunks=%d (%d символов)',
+                        len(dedup.groups), dedup.dropped, dedup.dropped_chars)
+
+    n_kb = len(items)
+    kb_rows = keep[keep < n_kb]
+    kb_texts = [texts[i] for i in kb_rows]
+    vectors = embed_with_cache(kb_texts, embedder, cache)
+    index = build_vector_index(items=[all_items[i] for i in range(len(kb_rows))], vectors=vectors, model=embedder.model)
+
+    # итоговая матрица пишется прямо в файл версии: база знаний, затем векторы документов пачками
+    # (они уже посчитаны и нормированы при загрузке), без склейки всей матрицы в памяти
+    matrix_path = os.path.join(tmp_dir, _matrix_file())
+    full = np.lib.format.open_memmap(matrix_path, mode='w+', dtype=np.float32, shape=(len(keep), index.vectors.shape[1]))
+    full[:len(kb_rows)] = index.vectors
+    ingested_rows = keep[keep >= n_kb] - n_kb
+    for start in range(0, len(ingested_rows), VECTOR_COPY_ROWS):
+        rows = ingested_rows[start: start + VECTOR_COPY_ROWS]
+        full[len(kb_rows) + start: len(kb_rows) + start + len(rows)] = ingested.vectors[rows]
+    full.flush()
+    index.vectors = full
+    index.items = all_items
+
+    if RAG_PROJECTION:
+        # квантование, IVF и шарды дальше строятся уже по спроецированной матрице
+        index.projection = fit_projection(full, RAG_PROJECTION, RAG_PROJECTION_DIM)
+        index.vectors = index.projection.apply(full)
+        index.full_vectors = full if RAG_PROJECTION_RESCORE else None
+    if RAG_INDEX_QUANTIZATION and len(index.items) >= RAG_QUANTIZED_MIN_ROWS:
+        index.quantized = quantize(index.vectors, RAG_INDEX_QUANTIZATION)
+    if RAG_ANN == 'ivf' and len(index.items) >= RAG_ANN_MIN_ROWS:
+        index.ann = train_ivf(index.vectors, nlist=RAG_IVF_NLIST, nprobe=RAG_IVF_NPROBE)
+    # BM25 строится локально за миллисекунды, поэтому всегда
+    index.lexical = build_bm25(all_texts[i] for i in keep)
 
-    vectors = embedder.embed_texts(texts)
-    index = build_vector_index(items=items, vectors=vectors, model=embedder.model)
+    index.save(tmp_dir, fmt=RAG_INDEX_FORMAT, n_shards=RAG_INDEX_SHARDS)
+    if os.path.basename(matrix_path) == BUILD_MATRIX_FILE:
+        # матрица сборки не стала файлом индекса (шарды, npz, проекция без пересчёта)
+        os.remove(matrix_path)
+    if isinstance(embedder, LocalEmbedder):
+        # локальная модель публикуется вместе с индексом, чьи векторы она посчитала
+        embedder.save(os.path.join(tmp_dir, LOCAL_EMBEDDER_FILE))
+
+    manifest = {
+        'version': version,
+        'created_at': now.isoformat(),
+        'kb_fingerprint': fingerprint,
+        'model': index.model,
+        'dim': int(index.vectors.shape[1]),
+        'projection': index.projection.kind if index.projection is not None else None,
+        # запрошенная размерность (RAG_PROJECTION_DIM): PCA на малой базе может дать меньше компонент
+        'projection_dim': RAG_PROJECTION_DIM if index.projection is not None else None,
+        'size': int(index.vectors.shape[0]),
+        'format': RAG_INDEX_FORMAT,
+        'quantization': index.quantized.kind if index.quantized is not None else None,
+        'ann': 'ivf' if index.ann is not None else None,
+        'ingested_fingerprint': ingested.fingerprint if ingested is not None else None,
+        'dedup': {'threshold': RAG_DEDUP_THRESHOLD, **dedup.summary()} if dedup is not None else None,
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    # папка версии появляется целиком (rename атомарен), затем атомарно переключается CURRENT
+    os.rename(tmp_dir, os.path.join(root, version))
+    publish_version(dir_path, version)
+    gc_versions(dir_path)
+
+    if cache is not None:
+        # удалённые из базы знаний (и схлопнутые как дубликаты) chunks больше не держим
+        cache.prune(text_key(t) for t in kb_texts)
+        cache.save()
+
+    # отдаём опубликованную версию: матрица и chunks читаются из её файлов, а не из папки загрузки документов
+    return VectorIndex.load(os.path.join(root, version))
+
+
+def get_or_build_kb_index(dir_path: str, embedder: EmbeddingBackend) -> VectorIndex:
+    # Путь обслуживания запросов: индекс строится, только если его нет совсем. Устаревший индекс
+    # отдаём как есть и пишем в лог - пересборка (вызовы API эмбеддингов) идёт через rag.build_kb_index,
+    # а ручной откат не отменяется первым же запросом.
+    ingest_dir = resolve_ingest_dir()
+    if kb_index_exists(dir_path):
+        # для проверки хватает fingerprint из state.json: chunks и векторы документов не открываем
+        fingerprint = ingested_fingerprint(ingest_dir, model=embedder.model)
+        # недогруженные документы - не повод считать индекс устаревшим: в нём остаются прошлые документы
+        pending = fingerprint is None and ingest_pending(ingest_dir, model=embedder.model)
+        if kb_index_is_stale(dir_path, knowledge_base_fingerprint(), embedder.model, fingerprint, check_ingested=not pending):
+            logger.warning('Индекс базы знаний устарел (%s): пересоберите его через python -m rag.build_kb_index', dir_path)
+        return load_kb_index(dir_path)
 
-    index.save(dir_path)
-    return index
+    cache = EmbeddingCache(RAG_EMBED_CACHE_DIR, model=embedder.model)
+    ingested = load_ingested(ingest_dir, model=embedder.model)
+    return rebuild_kb_index(dir_path, embedder, cache=cache, ingested=ingested)
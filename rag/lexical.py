@@ -0,0 +1,203 @@
+from __future__ import annotations
+import json
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List
+import numpy as np
+
+LEXICAL_FILES: tuple[str, ...] = ('bm25.json',)
+
+# слова и составные термины через дефис: 223-ФЗ, 44-ФЗ, ст.93 -> 'ст', '93'
+_TOKEN_RE = re.compile(r'[0-9a-zа-я]+(?:-[0-9a-zа-я]+)*')
+_CYRILLIC_WORD_RE = re.compile(r'^[а-я]+$')
+
+_VOWELS = 'аеиоуыэюя'
+
+# Snowball-стеммер для русского языка (окончания из официального описания алгоритма)
+_PERFECTIVE_GERUND = re.compile(r'(?:(?<=[ая])(?:в|вши|вшись)|ив|ивши|ившись|ыв|ывши|ывшись)$')
+_REFLEXIVE = re.compile(r'(?:ся|сь)$')
+_ADJECTIVAL = re.compile(
+    r'(?:(?<=[ая])(?:ем|нн|вш|ющ|щ)|ивш|ывш|ующ)?'
+    r'(?:ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$'
+)
+_VERB = re.compile(
+    r'(?:(?<=[ая])(?:ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)'
+    r'|ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)$'
+)
+_NOUN = re.compile(
+    r'(?:а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+_DERIVATIONAL = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'ейше?$')
+
+
+def _region_after_vc(word: str, start: int) -> int:
+    # начало области после первой пары "гласная, затем согласная", начиная с позиции start
+    for i in range(start + 1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            return i + 1
+    return len(word)
+
+
+def stem_ru(word: str) -> str:
+    if not _CYRILLIC_WORD_RE.match(word):
+        return word
+
+    rv_start = next((i + 1 for i, ch in enumerate(word) if ch in _VOWELS), len(word))
+    r1_start = _region_after_vc(word, 0)
+    r2_start = _region_after_vc(word, r1_start)
+
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # шаг 1
+    m = _PERFECTIVE_GERUND.search(rv)
+    if m:
+        rv = rv[:m.start()]
+    else:
+        rv = _REFLEXIVE.sub('', rv)
+        for pattern in (_ADJECTIVAL, _VERB, _NOUN):
+            m = pattern.search(rv)
+            if m:
+                rv = rv[:m.start()]
+                break
+
+    # шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # шаг 3: словообразовательный суффикс только в R2
+    m = _DERIVATIONAL.search(rv)
+    if m and rv_start + m.start() >= r2_start:
+        rv = rv[:m.start()]
+
+    # шаг 4
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        m = _SUPERLATIVE.search(rv)
+        if m:
+            rv = rv[:m.start()]
+            if rv.endswith('нн'):
+                rv = rv[:-1]
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+
+    return prefix + rv
+
+
+def analyze(text: str) -> List[str]:
+    # составной термин сохраняется целиком (редкий => высокий idf) и дополнительно по частям
+    terms: List[str] = []
+    for token in _TOKEN_RE.findall(text.lower().replace('ё', 'е')):
+        if '-' in token:
+            terms.append(token)
+            terms.extend(stem_ru(part) for part in token.split('-') if part)
+        else:
+            terms.append(stem_ru(token))
+    return terms
+
+
+@dataclass
+class BM25Index:
+    # Инвертированный индекс: терм -> (номера chunks, частоты терма в них)
+    postings: Dict[str, tuple[np.ndarray, np.ndarray]]
+    doc_len: np.ndarray
+    k1: float = 1.2
+    b: float = 0.75
+    _norm: np.ndarray | None = field(default=None, repr=False)
+
+    @property
+    def size(self) -> int:
+        return int(self.doc_len.shape[0])
+
+    def _length_norm(self) -> np.ndarray:
+        if self._norm is None:
+            avgdl = float(self.doc_len.mean()) if self.size else 0.0
+            self._norm = self.k1 * (1.0 - self.b + self.b * self.doc_len / (avgdl or 1.0))
+        return self._norm
+
+    def scores(self, query: str) -> np.ndarray:
+        n = self.size
+        out = np.zeros(n, dtype=np.float32)
+        norm = self._length_norm()
+        for term in set(analyze(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            ids, tf = posting
+            df = int(ids.shape[0])
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            out[ids] += idf * tf * (self.k1 + 1.0) / (tf + norm[ids])
+        return out
+
+    def search(self, query: str, k: int, mask: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        scores = self.scores(query)
+        if mask is not None:
+            scores[~mask] = 0.0
+        nz = np.flatnonzero(scores)
+        if nz.shape[0] == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        k_eff = min(k, int(nz.shape[0]))
+        top = nz[np.argpartition(-scores[nz], kth=k_eff - 1)[:k_eff]]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return top, scores[top]
+
+    def save(self, dir_path: str) -> None:
+        data = {
+            'k1': self.k1,
+            'b': self.b,
+            'doc_len': self.doc_len.tolist(),
+            'postings': {t: [ids.tolist(), tf.tolist()] for t, (ids, tf) in self.postings.items()},
+        }
+        tmp = os.path.join(dir_path, '.bm25.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(dir_path, 'bm25.json'))
+
+    @classmethod
+    def load(cls, dir_path: str) -> BM25Index | None:
+        path = os.path.join(dir_path, 'bm25.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        postings = {
+            t: (np.array(ids, dtype=np.int64), np.array(tf, dtype=np.float32))
+            for t, (ids, tf) in data['postings'].items()
+        }
+        return cls(
+            postings=postings,
+            doc_len=np.array(data['doc_len'], dtype=np.float32),
+            k1=float(data.get('k1', 1.2)),
+            b=float(data.get('b', 0.75)),
+        )
+
+
+def build_bm25(texts: Iterable[str], k1: float = 1.2, b: float = 0.75) -> BM25Index:
+    raw: Dict[str, Dict[int, int]] = {}
+    doc_len: List[int] = []
+    for doc_id, text in enumerate(texts):
+        terms = analyze(text)
+        doc_len.append(len(terms))
+        for term in terms:
+            tf = raw.setdefault(term, {})
+            tf[doc_id] = tf.get(doc_id, 0) + 1
+
+    postings = {
+        t: (np.fromiter(tf.keys(), dtype=np.int64, count=len(tf)), np.fromiter(tf.values(), dtype=np.float32, count=len(tf)))
+        for t, tf in raw.items()
+    }
+    return BM25Index(postings=postings, doc_len=np.array(doc_len, dtype=np.float32), k1=k1, b=b)
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Iterable[int]], k: int, rrf_k: int = 60) -> List[tuple[int, float]]:
+    # RRF: score(d) = sum 1 / (rrf_k + rank_d); шкалы косинуса и BM25 несравнимы, ранги - сравнимы
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            fused[doc] = fused.get(doc, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(fused.items(), key=lambda kv: -kv[1])[:k]
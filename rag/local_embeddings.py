@@ -0,0 +1,265 @@
+from __future__ import annotations
+import hashlib
+import json
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Callable, List, Sequence
+import numpy as np
+
+_SPACE_RE = re.compile(r'\s+')
+# копия модели в папке версии индекса: запросы к индексу считаются той же моделью, что и его векторы
+LOCAL_EMBEDDER_FILE = 'local_embedder.npz'
+
+
+class _SparseRows:
+    # CSR-матрица (n, n_cols): только умножения на плотные матрицы, блоками, чтобы промежуточные
+    # массивы nnz x l не росли с корпусом
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, n_cols: int, block_nnz: int = 1 << 20) -> None:
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.n_rows = int(indptr.shape[0] - 1)
+        self.n_cols = int(n_cols)
+        self.block_nnz = block_nnz
+        # CSC-порядок тех же элементов для X.T @ Y
+        self._by_col = np.argsort(indices, kind='stable')
+        self._row_of = np.repeat(np.arange(self.n_rows, dtype=np.int64), np.diff(indptr))
+        self._col_ptr = np.zeros(self.n_cols + 1, dtype=np.int64)
+        self._col_ptr[1:] = np.cumsum(np.bincount(indices, minlength=self.n_cols))
+
+    @staticmethod
+    def _reduce(ptr: np.ndarray, values: np.ndarray, gather: np.ndarray, dense: np.ndarray, block_nnz: int) -> np.ndarray:
+        # out[g] = sum(values[j] * dense[gather[j]] for j in ptr[g]:ptr[g+1])
+        out = np.zeros((ptr.shape[0] - 1, dense.shape[1]), dtype=np.float32)
+        dense = np.asarray(dense, dtype=np.float32)
+        g = 0
+        n_groups = ptr.shape[0] - 1
+        while g < n_groups:
+            end = int(np.searchsorted(ptr, ptr[g] + block_nnz, side='right')) - 1
+            end = min(max(end, g + 1), n_groups)
+            s, e = int(ptr[g]), int(ptr[end])
+            if e > s:
+                prod = values[s:e, None] * dense[gather[s:e]]
+                starts = ptr[g:end] - s
+                # пустые группы в reduceat не передаём: у них нет своего отрезка
+                nonempty = starts < (ptr[g + 1:end + 1] - s)
+                out[g:end][nonempty] = np.add.reduceat(prod, starts[nonempty], axis=0)
+            g = end
+        return out
+
+    def matmul(self, dense: np.ndarray) -> np.ndarray:
+        # X @ dense: (n_cols, l) -> (n_rows, l)
+        return self._reduce(self.indptr, self.data, self.indices, dense, self.block_nnz)
+
+    def rmatmul(self, dense: np.ndarray) -> np.ndarray:
+        # X.T @ dense: (n_rows, l) -> (n_cols, l)
+        return self._reduce(self._col_ptr, self.data[self._by_col], self._row_of[self._by_col], dense, self.block_nnz)
+
+
+def _top_right_singular_vectors(x: _SparseRows, k: int, oversample: int = 10, n_iter: int = 2, seed: int = 0) -> np.ndarray:
+    # Рандомизированный SVD (Halko et al.): базис образа X через случайную проекцию и степенные итерации,
+    # затем собственное разложение маленькой l x l матрицы. Полный SVD не нужен: берём только k векторов.
+    l = min(k + oversample, x.n_rows, x.n_cols)
+    if l == x.n_rows:
+        # документов меньше, чем нужно векторов с запасом: базис образа - все строки, разложение точное (Грам n x n)
+        q = np.eye(x.n_rows)
+    else:
+        rng = np.random.default_rng(seed)
+        q, _ = np.linalg.qr(x.matmul(rng.standard_normal((x.n_cols, l))))
+        for _ in range(n_iter):
+            z, _ = np.linalg.qr(x.rmatmul(q))
+            q, _ = np.linalg.qr(x.matmul(z))
+
+    # X.T q = Z; Z.T Z = W S^2 W.T => правые сингулярные векторы X ~ Z W / S
+    z = x.rmatmul(q)
+    evals, w = np.linalg.eigh(z.T @ z)
+    order = np.argsort(evals)[::-1][:k]
+    s = np.sqrt(np.maximum(evals[order], 0.0))
+    v = (z @ w[:, order]) / np.where(s == 0.0, 1.0, s)
+    # знак фиксируем, чтобы модель (и её отпечаток) не зависела от деталей разложения
+    signs = np.sign(v[np.abs(v).argmax(axis=0), np.arange(v.shape[1])])
+    return np.ascontiguousarray(v * np.where(signs == 0.0, 1.0, signs), dtype=np.float32)
+
+
+class LocalEmbedder:
+    # Локальные эмбеддинги без сети: символьные n-граммы -> хэш-корзины -> TF-IDF -> проекция SVD,
+    # обученная на текстах базы знаний. Имя модели включает отпечаток обученных параметров,
+    # поэтому после переобучения проверка модели в Retriever и кэш эмбеддингов не смешают версии.
+    def __init__(
+        self,
+        buckets: np.ndarray,
+        idf: np.ndarray,
+        projection: np.ndarray,
+        ngram_range: tuple[int, int] = (3, 5),
+        hash_bits: int = 20,
+    ) -> None:
+        self.buckets = buckets
+        self.idf = idf
+        self.projection = projection
+        self.ngram_range = ngram_range
+        self.hash_bits = hash_bits
+
+        digest = hashlib.sha256()
+        digest.update(json.dumps([list(ngram_range), hash_bits]).encode('utf-8'))
+        for arr in (buckets, idf, projection):
+            digest.update(np.ascontiguousarray(arr).tobytes())
+        self._model = f'local-ngram-tfidf-svd-{self.dim}-{digest.hexdigest()[:12]}'
+
+    @property
+    def model(self) -> str:
+        return self._model
+
+    @property
+    def dim(self) -> int:
+        return int(self.projection.shape[1])
+
+    def _features(self, text: str) -> Counter:
+        t = ' ' + _SPACE_RE.sub(' ', text.lower().replace('ё', 'е')).strip() + ' '
+        mask = (1 << self.hash_bits) - 1
+        lo, hi = self.ngram_range
+        return Counter(
+            zlib.crc32(t[i: i + n].encode('utf-8')) & mask
+            for n in range(lo, hi + 1)
+            for i in range(len(t) - n + 1)
+        )
+
+    def _tfidf_row(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        # позиции среди известных корзин и веса; незнакомые n-граммы в проекции всё равно дают ноль
+        counts = self._features(text)
+        ids = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+
+        pos = np.searchsorted(self.buckets, ids)
+        pos = np.minimum(pos, self.buckets.shape[0] - 1)
+        known = self.buckets[pos] == ids
+        pos, tf = pos[known], tf[known]
+
+        weights = (1.0 + np.log(tf)) * self.idf[pos]
+        norm = float(np.linalg.norm(weights))
+        return pos, weights / (norm or 1.0)
+
+    def _embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for r, text in enumerate(texts):
+            pos, weights = self._tfidf_row(text)
+            if pos.shape[0]:
+                out[r] = weights @ self.projection[pos]
+        return out
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        batch = [t.strip() for t in texts]
+        for t in batch:
+            if not t:
+                raise ValueError('Нельзя получить embedding для пустой строки')
+        return self._embed(batch).tolist()
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        return self.embed_texts(queries)
+
+    def embed_query(self, query: str) -> List[float]:
+        q = (query or '').strip()
+        if not q:
+            raise ValueError('Пустой запрос')
+        return self.embed_texts([q])[0]
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp.npz'
+        np.savez_compressed(
+            tmp,
+            buckets=self.buckets,
+            idf=self.idf,
+            projection=self.projection,
+            ngram_range=np.array(self.ngram_range, dtype=np.int64),
+            hash_bits=np.array(self.hash_bits, dtype=np.int64),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> LocalEmbedder:
+        with np.load(path) as data:
+            lo, hi = (int(x) for x in data['ngram_range'])
+            return cls(
+                buckets=data['buckets'],
+                idf=data['idf'].astype(np.float32),
+                projection=data['projection'].astype(np.float32),
+                ngram_range=(lo, hi),
+                hash_bits=int(data['hash_bits']),
+            )
+
+    @classmethod
+    def fit(
+        cls,
+        texts: Sequence[str],
+        dim: int = 256,
+        ngram_range: tuple[int, int] = (3, 5),
+        hash_bits: int = 20,
+    ) -> LocalEmbedder:
+        docs = [t.strip() for t in texts if t and t.strip()]
+        if not docs:
+            raise ValueError('Нельзя обучить локальные эмбеддинги на пустом корпусе')
+
+        probe = cls(
+            buckets=np.zeros(0, dtype=np.int64),
+            idf=np.zeros(0, dtype=np.float32),
+            projection=np.zeros((0, 1), dtype=np.float32),
+            ngram_range=ngram_range,
+            hash_bits=hash_bits,
+        )
+        rows = [probe._features(t) for t in docs]
+
+        df: Counter = Counter()
+        for counts in rows:
+            df.update(counts.keys())
+        buckets = np.array(sorted(df), dtype=np.int64)
+        col = {int(b): i for i, b in enumerate(buckets.tolist())}
+
+        n = len(docs)
+        idf = np.array([math.log((1 + n) / (1 + df[int(b)])) + 1.0 for b in buckets], dtype=np.float32)
+
+        # TF-IDF матрица в разреженном виде (CSR): плотная n x корзин не помещается в память на больших корпусах
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(counts) for counts in rows])
+        indices = np.empty(int(indptr[-1]), dtype=np.int64)
+        data = np.empty(int(indptr[-1]), dtype=np.float32)
+        for r, counts in enumerate(rows):
+            s, e = indptr[r], indptr[r + 1]
+            indices[s:e] = np.fromiter((col[b] for b in counts.keys()), dtype=np.int64, count=len(counts))
+            tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            weights = (1.0 + np.log(tf)) * idf[indices[s:e]]
+            data[s:e] = weights / (float(np.linalg.norm(weights)) or 1.0)
+
+        # правые сингулярные векторы TF-IDF матрицы: ранг не больше числа документов
+        k = max(1, min(dim, n, buckets.shape[0]))
+        projection = _top_right_singular_vectors(_SparseRows(indptr, indices, data, buckets.shape[0]), k)
+
+        return cls(buckets=buckets, idf=idf, projection=projection, ngram_range=ngram_range, hash_bits=hash_bits)
+
+
+def load_or_fit_local_embedder(
+    path: str,
+    texts: Callable[[], Sequence[str]],
+    dim: int = 256,
+    refit: bool = False,
+    model_dir: str | None = None,
+) -> LocalEmbedder:
+    # texts - функция: корпус для обучения читается, только если модели на диске нет или нужно переобучить.
+    # model_dir - папка опубликованной версии индекса: её модель важнее общего файла path.
+    if not refit:
+        if model_dir is not None and os.path.exists(os.path.join(model_dir, LOCAL_EMBEDDER_FILE)):
+            return LocalEmbedder.load(os.path.join(model_dir, LOCAL_EMBEDDER_FILE))
+        if os.path.exists(path):
+            return LocalEmbedder.load(path)
+
+    embedder = LocalEmbedder.fit(texts(), dim=dim)
+    # переобученная модель попадает на диск только вместе с новой версией индекса (rebuild_kb_index),
+    # иначе процесс, стартовавший до публикации, взял бы модель, не совпадающую с живым индексом
+    if not refit:
+        embedder.save(path)
+    return embedder
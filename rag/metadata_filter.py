@@ -0,0 +1,81 @@
+from __future__ import annotations
+import json
+import os
+from typing import Any, Dict, Iterable, List, Mapping, Sequence
+import numpy as np
+
+METADATA_FILES: tuple[str, ...] = ('metadata_bitmaps.npz',)
+
+
+def _values(value: Any) -> List[str]:
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+class MetadataBitmaps:
+    # Для каждой пары (поле metadata, значение) - упакованная битовая маска по строкам индекса.
+    # Фильтр вычисляется побитовыми AND/OR над масками, не трогая сами chunks.
+    #
+    # Выражение фильтра: {'topic': 'law_223fz'} - равенство; {'topic': ['law_44fz', 'law_223fz']} - любое из;
+    # {'role': {'not': 'customer'}} - исключение; несколько полей объединяются через AND.
+    def __init__(self, size: int, keys: List[tuple[str, str]], bits: np.ndarray) -> None:
+        self.size = size
+        self._keys = {key: i for i, key in enumerate(keys)}
+        self._bits = bits
+        self._n_bytes = (size + 7) // 8
+
+    @classmethod
+    def build(cls, items: Iterable[Mapping[str, Any]]) -> MetadataBitmaps:
+        rows: Dict[tuple[str, str], List[int]] = {}
+        size = 0
+        for i, item in enumerate(items):
+            size = i + 1
+            metadata = item.get('metadata')
+            if not isinstance(metadata, dict):
+                continue
+            for field, value in metadata.items():
+                for v in _values(value):
+                    rows.setdefault((str(field), v), []).append(i)
+
+        keys = sorted(rows)
+        bits = np.zeros((len(keys), (size + 7) // 8), dtype=np.uint8)
+        for r, key in enumerate(keys):
+            dense = np.zeros(size, dtype=bool)
+            dense[rows[key]] = True
+            bits[r] = np.packbits(dense)
+        return cls(size=size, keys=keys, bits=bits)
+
+    def _bitmap(self, field: str, values: Sequence[str]) -> np.ndarray:
+        out = np.zeros(self._n_bytes, dtype=np.uint8)
+        for v in values:
+            r = self._keys.get((field, v))
+            if r is not None:
+                np.bitwise_or(out, self._bits[r], out=out)
+        return out
+
+    def mask(self, where: Mapping[str, Any]) -> np.ndarray:
+        acc = np.full(self._n_bytes, 0xFF, dtype=np.uint8)
+        for field, cond in where.items():
+            if isinstance(cond, Mapping):
+                if set(cond) != {'not'}:
+                    raise ValueError(f'Неподдерживаемое условие фильтра для {field}: {cond}')
+                np.bitwise_and(acc, np.invert(self._bitmap(str(field), _values(cond['not']))), out=acc)
+            else:
+                np.bitwise_and(acc, self._bitmap(str(field), _values(cond)), out=acc)
+        return np.unpackbits(acc, count=self.size).astype(bool)
+
+    def save(self, dir_path: str) -> None:
+        tmp = os.path.join(dir_path, '.metadata_bitmaps.tmp.npz')
+        keys = json.dumps(sorted(self._keys, key=self._keys.get), ensure_ascii=False)
+        np.savez(tmp, size=np.array(self.size, dtype=np.int64), keys=np.array(keys), bits=self._bits)
+        os.replace(tmp, os.path.join(dir_path, 'metadata_bitmaps.npz'))
+
+    @classmethod
+    def load(cls, dir_path: str) -> MetadataBitmaps | None:
+        path = os.path.join(dir_path, 'metadata_bitmaps.npz')
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            keys = [tuple(k) for k in json.loads(str(data['keys']))]
+            return cls(size=int(data['size']), keys=keys, bits=data['bits'])
@@ -0,0 +1,110 @@
+from __future__ import annotations
+import os
+import numpy as np
+
+# Понижение размерности индекса: поиск идёт по матрице меньшей размерности, запрос проецируется так же.
+# truncate - первые dim координат (Matryoshka: text-embedding-3-* обучены так, что префикс вектора - тоже эмбеддинг),
+# pca      - проекция на главные компоненты, обученные на векторах базы знаний (подходит любой модели).
+# После проекции строки заново нормируются, чтобы скалярное произведение оставалось косинусом.
+PROJECTION_KINDS: tuple[str, ...] = ('truncate', 'pca')
+PROJECTION_FILES: tuple[str, ...] = ('projection.npz', 'vectors.full.npy')
+# больше строк для PCA не нужно: компоненты по выборке почти не отличаются от компонент по всем векторам
+PCA_SAMPLE_ROWS: int = 50_000
+
+
+class Projection:
+    def __init__(
+        self,
+        kind: str,
+        full_dim: int,
+        dim: int,
+        mean: np.ndarray | None = None,
+        components: np.ndarray | None = None,
+    ) -> None:
+        if kind not in PROJECTION_KINDS:
+            raise ValueError(f'Неизвестный вид проекции: {kind}')
+        if kind == 'pca' and (mean is None or components is None):
+            raise ValueError('Для PCA нужны mean и components')
+
+        self.kind = kind
+        self.full_dim = int(full_dim)
+        self.dim = int(dim)
+        self.mean = mean
+        self.components = components
+
+    def apply(self, mat: np.ndarray) -> np.ndarray:
+        # (..., full_dim) -> (..., dim), строки нормированы
+        x = np.asarray(mat, dtype=np.float32)
+        if x.shape[-1] != self.full_dim:
+            raise ValueError(f'Ожидалась размерность {self.full_dim}, получено {x.shape[-1]}')
+
+        if self.kind == 'truncate':
+            out = np.array(x[..., :self.dim], dtype=np.float32)
+        else:
+            out = ((x - self.mean) @ self.components).astype(np.float32)
+
+        norms = np.linalg.norm(out, axis=-1, keepdims=True)
+        return out / np.where(norms == 0.0, 1.0, norms)
+
+    def save(self, dir_path: str) -> None:
+        arrays = {
+            'kind': np.array(self.kind),
+            'full_dim': np.array(self.full_dim, dtype=np.int64),
+            'dim': np.array(self.dim, dtype=np.int64),
+        }
+        if self.kind == 'pca':
+            arrays['mean'] = self.mean
+            arrays['components'] = self.components
+
+        tmp = os.path.join(dir_path, '.projection.tmp.npz')
+        np.savez(tmp, **arrays)
+        os.replace(tmp, os.path.join(dir_path, 'projection.npz'))
+
+    @classmethod
+    def load(cls, dir_path: str) -> Projection | None:
+        path = os.path.join(dir_path, 'projection.npz')
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            kind = str(data['kind'])
+            return cls(
+                kind=kind,
+                full_dim=int(data['full_dim']),
+                dim=int(data['dim']),
+                mean=data['mean'].astype(np.float32) if kind == 'pca' else None,
+                components=data['components'].astype(np.float32) if kind == 'pca' else None,
+            )
+
+
+def fit_projection(vectors: np.ndarray, kind: str, dim: int, seed: int = 0) -> Projection:
+    n, full_dim = int(vectors.shape[0]), int(vectors.shape[1])
+    if dim <= 0:
+        raise ValueError('Размерность проекции должна быть > 0')
+
+    if kind == 'truncate':
+        return Projection('truncate', full_dim=full_dim, dim=min(dim, full_dim))
+    if kind != 'pca':
+        raise ValueError(f'Неизвестный вид проекции: {kind}')
+
+    if n > PCA_SAMPLE_ROWS:
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(vectors[np.sort(rng.choice(n, size=PCA_SAMPLE_ROWS, replace=False))], dtype=np.float32)
+    else:
+        sample = np.asarray(vectors, dtype=np.float32)
+
+    # главные компоненты - собственные векторы ковариации full_dim x full_dim: это дешевле SVD
+    # всей выборки (rows x full_dim), а матрица ковариации не зависит от числа строк
+    mean = sample.mean(axis=0, dtype=np.float64)
+    centered = sample - mean.astype(np.float32)
+    cov = (centered.T @ centered).astype(np.float64) / max(1, sample.shape[0] - 1)
+    evals, evecs = np.linalg.eigh(cov)
+    # компонент не больше, чем строк в выборке (ранг ковариации)
+    k = max(1, min(dim, full_dim, sample.shape[0]))
+    top = np.argsort(evals)[::-1][:k]
+    return Projection(
+        'pca',
+        full_dim=full_dim,
+        dim=k,
+        mean=mean.astype(np.float32),
+        components=np.ascontiguousarray(evecs[:, top], dtype=np.float32),
+    )
@@ -0,0 +1,125 @@
+from __future__ import annotations
+import os
+from dataclasses import dataclass
+import numpy as np
+
+# Квантованная копия матрицы для первичного отбора. Только int8: в NumPy нет BLAS для float16,
+# и скан float16 (перевод во float32 + умножение) в разы медленнее скана float32, а int8
+# расширяется во float32 дёшево и читает из памяти вчетверо меньше байт.
+QUANTIZATION_KINDS = ('int8',)
+
+# блок строк, который за раз расширяется во float32 для матричного умножения:
+# буфер (128 x 1536 x 4 байт) переиспользуется и остаётся в кэше процессора
+SCORE_BLOCK_ROWS: int = 128
+
+
+@dataclass
+class QuantizedMatrix:
+    data: np.ndarray
+    kind: str
+    scales: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.data.nbytes + self.scales.nbytes)
+
+    def _scan(self, q: np.ndarray) -> np.ndarray:
+        # q - (dim,) или (dim, m), уже домноженный на scales -> очки (n,) или (n, m)
+        n, dim = int(self.data.shape[0]), int(self.data.shape[1])
+        out = np.empty((n, *q.shape[1:]), dtype=np.float32)
+        buf = np.empty((min(n, SCORE_BLOCK_ROWS), dim), dtype=np.float32)
+        for start in range(0, n, SCORE_BLOCK_ROWS):
+            block = self.data[start: start + SCORE_BLOCK_ROWS]
+            rows = buf[:block.shape[0]]
+            np.copyto(rows, block, casting='unsafe')
+            np.dot(rows, q, out=out[start: start + block.shape[0]])
+        return out
+
+    def score(self, q_vec: np.ndarray) -> np.ndarray:
+        # x ~ data * scales  =>  x @ q ~ data @ (scales * q)
+        return self._scan((q_vec * self.scales).astype(np.float32))
+
+    def score_many(self, q_mat: np.ndarray) -> np.ndarray:
+        # то же, что score, но сразу для матрицы запросов (m x dim) -> (m x n)
+        return self._scan((q_mat * self.scales).T.astype(np.float32)).T
+
+    def save(self, dir_path: str) -> None:
+        arrays = {f'vectors.{self.kind}.npy': self.data, f'vectors.{self.kind}.scales.npy': self.scales}
+
+        # через временный файл и os.replace, как и основная матрица: открытые mmap остаются валидными
+        for name, arr in arrays.items():
+            tmp = os.path.join(dir_path, f'.{name}.tmp')
+            with open(tmp, 'wb') as f:
+                np.save(f, arr)
+            os.replace(tmp, os.path.join(dir_path, name))
+
+    @classmethod
+    def load(cls, dir_path: str, mmap: bool = True) -> QuantizedMatrix | None:
+        for kind in QUANTIZATION_KINDS:
+            path = os.path.join(dir_path, f'vectors.{kind}.npy')
+            if not os.path.exists(path):
+                continue
+            data = np.load(path, mmap_mode='r' if mmap else None)
+            scales = np.load(os.path.join(dir_path, f'vectors.{kind}.scales.npy'))
+            return cls(data=data, kind=kind, scales=scales)
+        return None
+
+
+def quantization_files() -> list[str]:
+    return [name for kind in QUANTIZATION_KINDS for name in (f'vectors.{kind}.npy', f'vectors.{kind}.scales.npy')]
+
+
+def quantize(vectors: np.ndarray, kind: str) -> QuantizedMatrix:
+    if kind not in QUANTIZATION_KINDS:
+        raise ValueError(f'Неизвестный тип квантования: {kind}')
+
+    mat = np.asarray(vectors, dtype=np.float32)
+    # симметричное скалярное квантование с отдельным масштабом на каждую размерность
+    max_abs = np.abs(mat).max(axis=0)
+    scales = np.where(max_abs == 0.0, 1.0, max_abs / 127.0).astype(np.float32)
+    data = np.clip(np.rint(mat / scales), -127, 127).astype(np.int8)
+    return QuantizedMatrix(data=data, kind=kind, scales=scales)
+
+
+def rescore_shortlist(
+    vectors: np.ndarray,
+    approx_scores: np.ndarray,
+    q_vec: np.ndarray,
+    k: int,
+    shortlist: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    # грубый отбор по квантованной матрице, затем точный пересчёт только по shortlist строк float32
+    n = int(approx_scores.shape[0])
+    m = min(max(k, shortlist), n)
+    cand = np.argpartition(-approx_scores, kth=m - 1)[:m]
+    cand.sort()
+
+    exact = np.asarray(vectors[cand], dtype=np.float32) @ q_vec
+    k_eff = min(k, m)
+    top = np.argpartition(-exact, kth=k_eff - 1)[:k_eff]
+    top = top[np.argsort(-exact[top])]
+    return cand[top], exact[top]
+
+
+def rescore_shortlist_many(
+    vectors: np.ndarray,
+    approx_scores: np.ndarray,
+    q_mat: np.ndarray,
+    k: int,
+    shortlist: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    # пакетный вариант rescore_shortlist: approx_scores (m x n), q_mat (m x dim) -> (m x k)
+    n = int(approx_scores.shape[1])
+    m = min(max(k, shortlist), n)
+    cand = np.argpartition(-approx_scores, kth=m - 1, axis=1)[:, :m]
+
+    # точный пересчёт: одна выборка строк float32 и поэлементное скалярное произведение
+    cand_vecs = np.asarray(vectors[cand.ravel()], dtype=np.float32).reshape(cand.shape[0], m, -1)
+    exact = np.einsum('qmd,qd->qm', cand_vecs, q_mat)
+
+    k_eff = min(k, m)
+    top = np.argpartition(-exact, kth=k_eff - 1, axis=1)[:, :k_eff]
+    top_scores = np.take_along_axis(exact, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    return np.take_along_axis(cand, top, axis=1), np.take_along_axis(top_scores, order, axis=1)
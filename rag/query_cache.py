@@ -0,0 +1,110 @@
+from __future__ import annotations
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List
+import numpy as np
+
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    return _SPACE_RE.sub(' ', (query or '').strip()).casefold()
+
+
+class QueryEmbeddingCache:
+    # LRU + TTL кэш эмбеддингов запросов в памяти, ключ = (модель, нормализованный текст).
+    # Если задан path, содержимое читается при создании и сохраняется при выходе из процесса.
+    def __init__(self, max_size: int = 1024, ttl_seconds: float | None = 3600.0, path: str | None = None) -> None:
+        self.max_size = max(1, int(max_size))
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self._data: OrderedDict[tuple[str, str], tuple[np.ndarray, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def get(self, model: str, query: str) -> np.ndarray | None:
+        key = (model, normalize_query(query))
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self._expired(entry[1], now):
+                del self._data[key]
+                self.evictions += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, model: str, query: str, vector: np.ndarray) -> None:
+        key = (model, normalize_query(query))
+        with self._lock:
+            self._data[key] = (np.asarray(vector, dtype=np.float32), time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def save(self) -> None:
+        if not self.path:
+            return
+
+        with self._lock:
+            entries = list(self._data.items())
+
+        keys: List[List[Any]] = [[model, query, stored_at] for (model, query), (_, stored_at) in entries]
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp.npz'
+        # векторы разных моделей могут иметь разную размерность, поэтому храним их плоско со смещениями
+        flat = np.concatenate([vec for _, (vec, _) in entries]) if entries else np.zeros(0, dtype=np.float32)
+        offsets = np.cumsum([0] + [int(vec.shape[0]) for _, (vec, _) in entries]).astype(np.int64)
+        np.savez(tmp, keys=np.array(json.dumps(keys, ensure_ascii=False)), vectors=flat, offsets=offsets)
+        os.replace(tmp, self.path)
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        with np.load(self.path) as data:
+            keys = json.loads(str(data['keys']))
+            flat, offsets = data['vectors'], data['offsets']
+        now = time.time()
+        with self._lock:
+            for i, (model, query, stored_at) in enumerate(keys):
+                if self._expired(stored_at, now):
+                    continue
+                self._data[(model, query)] = (flat[offsets[i]: offsets[i + 1]].astype(np.float32), stored_at)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
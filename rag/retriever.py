@@ -1,72 +1,424 @@
 from __future__ import annotations
+import logging
 from dataclasses import dataclass
-from typing import Any, List
+from typing import Any, List, Mapping, Sequence
 import numpy as np
-from rag.embeddings import EmbeddingsClient
+from rag.config import (
+    RAG_ANN_MIN_ROWS,
+    RAG_CHARS_PER_TOKEN,
+    RAG_CONTEXT_TOKEN_BUDGET,
+    RAG_HYBRID,
+    RAG_HYBRID_DEPTH,
+    RAG_IVF_NPROBE,
+    RAG_MMR_CANDIDATES,
+    RAG_MMR_LAMBDA,
+    RAG_QUANTIZED_MIN_ROWS,
+    RAG_QUERY_CACHE_SIZE,
+    RAG_QUERY_CACHE_TTL,
+    RAG_RESCORE_FACTOR,
+    RAG_RRF_K,
+)
+from rag.context import CONTEXT_SEPARATOR, estimate_tokens, mmr_order
+from rag.embeddings import EmbeddingBackend
 from rag.index import VectorIndex
+from rag.lexical import reciprocal_rank_fusion
+from rag.quantize import rescore_shortlist, rescore_shortlist_many
+from rag.query_cache import QueryEmbeddingCache
+from rag.shards import ShardedMatrix
+
+# сколько запросов retrieve_many скорит за один матричный проход (матрица очков m x n)
+QUERY_BLOCK_ROWS: int = 64
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass(frozen=True)
 class RetrievalResult:
+    # score - всегда косинус с запросом (при ответе только по BM25 - оценка BM25),
+    # rrf_score - оценка слияния в гибридном режиме, по ней отсортирована выдача
     score: float
     chunk_id: str
     text: str
     metadata: dict[str, Any]
+    rrf_score: float | None = None
+
+
+@dataclass(frozen=True)
+class RetrievedContext:
+    hits: list[RetrievalResult]
+    context: str
+    tokens: int
 
 
 class Retriever:
-    def __init__(self, index: VectorIndex, embedder: EmbeddingsClient) -> None:
+    def __init__(
+        self,
+        index: VectorIndex,
+        embedder: EmbeddingBackend,
+        rescore_factor: int = RAG_RESCORE_FACTOR,
+        nprobe: int = RAG_IVF_NPROBE,
+        hybrid: bool = RAG_HYBRID,
+        query_cache: QueryEmbeddingCache | None = None,
+    ) -> None:
         if index.model != embedder.model:
             raise ValueError(f'Модель для векторизации базы знаний != модели векторизации запроса: {index.model} vs {embedder.model}')
 
         self._index = index
         self._embedder = embedder
+        self._rescore_factor = max(1, int(rescore_factor))
+        self.nprobe = nprobe
+        # гибрид возможен только если рядом с индексом сохранён BM25
+        self.hybrid = hybrid and index.lexical is not None
+        # кэш можно передать общий (например, из сервиса, чтобы он переживал перезагрузку индекса)
+        if query_cache is None and RAG_QUERY_CACHE_SIZE > 0:
+            query_cache = QueryEmbeddingCache(max_size=RAG_QUERY_CACHE_SIZE, ttl_seconds=RAG_QUERY_CACHE_TTL)
+        self.query_cache = query_cache
 
-    def retrieve(self, query: str, top_k: int = 6) -> list[RetrievalResult]:
-        k = int(top_k)
-        if k <= 0:
-            return []
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        model = self._embedder.model
+        cache = self.query_cache
+        vecs: List[np.ndarray | None] = [cache.get(model, q) if cache is not None else None for q in queries]
+        missing = [i for i, v in enumerate(vecs) if v is None]
 
-        q_vec = np.array(self._embedder.embed_query(query), dtype=np.float32)
-        if q_vec.ndim != 1:
-            raise ValueError('Query embedding must be 1D')
+        if missing:
+            if len(missing) == 1:
+                # одиночный запрос идёт через embed_query (его может собрать в батч QueryMicroBatcher)
+                raw = [self._embedder.embed_query(queries[missing[0]])]
+            else:
+                raw = self._embedder.embed_queries([queries[i] for i in missing])
 
-        q_norm = float(np.linalg.norm(q_vec))
-        if q_norm == 0.0:
-            q_norm = 1.0
-        q_vec = q_vec / q_norm
+            fresh = np.array(raw, dtype=np.float32)
+            if fresh.ndim != 2 or fresh.shape[0] != len(missing):
+                raise ValueError('Query embeddings must be 2D')
 
-        scores = self._index.vectors @ q_vec
-        n = int(scores.shape[0])
+            norms = np.linalg.norm(fresh, axis=1, keepdims=True)
+            fresh = fresh / np.where(norms == 0.0, 1.0, norms)
+            for i, vec in zip(missing, fresh):
+                vecs[i] = vec
+                if cache is not None:
+                    cache.put(model, queries[i], vec)
+
+        return np.stack(vecs)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        # нормированный вектор запроса через тот же кэш, что и retrieve (нужен, например, кэшу ответов)
+        q = (query or '').strip()
+        if not q:
+            raise ValueError('Пустой запрос')
+        return self._embed_queries([q])[0]
+
+    def _project(self, q: np.ndarray) -> np.ndarray:
+        # запрос в пространство индекса (после понижения размерности - той же проекцией, что и chunks)
+        projection = self._index.projection
+        return q if projection is None else projection.apply(q)
+
+    def _shortlist(self, k: int) -> int:
+        return k * self._rescore_factor if self._index.full_vectors is not None else k
+
+    def _rescore_full(
+        self,
+        top_idx: np.ndarray,
+        top_scores: np.ndarray,
+        q_full: np.ndarray,
+        k: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # shortlist, найденный по спроецированным векторам, досчитываем по исходным (читаются только эти строки)
+        full = self._index.full_vectors
+        if full is None or top_idx.shape[0] == 0:
+            return top_idx[:k], top_scores[:k]
+
+        exact = np.asarray(full[top_idx], dtype=np.float32) @ q_full
+        order = np.argsort(-exact, kind='stable')[:k]
+        return top_idx[order], exact[order]
+
+    def _filter_rows(self, where: Mapping[str, Any] | None) -> tuple[np.ndarray | None, np.ndarray | None]:
+        if not where:
+            return None, None
+        mask = self._index.metadata_bitmaps().mask(where)
+        return mask, np.flatnonzero(mask)
+
+    def _search_rows(self, q_mat: np.ndarray, k: int, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # после фильтра по metadata точно скорим только уцелевшие строки
+        if rows.shape[0] == 0:
+            return np.empty((q_mat.shape[0], 0), dtype=np.int64), np.empty((q_mat.shape[0], 0), dtype=np.float32)
+
+        sub = np.asarray(self._index.vectors[rows], dtype=np.float32)
+        scores = q_mat @ sub.T
+        k_eff = min(k, int(rows.shape[0]))
+        top = np.argpartition(-scores, kth=k_eff - 1, axis=1)[:, :k_eff]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return rows[np.take_along_axis(top, order, axis=1)], np.take_along_axis(top_scores, order, axis=1)
+
+    def _search(
+        self,
+        q_vec: np.ndarray,
+        k: int,
+        exact: bool = False,
+        rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        n = int(self._index.vectors.shape[0])
         if n == 0:
-            return []
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        if rows is not None:
+            top_idx, top_scores = self._search_rows(q_vec[None, :], k, rows)
+            return top_idx[0], top_scores[0]
+
+        ann = self._index.ann
+        if ann is not None and not exact and n >= RAG_ANN_MIN_ROWS:
+            top_idx, top_scores = ann.search(self._index.vectors, q_vec, k, nprobe=self.nprobe)
+            # если в просмотренных списках меньше k кандидатов - падаем на точный перебор
+            if top_idx.shape[0] >= min(k, n):
+                return top_idx, top_scores
+
+        quantized = self._index.quantized
+        if quantized is not None and not exact and n >= RAG_QUANTIZED_MIN_ROWS:
+            approx = quantized.score(q_vec)
+            return rescore_shortlist(self._index.vectors, approx, q_vec, k, shortlist=k * self._rescore_factor)
+
+        if isinstance(self._index.vectors, ShardedMatrix):
+            # top-k считается в каждом шарде параллельно и сливается, полный вектор очков не собирается
+            top_idx, top_scores = self._index.vectors.topk(q_vec[None, :], k)
+            return top_idx[0], top_scores[0]
 
+        scores = self._index.vectors @ q_vec
         k_eff = min(k, n)
 
         top_idx = np.argpartition(-scores, kth=k_eff - 1)[:k_eff]
         top_idx = top_idx[np.argsort(-scores[top_idx])]
+        return top_idx, scores[top_idx]
 
-        out: List[RetrievalResult] = []
-        for i in top_idx.tolist():
-            item = self._index.items[i]
-            out.append(
-                RetrievalResult(
-                    score=float(scores[i]),
-                    chunk_id=str(item.get('id')),
-                    text=str(item.get('text')),
-                    metadata=item.get('metadata') if isinstance(item.get('metadata'), dict) else {},
-                )
+    def _search_many(
+        self,
+        q_mat: np.ndarray,
+        k: int,
+        exact: bool = False,
+        rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if rows is not None:
+            return self._search_rows(q_mat, k, rows)
+
+        n = int(self._index.vectors.shape[0])
+        k_eff = min(k, n)
+
+        quantized = self._index.quantized
+        if quantized is not None and not exact and n >= RAG_QUANTIZED_MIN_ROWS:
+            return rescore_shortlist_many(
+                self._index.vectors, quantized.score_many(q_mat), q_mat, k, shortlist=k * self._rescore_factor
             )
 
-        return out
+        if isinstance(self._index.vectors, ShardedMatrix):
+            return self._index.vectors.topk(q_mat, k)
+
+        scores = (self._index.vectors @ q_mat.T).T
+        top_idx = np.argpartition(-scores, kth=k_eff - 1, axis=1)[:, :k_eff]
+        top_scores = np.take_along_axis(scores, top_idx, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top_idx, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def _result(self, i: int, score: float, rrf_score: float | None = None) -> RetrievalResult:
+        item = self._index.items[i]
+        return RetrievalResult(
+            score=float(score),
+            chunk_id=str(item.get('chunk_id', item.get('id'))),
+            text=str(item.get('text')),
+            metadata=item.get('metadata') if isinstance(item.get('metadata'), dict) else {},
+            rrf_score=None if rrf_score is None else float(rrf_score),
+        )
+
+    def _depth(self, k: int) -> int:
+        return k * max(1, RAG_HYBRID_DEPTH) if self.hybrid else k
+
+    def _lexical_only(self, query: str, k: int, mask: np.ndarray | None = None) -> List[tuple[int, float, float | None]]:
+        top_idx, top_scores = self._index.lexical.search(query, k, mask=mask)
+        return [(i, s, None) for i, s in zip(top_idx.tolist(), top_scores.tolist())]
+
+    def _cosine(self, rows: List[int], q_vec: np.ndarray, q_full: np.ndarray) -> List[float]:
+        # косинус для строк, найденных только BM25: по исходным векторам, если они сохранены
+        full = self._index.full_vectors
+        if full is not None:
+            return (np.asarray(full[np.array(rows)], dtype=np.float32) @ q_full).tolist()
+        return (np.asarray(self._index.vectors[np.array(rows)], dtype=np.float32) @ q_vec).tolist()
+
+    def _finish(
+        self,
+        query: str,
+        dense: List[tuple[int, float]],
+        k: int,
+        q_vec: np.ndarray,
+        q_full: np.ndarray,
+        mask: np.ndarray | None = None,
+    ) -> List[tuple[int, float, float | None]]:
+        # (строка индекса, косинус, RRF-оценка или None)
+        if not self.hybrid:
+            return [(i, s, None) for i, s in dense[:k]]
+
+        # порядок - по RRF, а score остаётся косинусом: у вызывающих одна шкала в обоих режимах
+        lex_idx, _ = self._index.lexical.search(query, self._depth(k), mask=mask)
+        fused = reciprocal_rank_fusion([[i for i, _ in dense], lex_idx.tolist()], k=k, rrf_k=RAG_RRF_K)
+        cosine = dict(dense)
+        missing = [i for i, _ in fused if i not in cosine]
+        if missing:
+            cosine.update(zip(missing, self._cosine(missing, q_vec, q_full)))
+        return [(i, cosine[i], s) for i, s in fused]
+
+    def _rank(
+        self,
+        query: str,
+        k: int,
+        exact: bool = False,
+        where: Mapping[str, Any] | None = None,
+    ) -> tuple[List[tuple[int, float, float | None]], np.ndarray | None]:
+        # (строка индекса, score, rrf_score) и нормированный вектор запроса (None, если ответили только по BM25)
+        q = (query or '').strip()
+        if not q:
+            raise ValueError('Пустой запрос')
+
+        mask, rows = self._filter_rows(where)
+        if rows is not None and rows.shape[0] == 0:
+            return [], None
+
+        try:
+            q_full = self._embed_queries([q])[0]
+        except Exception:
+            if self._index.lexical is None:
+                raise
+            # API эмбеддингов недоступен: отвечаем по BM25 без сети
+            logger.warning('Эмбеддинг запроса не получен, используется только BM25', exc_info=True)
+            return self._lexical_only(q, k, mask=mask), None
+
+        q_vec = self._project(q_full)
+        depth = self._depth(k)
+        top_idx, top_scores = self._search(q_vec, self._shortlist(depth), exact=exact, rows=rows)
+        top_idx, top_scores = self._rescore_full(top_idx, top_scores, q_full, depth)
+        return self._finish(q, list(zip(top_idx.tolist(), top_scores.tolist())), k, q_vec, q_full, mask=mask), q_vec
+
+    def retrieve(
+        self,
+        query: str,
+        top_k: int = 6,
+        exact: bool = False,
+        where: Mapping[str, Any] | None = None,
+    ) -> list[RetrievalResult]:
+        # where - фильтр по metadata chunks, см. MetadataBitmaps: {'topic': 'law_223fz', 'role': 'supplier'}
+        k = int(top_k)
+        if k <= 0:
+            return []
+
+        ranked, _ = self._rank(query, k, exact=exact, where=where)
+        return [self._result(*hit) for hit in ranked]
+
+    def retrieve_many(
+        self,
+        queries: Sequence[str],
+        top_k: int = 6,
+        exact: bool = False,
+        where: Mapping[str, Any] | None = None,
+    ) -> list[list[RetrievalResult]]:
+        k = int(top_k)
+        if k <= 0 or not queries:
+            return [[] for _ in queries]
+
+        cleaned = [(q or '').strip() for q in queries]
+        if not all(cleaned):
+            raise ValueError('Пустой запрос')
+
+        mask, rows = self._filter_rows(where)
+        if rows is not None and rows.shape[0] == 0:
+            return [[] for _ in queries]
+
+        # один вызов API на все уникальные запросы, которых нет в кэше
+        unique = list(dict.fromkeys(cleaned))
+        try:
+            q_full = self._embed_queries(unique)
+        except Exception:
+            if self._index.lexical is None:
+                raise
+            logger.warning('Эмбеддинги запросов не получены, используется только BM25', exc_info=True)
+            by_query = {q: [self._result(*hit) for hit in self._lexical_only(q, k, mask=mask)] for q in unique}
+            return [list(by_query[q]) for q in cleaned]
+
+        q_mat = self._project(q_full)
+        depth = self._depth(k)
+        shortlist = self._shortlist(depth)
+        n = int(self._index.vectors.shape[0])
+        found: List[tuple[np.ndarray, np.ndarray]] = []
+        if n == 0:
+            found = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in unique]
+        elif self._index.ann is not None and not exact and rows is None and n >= RAG_ANN_MIN_ROWS:
+            # IVF просматривает свои списки для каждого запроса отдельно
+            found = [self._search(q_vec, shortlist) for q_vec in q_mat]
+        else:
+            for start in range(0, len(unique), QUERY_BLOCK_ROWS):
+                top_idx, top_scores = self._search_many(
+                    q_mat[start: start + QUERY_BLOCK_ROWS], shortlist, exact=exact, rows=rows
+                )
+                found.extend(zip(top_idx, top_scores))
+
+        dense: List[List[tuple[int, float]]] = []
+        for (top_idx, top_scores), q_vec in zip(found, q_full):
+            top_idx, top_scores = self._rescore_full(top_idx, top_scores, q_vec, depth)
+            dense.append(list(zip(top_idx.tolist(), top_scores.tolist())))
+
+        by_query = {
+            q: [self._result(*hit) for hit in self._finish(q, hits, k, q_vec, q_vec_full, mask=mask)]
+            for q, hits, q_vec, q_vec_full in zip(unique, dense, q_mat, q_full)
+        }
+        return [list(by_query[q]) for q in cleaned]
+
+    def build_context(
+        self,
+        query: str,
+        top_k: int = 6,
+        where: Mapping[str, Any] | None = None,
+        token_budget: int | None = RAG_CONTEXT_TOKEN_BUDGET,
+        mmr_lambda: float = RAG_MMR_LAMBDA,
+    ) -> RetrievedContext:
+        # один поиск на вопрос: кандидатов с запасом, MMR убирает почти-дубли, затем укладываем в бюджет токенов
+        k = int(top_k)
+        if k <= 0:
+            return RetrievedContext(hits=[], context='', tokens=0)
+
+        ranked, q_vec = self._rank(query, k * max(1, RAG_MMR_CANDIDATES), where=where)
+        if not ranked:
+            return RetrievedContext(hits=[], context='', tokens=0)
+
+        cand = np.asarray(self._index.vectors[np.array([i for i, _, _ in ranked])], dtype=np.float32)
+        if q_vec is not None:
+            relevance = cand @ q_vec
+            if self.hybrid:
+                # порядок задаёт RRF, но в шкале косинуса, чтобы штраф за сходство был соизмерим
+                fused = np.array([r for _, _, r in ranked], dtype=np.float32)
+                span = float(fused.max() - fused.min()) or 1.0
+                relevance = relevance.min() + (fused - fused.min()) / span * (relevance.max() - relevance.min())
+        else:
+            # ответ только по BM25: релевантность по рангу
+            relevance = (1.0 - np.arange(len(ranked)) / len(ranked)).astype(np.float32)
+
+        sep_tokens = estimate_tokens(CONTEXT_SEPARATOR, RAG_CHARS_PER_TOKEN)
+        hits: List[RetrievalResult] = []
+        parts: List[str] = []
+        used = 0
+        for j in mmr_order(cand, relevance, lam=mmr_lambda):
+            if len(hits) >= k:
+                break
+
+            hit = self._result(*ranked[j])
+            part = f'[chunk_id={hit.chunk_id}]\n{hit.text}'.strip()
+            cost = estimate_tokens(part, RAG_CHARS_PER_TOKEN) + (sep_tokens if parts else 0)
+            if token_budget is not None and used + cost > token_budget:
+                if parts:
+                    continue
+                # даже первый chunk не влезает: обрезаем, чтобы контекст не остался пустым
+                part = part[: int(token_budget * RAG_CHARS_PER_TOKEN)]
+                cost = estimate_tokens(part, RAG_CHARS_PER_TOKEN)
 
-    def retrieve_context(self, query: str, top_k: int = 6) -> str:
-        hits = self.retrieve(query, top_k=top_k)
-        if not hits:
-            return ''
+            hits.append(hit)
+            parts.append(part)
+            used += cost
 
-        parts: list[str] = []
-        for h in hits:
-            parts.append(f'[chunk_id={h.chunk_id}]\n{h.text}'.strip())
+        return RetrievedContext(hits=hits, context=CONTEXT_SEPARATOR.join(parts), tokens=used)
 
-        return '\n\n---\n\n'.join(parts)
+    def retrieve_context(self, query: str, top_k: int = 6, where: Mapping[str, Any] | None = None) -> str:
+        return self.build_context(query, top_k=top_k, where=where).context
@@ -1,13 +1,128 @@
 from __future__ import annotations
-from rag.config import RAG_INDEX_DIR
-from rag.embeddings import EmbeddingsClient
-from rag.kb_index_store import get_or_build_kb_index
+import logging
+import threading
+from typing import Callable
+from rag.config import (
+    RAG_INDEX_DIR,
+    RAG_INDEX_POLL_SECONDS,
+    RAG_QUERY_CACHE_PATH,
+    RAG_QUERY_CACHE_SIZE,
+    RAG_QUERY_CACHE_TTL,
+)
+from rag.embeddings import EmbeddingBackend, create_embedder
+from rag.kb_index_store import get_or_build_kb_index, kb_index_signature, load_kb_index
+from rag.query_cache import QueryEmbeddingCache
 from rag.retriever import Retriever
 
+logger = logging.getLogger(__name__)
 
-def get_retriever() -> Retriever:
-    embedder = EmbeddingsClient()
-    index = get_or_build_kb_index(RAG_INDEX_DIR, embedder=embedder)
-    return Retriever(index=index, embedder=embedder)
 
+class RetrieverRegistry:
+    # Один Retriever на процесс: индекс и клиент эмбеддингов создаются лениво при первом запросе,
+    # фоновый поток следит за папкой индекса и подменяет Retriever целиком, когда появилась новая версия.
+    # Читатели берут ссылку без блокировки: присваивание атрибута атомарно.
+    def __init__(
+        self,
+        index_dir: str = RAG_INDEX_DIR,
+        embedder_factory: Callable[[], EmbeddingBackend] | None = None,
+        poll_interval: float = RAG_INDEX_POLL_SECONDS,
+    ) -> None:
+        self.index_dir = index_dir
+        self.poll_interval = poll_interval
+        # по умолчанию локальная модель берётся из опубликованной версии индекса
+        self._embedder_factory = embedder_factory or (lambda: create_embedder(index_dir=index_dir))
+        self._embedder: EmbeddingBackend | None = None
+        self._retriever: Retriever | None = None
+        self._signature: tuple | None = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: threading.Thread | None = None
+        # общий для всех версий Retriever: ключ включает модель, поэтому после смены модели кэш не путается
+        self.query_cache: QueryEmbeddingCache | None = None
+        if RAG_QUERY_CACHE_SIZE > 0:
+            self.query_cache = QueryEmbeddingCache(
+                max_size=RAG_QUERY_CACHE_SIZE,
+                ttl_seconds=RAG_QUERY_CACHE_TTL,
+                path=RAG_QUERY_CACHE_PATH,
+            )
+
+    def get(self) -> Retriever:
+        retriever = self._retriever
+        if retriever is not None:
+            return retriever
+
+        with self._lock:
+            if self._retriever is None:
+                embedder = self._get_embedder()
+                index = get_or_build_kb_index(self.index_dir, embedder=embedder)
+                self._signature = kb_index_signature(self.index_dir)
+                self._retriever = Retriever(index=index, embedder=embedder, query_cache=self.query_cache)
+                self._start_watcher()
+            return self._retriever
+
+    @property
+    def version(self) -> tuple | None:
+        # id опубликованной версии индекса (или подпись файлов старой раскладки); меняется при каждой перезагрузке
+        return self._signature
+
+    def _get_embedder(self) -> EmbeddingBackend:
+        if self._embedder is None:
+            self._embedder = self._embedder_factory()
+        return self._embedder
+
+    def reload(self, force: bool = False) -> bool:
+        signature = kb_index_signature(self.index_dir)
+        if signature is None or (not force and signature == self._signature):
+            return False
+
+        # новый индекс грузим вне блокировки чтения: старый Retriever продолжает отвечать
+        index = load_kb_index(self.index_dir)
+        embedder = self._get_embedder()
+        if index.model != embedder.model:
+            # индекс пересобран другой моделью (например, переобученной локальной): берём клиента заново
+            embedder = self._embedder_factory()
+        with self._lock:
+            self._embedder = embedder
+            retriever = Retriever(index=index, embedder=embedder, query_cache=self.query_cache)
+            self._retriever = retriever
+            self._signature = signature
+
+        logger.info('Индекс базы знаний перезагружен: %s (chunks=%d)', self.index_dir, len(index.items))
+        return True
+
+    def _start_watcher(self) -> None:
+        if self.poll_interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name='rag-index-watcher', daemon=True)
+        self._watcher.start()
 
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception:
+                # полузаписанный или битый индекс: оставляем текущий и пробуем на следующем тике
+                logger.exception('Не удалось перезагрузить индекс базы знаний')
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.poll_interval + 1)
+            self._watcher = None
+
+
+_registry: RetrieverRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> RetrieverRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = RetrieverRegistry()
+    return _registry
+
+
+def get_retriever() -> Retriever:
+    return get_registry().get()
@@ -0,0 +1,162 @@
+from __future__ import annotations
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Sequence, TypeVar
+import numpy as np
+
+T = TypeVar('T')
+
+# Матрица векторов, разрезанная по строкам на шарды: shards/vectors-000.npy, ... + shards.json.
+# Каждый шард - отдельный файл, открывается через mmap независимо от остальных. Поиск идёт по шардам
+# параллельно в потоках (матричное умножение в NumPy отпускает GIL), top-k шардов сливаются.
+SHARDS_DIR = 'shards'
+SHARDS_META = 'shards.json'
+
+_executors: dict[int, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def _executor(workers: int) -> ThreadPoolExecutor:
+    # один пул на число потоков на процесс: перезагрузка индекса не плодит потоки
+    with _executors_lock:
+        pool = _executors.get(workers)
+        if pool is None:
+            pool = _executors[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rag-shard')
+        return pool
+
+
+def _shard_name(i: int) -> str:
+    return os.path.join(SHARDS_DIR, f'vectors-{i:03d}.npy')
+
+
+class ShardedMatrix:
+    # Для остального кода ведёт себя как (n, dim) float32 матрица: shape, индексация строками,
+    # итерация, `@` и np.asarray; точный top-k - через topk без сборки полной матрицы очков.
+    def __init__(self, shards: Sequence[np.ndarray], max_workers: int | None = None) -> None:
+        if not shards:
+            raise ValueError('Нужен хотя бы один шард')
+        dims = {int(s.shape[1]) for s in shards}
+        if len(dims) != 1:
+            raise ValueError(f'Шарды разной размерности: {sorted(dims)}')
+
+        self.shards = list(shards)
+        self.offsets = np.cumsum([0, *(int(s.shape[0]) for s in self.shards)]).astype(np.int64)
+        self.max_workers = max(1, min(len(self.shards), max_workers or os.cpu_count() or 1))
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return int(self.offsets[-1]), int(self.shards[0].shape[1])
+
+    @property
+    def ndim(self) -> int:
+        return 2
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.shards[0].dtype
+
+    @property
+    def nbytes(self) -> int:
+        return sum(int(s.nbytes) for s in self.shards)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for shard in self.shards:
+            yield from shard
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        out = np.concatenate(self.shards)
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+    def _map(self, fn: Callable[[int], T]) -> List[T]:
+        if self.max_workers == 1:
+            return [fn(s) for s in range(len(self.shards))]
+        return list(_executor(self.max_workers).map(fn, range(len(self.shards))))
+
+    def __getitem__(self, key):
+        n = self.shape[0]
+        if isinstance(key, (int, np.integer)):
+            i = int(key) + n if key < 0 else int(key)
+            if not 0 <= i < n:
+                raise IndexError(key)
+            s = int(np.searchsorted(self.offsets, i, side='right')) - 1
+            return self.shards[s][i - self.offsets[s]]
+        if isinstance(key, slice):
+            key = np.arange(*key.indices(n))
+
+        # строки из разных шардов: группируем по шарду, порядок и форма индексов сохраняются
+        rows = np.asarray(key, dtype=np.int64)
+        flat = rows.ravel()
+        out = np.empty((flat.shape[0], self.shape[1]), dtype=self.dtype)
+        shard_ids = np.searchsorted(self.offsets, flat, side='right') - 1
+        for s in np.unique(shard_ids):
+            sel = shard_ids == s
+            out[sel] = self.shards[s][flat[sel] - self.offsets[s]]
+        return out.reshape(*rows.shape, self.shape[1])
+
+    def __matmul__(self, other: np.ndarray) -> np.ndarray:
+        parts = self._map(lambda s: np.asarray(self.shards[s] @ other))
+        return np.concatenate(parts)
+
+    def topk(self, q_mat: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        # (m, dim) запросов -> (m, k) номеров строк и очков, по убыванию
+        def shard_top(s: int) -> tuple[np.ndarray, np.ndarray]:
+            shard = self.shards[s]
+            k_eff = min(k, int(shard.shape[0]))
+            if k_eff == 0:
+                return np.empty((q_mat.shape[0], 0), dtype=np.int64), np.empty((q_mat.shape[0], 0), dtype=np.float32)
+            scores = np.asarray(q_mat @ shard.T)
+            top = np.argpartition(-scores, kth=k_eff - 1, axis=1)[:, :k_eff]
+            return top + self.offsets[s], np.take_along_axis(scores, top, axis=1)
+
+        parts = self._map(shard_top)
+        idx = np.concatenate([p[0] for p in parts], axis=1)
+        scores = np.concatenate([p[1] for p in parts], axis=1)
+
+        k_eff = min(k, int(idx.shape[1]))
+        if k_eff == 0:
+            return idx, scores
+        top = np.argpartition(-scores, kth=k_eff - 1, axis=1)[:, :k_eff]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(np.take_along_axis(idx, top, axis=1), order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def save(self, dir_path: str) -> None:
+        # как и в mmap-формате: временный файл + os.replace, открытые через mmap старые шарды не ломаются
+        os.makedirs(os.path.join(dir_path, SHARDS_DIR), exist_ok=True)
+        for i, shard in enumerate(self.shards):
+            path = os.path.join(dir_path, _shard_name(i))
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, np.ascontiguousarray(shard, dtype=np.float32))
+            os.replace(path + '.tmp', path)
+
+        meta = {'rows': [int(s.shape[0]) for s in self.shards], 'dim': self.shape[1]}
+        tmp = os.path.join(dir_path, f'.{SHARDS_META}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(dir_path, SHARDS_META))
+
+    @classmethod
+    def load(cls, dir_path: str, max_workers: int | None = None) -> ShardedMatrix:
+        with open(os.path.join(dir_path, SHARDS_META), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        shards = []
+        for i, rows in enumerate(meta['rows']):
+            shard = np.load(os.path.join(dir_path, _shard_name(i)), mmap_mode='r')
+            if shard.ndim != 2 or shard.shape != (rows, meta['dim']):
+                raise ValueError(f'Шард {i} не согласован с {SHARDS_META}: {dir_path}')
+            shards.append(shard)
+        return cls(shards, max_workers=max_workers)
+
+
+def shard_matrix(vectors: np.ndarray, n_shards: int, max_workers: int | None = None) -> ShardedMatrix:
+    # шарды примерно равного размера; пустых шардов не делаем
+    n = int(vectors.shape[0])
+    n_shards = max(1, min(int(n_shards), n or 1))
+    bounds = np.linspace(0, n, n_shards + 1).astype(np.int64)
+    return ShardedMatrix([vectors[bounds[i]: bounds[i + 1]] for i in range(n_shards)], max_workers=max_workers)
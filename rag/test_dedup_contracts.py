@@ -0,0 +1,34 @@
+from __future__ import annotations
+from rag.dedup import collapse_near_duplicates, near_duplicate_groups
+
+
+def test_near_duplicate_clusters() -> None:
+    words = [f'термин{i:03d}x' for i in range(140)]
+    a = ' '.join(words[0:100])
+    b = ' '.join(words[10:110])
+    c = ' '.join(words[20:120])
+    # a~b и b~c, но a и c не похожи: кластер не должен склеить их через b
+    texts = [a, b, c, a + ' дополнение', ' '.join(words[120:140])]
+
+    groups = [sorted(g) for g in near_duplicate_groups(texts, threshold=0.74)]
+    assert not any(0 in g and 2 in g for g in groups), groups
+    assert any({0, 1, 3} <= set(g) for g in groups), groups
+    assert not any(4 in g for g in groups), groups
+
+    items = [
+        {'chunk_id': f'c{i}', 'text': t, 'metadata': {'topic': 'law_44fz' if i % 2 else 'law_223fz'}}
+        for i, t in enumerate(texts)
+    ]
+    report = collapse_near_duplicates(items, texts, threshold=0.74)
+    kept = {it['chunk_id']: it for it in report.items}
+    # представитель кластера - самый длинный chunk, metadata дубликатов объединена
+    assert 'c3' in kept and 'c0' not in kept and 'c1' not in kept, sorted(kept)
+    assert 'c2' in kept and 'c4' in kept
+    assert sorted(kept['c3']['duplicates']) == ['c0', 'c1']
+    assert sorted(kept['c3']['metadata']['topic']) == ['law_223fz', 'law_44fz']
+    assert report.dropped == 2
+    print('OK: кластеры почти дубликатов', groups)
+
+
+if __name__ == '__main__':
+    test_near_duplicate_clusters()
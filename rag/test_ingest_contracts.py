@@ -0,0 +1,98 @@
+from __future__ import annotations
+import hashlib
+import os
+import tempfile
+from typing import Any, Dict, List
+import numpy as np
+from rag.ingest import ingest_documents, ingest_pending, ingested_fingerprint, load_ingested
+
+# Контракты без сети: вместо модели эмбеддингов - детерминированные векторы из sha256 текста.
+
+
+class HashEmbedder:
+    model = 'hash-64'
+
+    def __init__(self, fail_after: int | None = None) -> None:
+        # fail_after - после стольких батчей embed_texts падает (имитация обрыва загрузки)
+        self.fail_after = fail_after
+        self.batches = 0
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        if self.fail_after is not None and self.batches >= self.fail_after:
+            raise RuntimeError('обрыв загрузки')
+        self.batches += 1
+        out = []
+        for t in texts:
+            raw = np.frombuffer(hashlib.sha256(t.encode('utf-8')).digest() * 2, dtype=np.uint8)
+            out.append((raw.astype(np.float32) - 127.5).tolist())
+        return out
+
+    def embed_query(self, query: str) -> List[float]:
+        return self.embed_texts([query])[0]
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        return self.embed_texts(queries)
+
+
+def write_docs(src_dir: str) -> None:
+    os.makedirs(os.path.join(src_dir, 'fz44'), exist_ok=True)
+    for d in range(4):
+        sentences = [f'Документ {d}, пункт {i}: заказчик размещает извещение номер {d * 100 + i}.' for i in range(40)]
+        # повтор абзаца в другом документе - дубликат, его chunk не должен попасть в индекс дважды
+        sentences += ['Общие положения одинаковы для всех документов и повторяются дословно.'] * 3
+        name = os.path.join('fz44', f'doc{d}.md') if d % 2 else f'doc{d}.txt'
+        with open(os.path.join(src_dir, name), 'w', encoding='utf-8') as f:
+            f.write('\n\n'.join(sentences))
+
+
+def _ingested(work_dir: str) -> tuple[List[Dict[str, Any]], np.ndarray]:
+    chunks = load_ingested(work_dir, model=HashEmbedder.model)
+    assert chunks is not None, work_dir
+    return list(chunks.items), np.array(chunks.vectors)
+
+
+def test_ingest_resume_after_crash() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, 'docs')
+        write_docs(src)
+
+        clean = os.path.join(tmp, 'clean')
+        clean_embedder = HashEmbedder()
+        ingest_documents(src, clean, clean_embedder, batch_size=4, size=200, overlap=40)
+
+        work = os.path.join(tmp, 'work')
+        try:
+            ingest_documents(src, work, HashEmbedder(fail_after=3), batch_size=4, size=200, overlap=40)
+            raise AssertionError('загрузка должна была оборваться')
+        except RuntimeError:
+            pass
+        assert ingest_pending(work, model=HashEmbedder.model)
+        assert load_ingested(work, model=HashEmbedder.model) is None
+        assert ingested_fingerprint(work, model=HashEmbedder.model) is None
+
+        # недописанный батч после контрольной точки: перезапуск должен его обрезать
+        with open(os.path.join(work, 'items.jsonl'), 'ab') as f:
+            f.write(b'{"chunk_id": "doc_obryv", "te')
+        with open(os.path.join(work, 'vectors.f32'), 'ab') as f:
+            f.write(b'\0' * 100)
+
+        embedder = HashEmbedder()
+        ingest_documents(src, work, embedder, batch_size=4, size=200, overlap=40)
+        assert not ingest_pending(work, model=HashEmbedder.model)
+
+        items, vectors = _ingested(work)
+        clean_items, clean_vectors = _ingested(clean)
+        assert items == clean_items, 'chunks после перезапуска отличаются от загрузки без обрыва'
+        assert np.array_equal(vectors, clean_vectors)
+        assert len({it['chunk_id'] for it in items}) == len(items)
+        # fingerprint из state.json совпадает с посчитанным по keys.bin при загрузке
+        fingerprint = ingested_fingerprint(work, model=HashEmbedder.model)
+        assert fingerprint == load_ingested(work, model=HashEmbedder.model).fingerprint
+        assert fingerprint == load_ingested(clean, model=HashEmbedder.model).fingerprint
+        # до обрыва было посчитано 3 батча - второй запуск их заново не считает
+        assert embedder.batches <= clean_embedder.batches - 3, (embedder.batches, clean_embedder.batches)
+        print('OK: загрузка документов после обрыва, chunks =', len(items))
+
+
+if __name__ == '__main__':
+    test_ingest_resume_after_crash()
@@ -0,0 +1,34 @@
+from __future__ import annotations
+import os
+import tempfile
+import numpy as np
+from rag.index import VectorIndex, build_vector_index
+from rag.projection import fit_projection
+from rag.retriever import Retriever
+from rag.test_ingest_contracts import HashEmbedder
+from rag.test_shards_contracts import assert_same_hits, corpus, mmap_retriever
+
+
+def test_projected_matches_mmap() -> None:
+    items, vectors = corpus()
+    with tempfile.TemporaryDirectory() as tmp:
+        base = mmap_retriever(tmp, items, vectors)
+        for kind, dim in (('truncate', 32), ('pca', 16)):
+            for fmt in ('mmap', 'sharded'):
+                index = build_vector_index(items, vectors, HashEmbedder.model)
+                full = np.asarray(index.vectors)
+                index.projection = fit_projection(full, kind, dim)
+                index.vectors = index.projection.apply(full)
+                index.full_vectors = full
+                path = os.path.join(tmp, f'{kind}-{fmt}')
+                index.save(path, fmt=fmt, n_shards=3)
+
+                loaded = VectorIndex.load(path)
+                assert loaded.vectors.shape == (len(items), dim) and loaded.full_vectors is not None
+                # shortlist на весь корпус: после пересчёта по исходным векторам порядок точный
+                retriever = Retriever(loaded, HashEmbedder(), rescore_factor=len(items), hybrid=False)
+                assert_same_hits(f'проекция {kind}({dim}), {fmt}', base, retriever)
+
+
+if __name__ == '__main__':
+    test_projected_matches_mmap()
@@ -0,0 +1,50 @@
+from __future__ import annotations
+import os
+import tempfile
+from typing import Any, Dict, List
+import numpy as np
+from rag.index import VectorIndex, build_vector_index
+from rag.retriever import Retriever
+from rag.test_ingest_contracts import HashEmbedder
+
+QUERIES: List[str] = ['chunk 7', 'заказчик', 'ставка НДС 20%']
+FILTERS: List[Dict[str, Any] | None] = [None, {'topic': 'law_44fz'}]
+
+
+def corpus(n: int = 300) -> tuple[List[Dict[str, Any]], List[List[float]]]:
+    items = [
+        {'chunk_id': f'c{i}', 'text': f'chunk {i}', 'metadata': {'topic': ('law_44fz', 'law_223fz', 'taxes')[i % 3]}}
+        for i in range(n)
+    ]
+    return items, HashEmbedder().embed_texts([it['text'] for it in items])
+
+
+def mmap_retriever(tmp: str, items: List[Dict[str, Any]], vectors: List[List[float]]) -> Retriever:
+    build_vector_index(items, vectors, HashEmbedder.model).save(os.path.join(tmp, 'mmap'), fmt='mmap')
+    return Retriever(VectorIndex.load(os.path.join(tmp, 'mmap')), HashEmbedder(), hybrid=False)
+
+
+def assert_same_hits(name: str, base: Retriever, retriever: Retriever) -> None:
+    for q in QUERIES:
+        for where in FILTERS:
+            expected = [(r.chunk_id, r.score) for r in base.retrieve(q, top_k=10, where=where)]
+            got = [(r.chunk_id, r.score) for r in retriever.retrieve(q, top_k=10, where=where)]
+            assert [c for c, _ in got] == [c for c, _ in expected], f'{name}, {q!r}, {where}: {got[:3]} != {expected[:3]}'
+            assert np.allclose([s for _, s in got], [s for _, s in expected], atol=1e-5), (name, q, where)
+    print('OK: поиск совпадает с mmap-индексом,', name)
+
+
+def test_sharded_matches_mmap() -> None:
+    items, vectors = corpus()
+    with tempfile.TemporaryDirectory() as tmp:
+        base = mmap_retriever(tmp, items, vectors)
+        for n_shards in (1, 3, 7):
+            path = os.path.join(tmp, f'sharded{n_shards}')
+            build_vector_index(items, vectors, HashEmbedder.model).save(path, fmt='sharded', n_shards=n_shards)
+            index = VectorIndex.load(path)
+            assert len(index.vectors.shards) == n_shards
+            assert_same_hits(f'шарды={n_shards}', base, Retriever(index, HashEmbedder(), hybrid=False))
+
+
+if __name__ == '__main__':
+    test_sharded_matches_mmap()